@@ -1,3 +1,4 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,12 +10,34 @@ class Settings(BaseSettings):
     api_prefix: str = "/api/v1"
     cors_origins: list[str] = ["*"]
     
-    # Database settings (for future use)
-    database_url: str | None = None
-    database_type: str = "memory"  # memory, file, postgresql
+    # Database settings
+    database_url: str | None = None  # SQLite file path for sqlite; state server socket path for shared
+    database_type: str = "memory"  # memory, sqlite, shared
+    storage_threads: int = 8  # thread pool size for blocking storage calls from async routes
+    user_flush_interval_ms: int = 250  # write-behind streak visits: max delay before a group commit; 0 disables
+    user_flush_max_records: int = 1000  # ...or flush as soon as this many users are pending
+    id_state_file: str | None = None  # ID high-water marks; defaults to app/db/data/ids.json unless memory
+    storage_codec: str = "json"  # on-disk format of data file snapshots: json, binary, msgpack
+    memory_data_dir: str | None = None  # memory backend: keep a snapshot and write-ahead log here to survive restarts
+    wal_fsync: str = "everysec"  # always, everysec, no
+    snapshot_wal_bytes: int = Field(default=64 * 1024 * 1024, gt=0)  # snapshot once this much log would be replayed
+    snapshot_interval_seconds: float = 300  # ...or this long after the last snapshot if anything was written
+    
+    # Background jobs
+    fish_decay_enabled: bool = True  # run the daily fish decay pass over all users
+    decay_state_file: str | None = None  # last processed day; defaults to app/db/data/decay.json, or decay.json in memory_data_dir
+    
+    # Push events
+    event_queue_size: int = Field(default=100, ge=1)  # events buffered per open stream before it must resync
+    event_keepalive_seconds: float = 15  # comment sent on idle streams so proxies keep them open
+    
+    # Metrics
+    metrics_enabled: bool = True  # record request/storage metrics and serve them at /metrics
     
     # Logging settings
     log_level: str = "INFO"
+    log_format: str = "text"  # text, json
+    log_sample_rate: float = Field(default=1.0, gt=0, le=1)  # share of records below WARNING that are kept
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,154 @@
+"""Pub/sub for pushing state changes to connected clients.
+
+Services publish events such as ``fish.fed`` for a user; every open event
+stream of that user gets a copy in its own bounded queue. Publishing never
+waits on a subscriber: when a client stops reading and its queue fills up,
+the queued events are dropped and replaced by a single ``resync`` event,
+telling the client to refetch its state. Memory per connection therefore
+stays bounded however slow the client is, and publishing for a user with
+no open streams is one dict lookup.
+
+Events may be published from worker threads (the daily decay job runs in
+one); they are handed to the subscriber's event loop thread-safely.
+
+The bus itself only reaches streams in its own process. With a ``relay``
+set (see ``EventRelay`` in ``app/db/shared.py``) publishes go to the relay
+instead, which delivers them to the bus of every worker that has a stream
+open for the user, this one included.
+"""
+
+import asyncio
+import itertools
+import threading
+from .config import settings
+from .metrics import metrics
+
+RESYNC = "resync"
+
+
+class Event:
+    """One event for one user"""
+
+    __slots__ = ("id", "type", "user_id", "data")
+
+    def __init__(self, event_id: int, event_type: str, user_id: int, data: dict):
+        self.id = event_id
+        self.type = event_type
+        self.user_id = user_id
+        self.data = data
+
+
+class Subscription:
+    """One client's stream of events, fed by the bus"""
+
+    def __init__(self, bus: "EventBus", user_id: int, max_queue: int):
+        self.bus = bus
+        self.user_id = user_id
+        self.dropped = 0
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(max_queue)
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.get_ident()
+
+    def offer(self, event: Event):
+        """Queue an event without ever blocking the publisher"""
+        if threading.get_ident() == self._thread:
+            self._offer(event)
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:  # its loop has closed; the stream is gone
+            self.close()
+
+    def _offer(self, event: Event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client fell behind: drop what it has not read and have it refetch
+            dropped = self._queue.qsize() + 1
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self.dropped += dropped
+            self.bus.dropped += dropped
+            self._queue.put_nowait(Event(event.id, RESYNC, self.user_id, {}))
+
+    async def get(self, timeout: float | None = None) -> Event | None:
+        """Wait for the next event; None if timeout passes first"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Routes published events to the subscriptions of their user"""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self.published = 0
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._subscribers: dict[int, set[Subscription]] = {}
+        # Carries publishes to every worker process when set
+        self.relay = None
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Open a subscription to a user's events; call from the event loop"""
+        subscription = Subscription(self, user_id, self.max_queue)
+        subscribers = self._subscribers.setdefault(user_id, set())
+        subscribers.add(subscription)
+        if self.relay is not None and len(subscribers) == 1:
+            self.relay.watch(user_id)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.user_id, None)
+                if self.relay is not None:
+                    self.relay.unwatch(subscription.user_id)
+
+    def publish(self, user_id: int, event_type: str, data: dict):
+        """Send an event to every open stream of a user, in every worker when relayed"""
+        if self.relay is not None:
+            self.relay.publish(user_id, event_type, data)
+        else:
+            self.deliver(user_id, event_type, data)
+
+    def deliver(self, user_id: int, event_type: str, data: dict):
+        """Send an event to the user's open streams in this process"""
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        event = Event(next(self._ids), event_type, user_id, data)
+        self.published += 1
+        for subscription in list(subscribers):
+            subscription.offer(event)
+
+    def subscriber_count(self) -> int:
+        return sum(map(len, list(self._subscribers.values())))
+
+    def watched_users(self) -> list[int]:
+        """Users with at least one open stream in this process"""
+        return list(self._subscribers)
+
+
+def _event_metrics():
+    yield "# HELP event_subscribers Open event streams"
+    yield "# TYPE event_subscribers gauge"
+    yield f"event_subscribers {event_bus.subscriber_count()}"
+    yield "# HELP events_published_total Events published to at least one stream"
+    yield "# TYPE events_published_total counter"
+    yield f"events_published_total {event_bus.published}"
+    yield "# HELP events_dropped_total Events dropped because a stream fell behind"
+    yield "# TYPE events_dropped_total counter"
+    yield f"events_dropped_total {event_bus.dropped}"
+
+
+# Global instance
+event_bus = EventBus(settings.event_queue_size)
+metrics.register_collector(_event_metrics)
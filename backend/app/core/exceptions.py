@@ -27,3 +27,7 @@ class AchievementNotFoundError(DopamineHunterException):
 class InvalidOperationError(DopamineHunterException):
     """Raised when an invalid operation is attempted"""
     pass
+
+class CorruptDataFileError(DopamineHunterException):
+    """Raised when a data file and its backup are both unreadable"""
+    pass
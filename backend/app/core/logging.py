@@ -1,31 +1,120 @@
 """Logging configuration for the Dopamine Hunter application"""
 
+import atexit
+import itertools
+import json
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from .config import settings
 
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes every WARNING and above, but only 1 in ``every`` records below that"""
+
+    def __init__(self, every: int = 1):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.every == 1:
+            return True
+        # next() on itertools.count is atomic under the GIL
+        return next(self._counter) % self.every == 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueues records unformatted, so %-style arguments are only rendered
+    on the listener thread. Arguments must not be mutated after logging."""
+
+    # The listener thread running the real handlers for this queue
+    listener: QueueListener | None = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _installed_handlers() -> list[QueueHandler]:
+    """The queue handlers setup_logging put on the root logger.
+
+    Matched by class name, since reloading this module defines a new
+    DeferredQueueHandler class that the old handlers are no instances of.
+    """
+    return [
+        handler for handler in logging.getLogger().handlers
+        if type(handler).__name__ == DeferredQueueHandler.__name__
+    ]
+
+
+def _stop_listener():
+    for handler in _installed_handlers():
+        if handler.listener is not None:
+            handler.listener.stop()
+            handler.listener = None
+
+
 def setup_logging():
-    """Setup application logging configuration"""
-    
+    """Setup application logging configuration.
+
+    Callers log into a queue and a background thread does the formatting and
+    writing, so request handlers never block on stdout. Safe to call again,
+    and to reload this module: the queue handler already on the root logger
+    and its listener are replaced rather than duplicated.
+    """
+    level = getattr(logging, settings.log_level.upper())
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
-    # Setup console handler
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+
+    # Setup console handler, run by the listener thread
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    
+
     # Setup root logger
     root_logger = logging.getLogger()
-    root_logger.setLevel(getattr(logging, settings.log_level.upper()))
-    root_logger.addHandler(console_handler)
-    
+    root_logger.setLevel(level)
+    _stop_listener()
+    for handler in _installed_handlers():
+        root_logger.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(round(1 / settings.log_sample_rate)))
+    queue_handler.listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+    queue_handler.listener.start()
+    root_logger.addHandler(queue_handler)
+
     # Setup application logger
     app_logger = logging.getLogger("dopamine_hunter")
-    app_logger.setLevel(getattr(logging, settings.log_level.upper()))
-    
+    app_logger.setLevel(level)
+
     return app_logger
 
+
+# Flush queued records on interpreter exit
+atexit.register(_stop_listener)
+
 # Initialize logging
 logger = setup_logging()
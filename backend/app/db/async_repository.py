@@ -0,0 +1,231 @@
+"""Awaitable access to the repository for async routes.
+
+Each method mirrors the ``Repository`` method of the same name. Calls to a
+blocking backend run in a bounded thread pool, so a slow disk or database
+stalls only the requests waiting on it, never the event loop. Non-blocking
+backends (the in-memory one) are called inline, which costs nothing extra.
+
+High-frequency user updates (streak visits on every page view) can be saved
+write-behind with ``save_user_later``: the change is visible to every read
+through this object at once, and dirty users are coalesced and written in one
+group commit every ``flush_interval_ms`` or once ``flush_max_records`` are
+pending, whichever comes first. Those two settings bound what a crash can
+lose.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from ..core.config import settings
+from ..core.logging import logger
+from ..models import User, Task, Fish, Achievement, UserCounters
+from .repository import Repository, repository, _USER_CHILDREN
+
+
+class AsyncRepository:
+    """Async wrapper running a Repository's blocking calls in a thread pool"""
+
+    def __init__(self, repository: Repository, max_workers: int = 8,
+                 flush_interval_ms: int = 250, flush_max_records: int = 1000):
+        self.repository = repository
+        self.max_workers = max_workers
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_records = flush_max_records
+        self._executor: ThreadPoolExecutor | None = None
+        # Write-behind users: waiting for the next flush, and being written by it
+        self._dirty_users: dict[int, User] = {}
+        self._flushing_users: dict[int, User] = {}
+        self._flush_wanted: asyncio.Event | None = None
+        # Held while a flush writes, so a direct save can wait it out
+        self._flush_lock = asyncio.Lock()
+        self._flusher_running = False
+
+    async def _call(self, method, *args, **kwargs):
+        if not self.repository.blocking:
+            return method(*args, **kwargs)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="repository")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+    def shutdown(self):
+        """Stop the thread pool after its queued calls finish"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    # Write-behind users
+    def pending_user(self, user_id: int) -> User | None:
+        """A copy of the newest not-yet-written version of a user, if any, without children.
+
+        Queued users keep the version they had when read; the one they will
+        be stored at, which is what readers see, is the next.
+        """
+        pending = self._dirty_users.get(user_id) or self._flushing_users.get(user_id)
+        if pending is None:
+            return None
+        return pending.model_copy(update={"version": pending.version + 1})
+
+    def _with_pending(self, user: User | None) -> User | None:
+        """Overlay pending fields on a stored user; children come from storage"""
+        if user is None:
+            return None
+        pending = self._dirty_users.get(user.id) or self._flushing_users.get(user.id)
+        if pending is None:
+            return user
+        return pending.model_copy(update={
+            "version": pending.version + 1, **{name: getattr(user, name) for name in _USER_CHILDREN}
+        })
+
+    async def save_user_later(self, user: User) -> User:
+        """Save a user write-behind, coalescing with other pending saves.
+
+        Writes through at once when nothing would be gained (a non-blocking
+        backend or a zero interval), when the backend needs every write seen at
+        once, or when no flusher is running to write it later.
+        """
+        if (not self.repository.blocking or not self.repository.write_behind
+                or self.flush_interval_ms <= 0 or not self._flusher_running):
+            return await self.save_user(user)
+        # Queue a copy, so later changes to user cannot race the flush that
+        # serializes it; the save stamps the version, readers see it already
+        self._dirty_users[user.id] = user.model_copy(update={name: {} for name in _USER_CHILDREN})
+        user.version += 1
+        if len(self._dirty_users) >= self.flush_max_records:
+            self._flush_wanted.set()
+        return user
+
+    async def flush_users(self) -> int:
+        """Write every pending user in one group commit; return how many"""
+        async with self._flush_lock:
+            if not self._dirty_users:
+                return 0
+            self._flushing_users, self._dirty_users = self._dirty_users, {}
+            try:
+                await self._call(self.repository.save_users, list(self._flushing_users.values()))
+            except Exception:
+                # Put them back under any newer versions so the next flush retries
+                self._dirty_users = {**self._flushing_users, **self._dirty_users}
+                raise
+            finally:
+                count = len(self._flushing_users)
+                self._flushing_users = {}
+            return count
+
+    async def run_user_flusher(self):
+        """Flush pending users every interval or when enough are pending, until cancelled"""
+        self._flush_wanted = asyncio.Event()
+        self._flusher_running = True
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_wanted.wait(), self.flush_interval_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_wanted.clear()
+                try:
+                    await self.flush_users()
+                except Exception:
+                    logger.exception("Write-behind flush of users failed")
+        finally:
+            # Stop buffering and write out whatever is left
+            self._flusher_running = False
+            await self.flush_users()
+
+    # Users
+    async def get_user(self, user_id: int) -> User | None:
+        return self._with_pending(await self._call(self.repository.get_user, user_id))
+
+    async def has_user(self, user_id: int) -> bool:
+        return await self._call(self.repository.has_user, user_id)
+
+    async def get_user_without_children(self, user_id: int) -> User | None:
+        return self._with_pending(await self._call(self.repository.get_user_without_children, user_id))
+
+    async def get_user_by_username(self, username: str) -> User | None:
+        return self._with_pending(await self._call(self.repository.get_user_by_username, username))
+
+    async def list_users(self, after_id: int | None = None, limit: int | None = None,
+                         fields: set[str] | None = None) -> list[User]:
+        rows = await self._call(self.repository.list_users, after_id, limit, fields)
+        if self._dirty_users or self._flushing_users:
+            rows = [self._with_pending(user) for user in rows]
+        return rows
+
+    async def add_user(self, user: User) -> User:
+        return await self._call(self.repository.add_user, user)
+
+    async def save_user(self, user: User) -> User:
+        # A direct save supersedes any pending version of the user. Wait out a
+        # flush writing an older one first, so it cannot land on top of this
+        if user.id in self._flushing_users:
+            async with self._flush_lock:
+                pass
+        self._dirty_users.pop(user.id, None)
+        return await self._call(self.repository.save_user, user)
+
+    # Tasks
+    async def get_task(self, task_id: int) -> Task | None:
+        return await self._call(self.repository.get_task, task_id)
+
+    async def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]:
+        return await self._call(self.repository.list_tasks, user_id, after_id, limit)
+
+    async def add_task(self, task: Task) -> Task:
+        return await self._call(self.repository.add_task, task)
+
+    async def save_task(self, task: Task) -> Task:
+        return await self._call(self.repository.save_task, task)
+
+    async def add_tasks(self, tasks: list[Task]) -> list[Task]:
+        return await self._call(self.repository.add_tasks, tasks)
+
+    async def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        return await self._call(self.repository.save_tasks, tasks)
+
+    async def delete_task(self, task_id: int) -> bool:
+        return await self._call(self.repository.delete_task, task_id)
+
+    # Fishes
+    async def get_fish(self, fish_id: int) -> Fish | None:
+        return await self._call(self.repository.get_fish, fish_id)
+
+    async def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return await self._call(self.repository.list_fishes, user_id, after_id, limit)
+
+    async def add_fish(self, fish: Fish) -> Fish:
+        return await self._call(self.repository.add_fish, fish)
+
+    async def save_fish(self, fish: Fish) -> Fish:
+        return await self._call(self.repository.save_fish, fish)
+
+    async def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return await self._call(self.repository.scan_fishes, after_id, limit)
+
+    async def save_fishes(self, fishes: list[Fish]) -> list[Fish]:
+        return await self._call(self.repository.save_fishes, fishes)
+
+    # Achievements
+    async def get_achievement(self, achievement_id: int) -> Achievement | None:
+        return await self._call(self.repository.get_achievement, achievement_id)
+
+    async def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                                limit: int | None = None) -> list[Achievement]:
+        return await self._call(self.repository.list_achievements, user_id, after_id, limit)
+
+    async def add_achievement(self, achievement: Achievement) -> Achievement:
+        return await self._call(self.repository.add_achievement, achievement)
+
+    async def save_achievement(self, achievement: Achievement) -> Achievement:
+        return await self._call(self.repository.save_achievement, achievement)
+
+    # Counters
+    async def get_user_counters(self, user_id: int) -> UserCounters:
+        return await self._call(self.repository.get_user_counters, user_id)
+
+
+# Global instance used by the routes
+async_repository = AsyncRepository(
+    repository, settings.storage_threads,
+    flush_interval_ms=settings.user_flush_interval_ms, flush_max_records=settings.user_flush_max_records
+)
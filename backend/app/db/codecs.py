@@ -0,0 +1,323 @@
+"""On-disk codecs for table snapshots.
+
+Files written by a non-JSON codec start with a 6-byte header: the magic
+``DHDB``, a format version byte and the codec's ID byte, so a reader can tell
+the format from the file itself. Files without the magic are the original
+pretty-printed JSON lists and keep loading unchanged.
+"""
+
+import json
+import struct
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate, islice
+
+try:
+    import msgpack
+except ImportError:  # optional; the binary codec needs no dependencies
+    msgpack = None
+
+MAGIC = b"DHDB"
+FORMAT_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 2
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class Codec(ABC):
+    """Encodes a table snapshot (a list of row dicts) to bytes and back"""
+
+    name: str
+    codec_id: int
+    # Whether datetimes come back as datetime objects rather than strings
+    native_datetimes: bool = False
+
+    @abstractmethod
+    def encode(self, rows: list[dict]) -> bytes: ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> list[dict]: ...
+
+
+class JsonCodec(Codec):
+    """The original format: an indented JSON list, datetimes as strings, no header"""
+
+    name = "json"
+    codec_id = 0
+
+    def encode(self, rows: list[dict]) -> bytes:
+        return json.dumps(rows, indent=2, default=str).encode("utf-8")
+
+    def decode(self, data: bytes) -> list[dict]:
+        return json.loads(data)
+
+
+# Column kinds of the binary codec. Every column is a kind byte and a <I
+# value count, followed by the payload noted.
+_EMPTY = 0  # nothing
+_NONES = 1  # nothing
+_BOOLS = 2  # one byte per value
+_INTS = 3  # <q per value
+_FLOATS = 4  # <d per value
+_STRS = 5  # <I length in characters per value, then <I byte size + UTF-8 of them all joined
+_DATETIMES = 6  # <q microseconds since 1970-01-01 per value, naive
+_AWARE_DATETIMES = 7  # <q microseconds since 1970-01-01 UTC per value, then <i UTC offsets in seconds
+_BIGINTS = 8  # a string column of the decimal values
+_NULLABLE = 9  # one byte per value, 1 where present, then a column of the present values
+_RECORDS = 10  # a string column of keys, then one column per key
+_MAPS = 11  # <I entry count per value, then a column of all keys and one of all values
+_LISTS = 12  # <I item count per value, then a column of all items
+_MIXED = 13  # one single-value column per value
+
+_HEADER = struct.Struct("<BI")
+_U32 = struct.Struct("<I")
+_Q = struct.Struct("<q")
+_QI = struct.Struct("<qi")
+_INT64_MIN, _INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _pack_column(values, out: bytearray):
+    """Append values (a sequence) as one column"""
+    n = len(values)
+    kinds = set(map(type, values))
+    kind = kinds.pop() if len(kinds) == 1 else None
+
+    if n == 0:
+        out += _HEADER.pack(_EMPTY, 0)
+    elif kind is type(None):
+        out += _HEADER.pack(_NONES, n)
+    elif kind is bool:
+        out += _HEADER.pack(_BOOLS, n)
+        out += bytes(values)
+    elif kind is int:
+        if _INT64_MIN <= min(values) and max(values) <= _INT64_MAX:
+            out += _HEADER.pack(_INTS, n)
+            out += struct.pack(f"<{n}q", *values)
+        else:
+            out += _HEADER.pack(_BIGINTS, n)
+            _pack_column(list(map(str, values)), out)
+    elif kind is float:
+        out += _HEADER.pack(_FLOATS, n)
+        out += struct.pack(f"<{n}d", *values)
+    elif kind is not None and issubclass(kind, str):
+        # str.join and len see an str-Enum's value, not its name
+        raw = "".join(values).encode("utf-8")
+        out += _HEADER.pack(_STRS, n)
+        out += struct.pack(f"<{n}I", *map(len, values))
+        out += _U32.pack(len(raw))
+        out += raw
+    elif kind is datetime:
+        if all(value.tzinfo is None for value in values):
+            out += _HEADER.pack(_DATETIMES, n)
+            out += struct.pack(f"<{n}q", *[(value - _EPOCH) // _MICROSECOND for value in values])
+        elif all(value.tzinfo is not None for value in values):
+            out += _HEADER.pack(_AWARE_DATETIMES, n)
+            out += struct.pack(f"<{n}q", *[(value - _EPOCH_UTC) // _MICROSECOND for value in values])
+            out += struct.pack(f"<{n}i", *[int(value.utcoffset().total_seconds()) for value in values])
+        else:
+            _pack_mixed(values, out)
+    elif kind is dict:
+        shapes = set(map(tuple, values))
+        keys = shapes.pop() if len(shapes) == 1 else None
+        if keys is not None and all(type(key) is str for key in keys):
+            out += _HEADER.pack(_RECORDS, n)
+            _pack_column(keys, out)
+            for column in (zip(*[value.values() for value in values]) if keys else ()):
+                _pack_column(column, out)
+        else:
+            out += _HEADER.pack(_MAPS, n)
+            out += struct.pack(f"<{n}I", *map(len, values))
+            _pack_column([key for value in values for key in value], out)
+            _pack_column([item for value in values for item in value.values()], out)
+    elif kind is list or kind is tuple:
+        out += _HEADER.pack(_LISTS, n)
+        out += struct.pack(f"<{n}I", *map(len, values))
+        _pack_column([item for value in values for item in value], out)
+    elif kind is None and type(None) in kinds:
+        out += _HEADER.pack(_NULLABLE, n)
+        out += bytes(value is not None for value in values)
+        _pack_column([value for value in values if value is not None], out)
+    elif kind is None:
+        _pack_mixed(values, out)
+    else:
+        raise TypeError(f"Cannot encode {kind.__name__} in the binary codec")
+
+
+def _pack_mixed(values, out: bytearray):
+    out += _HEADER.pack(_MIXED, len(values))
+    for value in values:
+        _pack_column((value,), out)
+
+
+def _unpack_column(data: bytes, pos: int) -> tuple[list, int]:
+    """Read the column starting at pos; return its values and the offset after it"""
+    kind, n = _HEADER.unpack_from(data, pos)
+    pos += _HEADER.size
+
+    if kind == _INTS:
+        return list(struct.unpack_from(f"<{n}q", data, pos)), pos + 8 * n
+    if kind == _STRS:
+        lengths = struct.unpack_from(f"<{n}I", data, pos)
+        pos += 4 * n
+        (size,) = _U32.unpack_from(data, pos)
+        pos += 4
+        text = data[pos:pos + size].decode("utf-8")
+        ends = list(accumulate(lengths))
+        return [text[end - length:end] for length, end in zip(lengths, ends)], pos + size
+    if kind == _RECORDS:
+        keys, pos = _unpack_column(data, pos)
+        if not keys:
+            return [{} for _ in range(n)], pos
+        columns = []
+        for _ in keys:
+            column, pos = _unpack_column(data, pos)
+            columns.append(column)
+        return [dict(zip(keys, row)) for row in zip(*columns)], pos
+    if kind == _DATETIMES:
+        micros = struct.unpack_from(f"<{n}q", data, pos)
+        return [_EPOCH + _MICROSECOND * value for value in micros], pos + 8 * n
+    if kind == _NULLABLE:
+        present = data[pos:pos + n]
+        column, pos = _unpack_column(data, pos + n)
+        values = iter(column)
+        return [next(values) if flag else None for flag in present], pos
+    if kind == _BOOLS:
+        return [flag == 1 for flag in data[pos:pos + n]], pos + n
+    if kind == _NONES:
+        return [None] * n, pos
+    if kind == _EMPTY:
+        return [], pos
+    if kind == _MAPS or kind == _LISTS:
+        counts = struct.unpack_from(f"<{n}I", data, pos)
+        pos += 4 * n
+        if kind == _LISTS:
+            items, pos = _unpack_column(data, pos)
+            items = iter(items)
+            return [list(islice(items, count)) for count in counts], pos
+        keys, pos = _unpack_column(data, pos)
+        items, pos = _unpack_column(data, pos)
+        keys, items = iter(keys), iter(items)
+        return [dict(zip(islice(keys, count), islice(items, count))) for count in counts], pos
+    if kind == _FLOATS:
+        return list(struct.unpack_from(f"<{n}d", data, pos)), pos + 8 * n
+    if kind == _AWARE_DATETIMES:
+        micros = struct.unpack_from(f"<{n}q", data, pos)
+        offsets = struct.unpack_from(f"<{n}i", data, pos + 8 * n)
+        values = [(_EPOCH_UTC + _MICROSECOND * value).astimezone(timezone(timedelta(seconds=offset)))
+                  for value, offset in zip(micros, offsets)]
+        return values, pos + 12 * n
+    if kind == _BIGINTS:
+        digits, pos = _unpack_column(data, pos)
+        return list(map(int, digits)), pos
+    if kind == _MIXED:
+        values = []
+        for _ in range(n):
+            column, pos = _unpack_column(data, pos)
+            values.extend(column)
+        return values, pos
+    raise ValueError(f"Corrupt binary snapshot: unknown column kind {kind}")
+
+
+class BinaryCodec(Codec):
+    """Compact columnar format packed with struct, no dependencies.
+
+    A table is stored column by column rather than row by row: each field of
+    the rows becomes one run of same-typed values, so field names are written
+    once per file, ints and datetimes are 8 bytes each, and decoding a column
+    is one ``struct.unpack`` instead of a Python call per value. Nested dicts
+    and lists (a user's tasks, say) are flattened into child columns the same
+    way. Columns holding several types fall back to one column per value.
+    """
+
+    name = "binary"
+    codec_id = 1
+    native_datetimes = True
+
+    def encode(self, rows: list[dict]) -> bytes:
+        out = bytearray()
+        _pack_column(rows, out)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> list[dict]:
+        try:
+            rows, pos = _unpack_column(data, 0)
+        except (struct.error, StopIteration, UnicodeDecodeError, OverflowError) as e:
+            raise ValueError(f"Corrupt binary snapshot: {e}") from e
+        if pos != len(data):
+            raise ValueError("Corrupt binary snapshot: trailing bytes")
+        return rows
+
+
+class MsgpackCodec(Codec):
+    """MessagePack, with datetimes as extension types; needs the msgpack package"""
+
+    name = "msgpack"
+    codec_id = 2
+    native_datetimes = True
+
+    _NAIVE_DATETIME = 1
+    _AWARE_DATETIME = 2
+
+    def _default(self, value):
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                return msgpack.ExtType(self._NAIVE_DATETIME, _Q.pack((value - _EPOCH) // _MICROSECOND))
+            offset = int(value.utcoffset().total_seconds())
+            return msgpack.ExtType(self._AWARE_DATETIME, _QI.pack((value - _EPOCH_UTC) // _MICROSECOND, offset))
+        raise TypeError(f"Cannot encode {type(value).__name__} in the msgpack codec")
+
+    def _ext_hook(self, code: int, payload: bytes):
+        if code == self._NAIVE_DATETIME:
+            return _EPOCH + _MICROSECOND * _Q.unpack(payload)[0]
+        if code == self._AWARE_DATETIME:
+            micros, offset = _QI.unpack(payload)
+            return (_EPOCH_UTC + _MICROSECOND * micros).astimezone(timezone(timedelta(seconds=offset)))
+        return msgpack.ExtType(code, payload)
+
+    def encode(self, rows: list[dict]) -> bytes:
+        return msgpack.packb(rows, default=self._default, use_bin_type=True)
+
+    def decode(self, data: bytes) -> list[dict]:
+        try:
+            return msgpack.unpackb(data, ext_hook=self._ext_hook, raw=False, strict_map_key=False)
+        except (msgpack.UnpackException, msgpack.ExtraData) as e:
+            raise ValueError(f"Corrupt msgpack snapshot: {e}") from e
+
+
+CODECS: dict[str, Codec] = {codec.name: codec for codec in (JsonCodec(), BinaryCodec())}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str) -> Codec:
+    """Look up a codec by its setting name"""
+    try:
+        return CODECS[name]
+    except KeyError:
+        hint = " (install msgpack)" if name == "msgpack" else ""
+        raise ValueError(f"Unknown storage codec: {name}{hint}") from None
+
+
+def encode_file(rows: list[dict], codec: Codec) -> bytes:
+    """Encode rows as a whole file, with a header unless the codec is JSON"""
+    if codec.codec_id == JsonCodec.codec_id:
+        return codec.encode(rows)
+    return MAGIC + bytes((FORMAT_VERSION, codec.codec_id)) + codec.encode(rows)
+
+
+def decode_file(data: bytes) -> list[dict]:
+    """Decode a whole file written by any codec; raises ValueError if it is corrupt"""
+    if not data.startswith(MAGIC):
+        return CODECS["json"].decode(data)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Truncated snapshot header")
+    version, codec_id = data[len(MAGIC)], data[len(MAGIC) + 1]
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Snapshot format version {version} is newer than this build supports")
+    codec = _BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Snapshot written by unavailable codec {codec_id}")
+    return codec.decode(data[HEADER_SIZE:])
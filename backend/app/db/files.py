@@ -0,0 +1,151 @@
+"""Atomic data file helpers, shared by the write-ahead log and the migration tool.
+
+A data file is a snapshot of rows in one of the ``codecs``. Saves replace it
+through a temp file, fsync and rename, keeping the previous snapshot as
+``<file>.bak``; loads fall back to that backup if the file is torn.
+"""
+import os
+import tempfile
+import threading
+import time
+from ..core.config import settings
+from ..core.exceptions import CorruptDataFileError
+from ..core.logging import logger
+from ..core.metrics import metrics
+from .codecs import Codec, decode_file, encode_file, get_codec
+
+# Each save keeps the snapshot it replaced under this suffix for recovery
+BACKUP_SUFFIX = ".bak"
+
+def _ensure_data_dir(file_path: str):
+    """Ensure the directory holding a data file exists"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+def _read_json(file_path: str) -> list[dict]:
+    """Read a snapshot in whichever codec wrote it, told apart by its header"""
+    start = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    data = decode_file(raw)
+    metrics.observe_storage("load", os.path.basename(file_path), time.perf_counter() - start, len(raw))
+    return data
+
+def _load_json_file(file_path: str) -> list[dict]:
+    """Load data from a JSON file, return empty list if file doesn't exist.
+
+    A torn or corrupt file is moved aside to ``<file>.corrupt`` and the last
+    good snapshot, ``<file>.bak``, is loaded instead. If there is no usable
+    backup either, CorruptDataFileError is raised rather than losing the data.
+    """
+    backup_path = file_path + BACKUP_SUFFIX
+    if os.path.exists(file_path):
+        try:
+            return _read_json(file_path)
+        except ValueError as e:  # includes JSONDecodeError and UnicodeDecodeError
+            logger.error("Data file %s is corrupt (%s); recovering from %s", file_path, e, backup_path)
+            os.replace(file_path, file_path + ".corrupt")
+        except FileNotFoundError:
+            pass
+    elif not os.path.exists(backup_path):
+        return []
+
+    # The main file is corrupt, or a crash hit between the two renames of a save
+    try:
+        return _read_json(backup_path)
+    except (OSError, ValueError) as e:
+        raise CorruptDataFileError(f"{file_path} is corrupt and has no usable backup") from e
+
+
+class _AtomicWriter:
+    """Writes files via temp file + fsync + rename, coalescing concurrent saves.
+
+    The first thread to save a file becomes its writer; saves of the same file
+    that arrive meanwhile only leave their data behind and wait. When the
+    writer finishes it picks up the newest waiting data and writes that once
+    for all of them, so N concurrent saves cost far fewer than N fsyncs.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: dict[str, tuple[int, list[dict], Codec]] = {}  # path -> (ticket, data, codec)
+        self._written: dict[str, int] = {}  # path -> newest ticket on disk
+        self._writing: set[str] = set()
+        self._tickets = 0
+
+    def save(self, file_path: str, data: list[dict], codec: Codec):
+        with self._cond:
+            self._tickets += 1
+            ticket = self._tickets
+            self._pending[file_path] = (ticket, data, codec)
+            while file_path in self._writing:
+                self._cond.wait()
+                if self._written.get(file_path, 0) >= ticket:
+                    return
+            self._writing.add(file_path)
+
+        try:
+            while True:
+                with self._cond:
+                    batch = self._pending.pop(file_path, None)
+                if batch is None:
+                    break
+                batch_ticket, batch_data, batch_codec = batch
+                try:
+                    _write_atomically(file_path, batch_data, batch_codec)
+                except BaseException:
+                    # Leave the data for a waiting saver to retry, unless newer data replaced it
+                    with self._cond:
+                        self._pending.setdefault(file_path, batch)
+                    raise
+                with self._cond:
+                    self._written[file_path] = batch_ticket
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._writing.discard(file_path)
+                self._cond.notify_all()
+
+
+def _fsync_dir(dir_path: str):
+    """Make renames in a directory durable (not possible on Windows)"""
+    if os.name == "nt":
+        return
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomically(file_path: str, data: list[dict], codec: Codec):
+    dir_path = os.path.dirname(file_path)
+    start = time.perf_counter()
+    payload = encode_file(data, codec)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        size = len(payload)
+        # Keep the previous snapshot as the backup, then move the new one in
+        if os.path.exists(file_path):
+            os.replace(file_path, file_path + BACKUP_SUFFIX)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dir_path)
+    metrics.observe_storage("save", os.path.basename(file_path), time.perf_counter() - start, size)
+
+
+_writer = _AtomicWriter()
+
+def _save_json_file(file_path: str, data: list[dict], codec: str | None = None):
+    """Save data to a data file atomically; the previous version is kept as <file>.bak.
+
+    The file is written with ``codec``, or the ``storage_codec`` setting if omitted.
+    """
+    _ensure_data_dir(file_path)
+    _writer.save(file_path, data, get_codec(codec or settings.storage_codec))
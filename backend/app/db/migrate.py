@@ -0,0 +1,84 @@
+"""Rewrite the JSON file backend's data files in another on-disk codec.
+
+Usage (from backend/)::
+
+    python -m app.db.migrate --codec binary
+    python -m app.db.migrate --codec json app/db/data/users.json
+
+Each file is loaded in whatever format it is currently in, its pending log is
+folded in, and it is rewritten atomically with the chosen codec; the original
+is kept as ``<file>.bak``. Afterwards set STORAGE_CODEC to the same codec so
+later compactions keep writing it.
+"""
+
+import argparse
+import json
+import os
+
+from .codecs import CODECS, decode_file
+from .files import _load_json_file, _save_json_file
+
+# The file backend's data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+USERS_FILE = os.path.join(DATA_DIR, "users.json")
+TASKS_FILE = os.path.join(DATA_DIR, "tasks.json")
+ACHIEVEMENTS_FILE = os.path.join(DATA_DIR, "achievements.json")
+
+# Writes since a file's last compaction, one JSON line each: {"put": row} or {"del": id}
+LOG_SUFFIX = ".log"
+
+
+def load_rows(file_path: str) -> list[dict]:
+    """Load a data file's snapshot with its log replayed on top, in insertion order"""
+    rows = {row["id"]: row for row in _load_json_file(file_path)}
+    log_path = file_path + LOG_SUFFIX
+    if not os.path.exists(log_path):
+        return list(rows.values())
+    with open(log_path, 'rb') as f:
+        for line in f:
+            # A crash mid-append leaves a torn final line; everything before it is intact
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line) if line.strip() else None
+            except json.JSONDecodeError:
+                break
+            if record is None:
+                continue
+            if "put" in record:
+                rows[record["put"]["id"]] = record["put"]
+            else:
+                rows.pop(record["del"], None)
+    return list(rows.values())
+
+
+def migrate_file(file_path: str, codec: str) -> tuple[int, int]:
+    """Rewrite one data file with codec; return (size before, size after) in bytes"""
+    before = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+    _save_json_file(file_path, load_rows(file_path), codec)
+    # The log has been folded into the new snapshot
+    log_path = file_path + LOG_SUFFIX
+    if os.path.exists(log_path):
+        open(log_path, 'w').close()
+    return before, os.path.getsize(file_path)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codec", required=True, choices=sorted(CODECS))
+    parser.add_argument("files", nargs="*", default=[USERS_FILE, TASKS_FILE, ACHIEVEMENTS_FILE])
+    args = parser.parse_args(argv)
+
+    for file_path in args.files:
+        if not os.path.exists(file_path) and not os.path.exists(file_path + LOG_SUFFIX):
+            print(f"{file_path}: missing, skipped")
+            continue
+        before, after = migrate_file(file_path, args.codec)
+        # Read it back so a bad conversion is caught while the .bak is still fresh
+        with open(file_path, 'rb') as f:
+            count = len(decode_file(f.read()))
+        print(f"{file_path}: {count} rows, {before} -> {after} bytes ({args.codec})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,704 @@
+"""Repository layer: one interface over every storage backend.
+
+Routes and services talk to ``repository`` instead of reaching into a
+particular backend. ``settings.database_type`` decides which implementation
+backs it:
+
+- ``memory``: the module-level dicts in ``app/db/storage.py`` (default);
+  with ``settings.memory_data_dir`` set they are logged and snapshotted there
+  and survive restarts (``app/db/wal.py``)
+- ``sqlite``: an SQLite database at ``settings.database_url`` in WAL mode
+- ``shared``: in-memory tables held by a state server process that every
+  worker on the host talks to over a Unix socket (``app/db/shared.py``)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from itertools import islice
+from ..models import User, Task, Fish, Achievement, TaskStatus, UserCounters
+from ..core.config import settings
+from ..core.exceptions import DuplicateUsernameError, UserNotFoundError
+from ..services.id_service import id_service
+from ..services.xp_curve import DEFAULT_XP_CURVE
+from . import storage
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "data", "dopamine_hunter.sqlite3")
+
+# User fields that hold the user's tasks, achievements and fishes, which every
+# backend stores in their own tables
+_USER_CHILDREN = {"tasks", "achievements", "fishes"}
+
+# Assembled users the memory backend keeps for reuse; dropped wholesale when full
+MAX_ASSEMBLED_USERS = 10_000
+
+
+class Repository(ABC):
+    """Storage operations shared by every backend.
+
+    Models returned by a repository may be mutated by the caller; changes are
+    only guaranteed to be stored once they are passed back to a ``save_*`` method.
+    Every ``add_*`` and ``save_*`` stores the model with the version after the
+    stored one and sets it on the model, which is what ETags are built from.
+    Backends shared by several workers number it in the same write, so two
+    workers saving the same object at once never store the same version; the
+    later write wins, as it does for the content.
+
+    ``blocking`` says whether calls may wait on disk or network I/O, in which
+    case async callers should run them off the event loop. ``write_behind``
+    says whether async callers may hold back user saves and write them in
+    batches (see ``AsyncRepository.save_user_later``). ``etag_epoch`` goes
+    into every ETag; it changes whenever the same IDs and versions may be
+    reused for different content, as after a restart of storage that is not
+    persisted.
+    """
+
+    blocking = True
+    write_behind = True
+    etag_epoch = 0
+
+    # Users
+    @abstractmethod
+    def get_user(self, user_id: int) -> User | None: ...
+
+    @abstractmethod
+    def has_user(self, user_id: int) -> bool:
+        """Check a user exists without loading their nested collections"""
+
+    def get_user_without_children(self, user_id: int) -> User | None:
+        """Get a user with their nested collections left empty.
+
+        Backends that store users apart from their children override this to
+        skip loading them.
+        """
+        user = self.get_user(user_id)
+        return _without_children(user) if user is not None else None
+
+    @abstractmethod
+    def get_user_by_username(self, username: str) -> User | None: ...
+
+    @abstractmethod
+    def list_users(self, after_id: int | None = None, limit: int | None = None,
+                   fields: set[str] | None = None) -> list[User]:
+        """List users in ID order; after_id and limit select one page.
+
+        fields names the user fields the caller will read, if not all; the
+        tasks, fishes and achievements it leaves out may be left empty.
+        """
+
+    @abstractmethod
+    def add_user(self, user: User) -> User:
+        """Store a new user, raising DuplicateUsernameError if the name is taken"""
+
+    @abstractmethod
+    def save_user(self, user: User) -> User: ...
+
+    def save_users(self, users: list[User]) -> list[User]:
+        """Save several users in one write"""
+        return [self.save_user(user) for user in users]
+
+    # Tasks
+    @abstractmethod
+    def get_task(self, task_id: int) -> Task | None: ...
+
+    @abstractmethod
+    def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]: ...
+
+    @abstractmethod
+    def add_task(self, task: Task) -> Task: ...
+
+    @abstractmethod
+    def save_task(self, task: Task) -> Task: ...
+
+    @abstractmethod
+    def add_tasks(self, tasks: list[Task]) -> list[Task]:
+        """Store several new tasks in one transaction"""
+
+    @abstractmethod
+    def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        """Save several tasks in one transaction"""
+
+    @abstractmethod
+    def delete_task(self, task_id: int) -> bool: ...
+
+    # Fishes
+    @abstractmethod
+    def get_fish(self, fish_id: int) -> Fish | None: ...
+
+    @abstractmethod
+    def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]: ...
+
+    @abstractmethod
+    def add_fish(self, fish: Fish) -> Fish: ...
+
+    @abstractmethod
+    def save_fish(self, fish: Fish) -> Fish: ...
+
+    @abstractmethod
+    def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        """Return fishes of every user in ID order, for batch jobs"""
+
+    def save_fishes(self, fishes: list[Fish]) -> list[Fish]:
+        """Save several fishes in one write"""
+        return [self.save_fish(fish) for fish in fishes]
+
+    def save_fishes_if_current(self, fishes: list[Fish]) -> list[Fish]:
+        """Save the fishes whose stored version is still the one they carry.
+
+        Returns the fishes saved. The rest were written by someone else since
+        they were read and are left as they are, for the caller to re-read.
+        """
+        current = []
+        for fish in fishes:
+            stored = self.get_fish(fish.id)
+            if stored is not None and stored.version == fish.version:
+                current.append(fish)
+        return self.save_fishes(current)
+
+    # Achievements
+    @abstractmethod
+    def get_achievement(self, achievement_id: int) -> Achievement | None: ...
+
+    @abstractmethod
+    def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                          limit: int | None = None) -> list[Achievement]: ...
+
+    @abstractmethod
+    def add_achievement(self, achievement: Achievement) -> Achievement: ...
+
+    @abstractmethod
+    def save_achievement(self, achievement: Achievement) -> Achievement: ...
+
+    # Counters
+    def get_user_counters(self, user_id: int) -> UserCounters:
+        """Count a user's tasks by status, fishes and achievements.
+
+        This reads every row; backends that keep running counts override it.
+        """
+        counters = UserCounters()
+        for task in self.list_tasks(user_id):
+            if task.status == TaskStatus.PENDING:
+                counters.pending_tasks += 1
+            elif task.status == TaskStatus.COMPLETED:
+                counters.completed_tasks += 1
+            else:
+                counters.cancelled_tasks += 1
+        for fish in self.list_fishes(user_id):
+            counters.fishes += 1
+            counters.living_fishes += fish.alive
+            counters.total_xp += DEFAULT_XP_CURVE.total(fish.level) + fish.xp
+        for achievement in self.list_achievements(user_id):
+            counters.achievements += 1
+            counters.completed_achievements += achievement.is_completed
+        return counters
+
+
+def _stamp(model):
+    """Give a model about to be stored its next version"""
+    model.version += 1
+    return model
+
+
+def _without_children(user: User) -> User:
+    """A shallow copy of user with its nested collections left out, as users are stored and sent"""
+    if not (user.tasks or user.achievements or user.fishes):
+        return user
+    return user.model_copy(update={name: {} for name in _USER_CHILDREN})
+
+
+def _page(rows: Iterable, after_id: int | None, limit: int | None) -> list:
+    """Take one page from rows already in ID order"""
+    if after_id is not None:
+        rows = (row for row in rows if row.id > after_id)
+    return list(islice(rows, limit))
+
+
+class MemoryRepository(Repository):
+    """Repository over the in-memory tables in app/db/storage.py.
+
+    Every entity is stored once, in its own table: users without their
+    children, and tasks, achievements and fishes indexed by ``user_id``.
+    A ``User`` handed out with children is a copy assembled from those
+    indexes. It is kept and handed out again until the user or any of its
+    children is written, which the tables' revisions tell without looking at
+    the rows. Fishes are built from their columns, so they are always new
+    objects and have to be saved back to be stored.
+    """
+
+    blocking = False
+
+    def __init__(self):
+        # user_id -> (stored user, its version, children revisions, assembled user)
+        self._assembled: dict[int, tuple] = {}
+        # The data goes with the process, so its ETags must too
+        self.etag_epoch = int.from_bytes(os.urandom(4), "little")
+
+    def _assemble(self, user: User | None) -> User | None:
+        """The stored user as handed out, with its children from the per-user indexes"""
+        if user is None:
+            return None
+        revisions = (
+            storage.tasks.group_revision("user_id", user.id),
+            storage.achievements.group_revision("user_id", user.id),
+            storage.fishes.user_revision(user.id),
+        )
+        if not any(revisions):
+            return user  # nothing of its own written since storage was cleared
+        entry = self._assembled.get(user.id)
+        if entry is not None and entry[0] is user and entry[1] == user.version and entry[2] == revisions:
+            return entry[3]
+        assembled = user.model_copy(update={
+            "tasks": {task.id: task for task in storage.tasks.get_group("user_id", user.id)},
+            "achievements": {
+                achievement.id: achievement for achievement in storage.achievements.get_group("user_id", user.id)
+            },
+            "fishes": storage.fishes.for_user(user.id),
+        })
+        if len(self._assembled) >= MAX_ASSEMBLED_USERS:
+            self._assembled.clear()
+        self._assembled[user.id] = (user, user.version, revisions, assembled)
+        return assembled
+
+    def get_user(self, user_id: int) -> User | None:
+        return self._assemble(storage.users.get(user_id))
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in storage.users
+
+    def get_user_without_children(self, user_id: int) -> User | None:
+        return storage.users.get(user_id)
+
+    def get_user_by_username(self, username: str) -> User | None:
+        return self._assemble(storage.users.get_by("username", username))
+
+    def list_users(self, after_id: int | None = None, limit: int | None = None,
+                   fields: set[str] | None = None) -> list[User]:
+        users = storage.users.page(after_id, limit)
+        if fields is not None and not fields & _USER_CHILDREN:
+            return users  # stored without children already
+        return [self._assemble(user) for user in users]
+
+    def add_user(self, user: User) -> User:
+        if self.get_user_by_username(user.username) is not None:
+            raise DuplicateUsernameError(user.username)
+        storage.users[user.id] = _without_children(_stamp(user))
+        return user
+
+    def save_user(self, user: User) -> User:
+        storage.users[user.id] = _without_children(_stamp(user))
+        return user
+
+    def get_task(self, task_id: int) -> Task | None:
+        return storage.tasks.get(task_id)
+
+    def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]:
+        return _page(storage.tasks.get_group("user_id", user_id), after_id, limit)
+
+    def add_task(self, task: Task) -> Task:
+        return self.save_task(task)
+
+    def save_task(self, task: Task) -> Task:
+        if task.user_id not in storage.users:
+            raise UserNotFoundError(task.user_id)
+        storage.tasks[task.id] = _stamp(task)
+        return task
+
+    def add_tasks(self, tasks: list[Task]) -> list[Task]:
+        return self.save_tasks(tasks)
+
+    def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        for task in tasks:
+            self.save_task(task)
+        return tasks
+
+    def delete_task(self, task_id: int) -> bool:
+        return storage.tasks.pop(task_id, None) is not None
+
+    def get_fish(self, fish_id: int) -> Fish | None:
+        return storage.fishes.get(fish_id)
+
+    def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return _page(storage.fishes.for_user(user_id).values(), after_id, limit)
+
+    def add_fish(self, fish: Fish) -> Fish:
+        return self.save_fish(fish)
+
+    def save_fish(self, fish: Fish) -> Fish:
+        if fish.user_id not in storage.users:
+            raise UserNotFoundError(fish.user_id)
+        storage.fishes[fish.id] = _stamp(fish)
+        return fish
+
+    def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return storage.fishes.page(after_id, limit)
+
+    def save_fishes_if_current(self, fishes: list[Fish]) -> list[Fish]:
+        return self.save_fishes([fish for fish in fishes if storage.fishes.version_of(fish.id) == fish.version])
+
+    def get_achievement(self, achievement_id: int) -> Achievement | None:
+        return storage.achievements.get(achievement_id)
+
+    def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                          limit: int | None = None) -> list[Achievement]:
+        if user_id:
+            return _page(storage.achievements.get_group("user_id", user_id), after_id, limit)
+        return storage.achievements.page(after_id, limit)
+
+    def add_achievement(self, achievement: Achievement) -> Achievement:
+        return self.save_achievement(achievement)
+
+    def save_achievement(self, achievement: Achievement) -> Achievement:
+        if achievement.user_id not in storage.users:
+            raise UserNotFoundError(achievement.user_id)
+        storage.achievements[achievement.id] = _stamp(achievement)
+        return achievement
+
+    def get_user_counters(self, user_id: int) -> UserCounters:
+        # Kept up to date by the tables' count and sum indexes on every write
+        task_counts = storage.tasks.counts("status", user_id)
+        achievement_counts = storage.achievements.counts("is_completed", user_id)
+        return UserCounters(
+            pending_tasks=task_counts.get(TaskStatus.PENDING, 0),
+            completed_tasks=task_counts.get(TaskStatus.COMPLETED, 0),
+            cancelled_tasks=task_counts.get(TaskStatus.CANCELLED, 0),
+            fishes=storage.fishes.count_for_user(user_id),
+            living_fishes=storage.fishes.sum_for_user("living", user_id),
+            total_xp=storage.fishes.sum_for_user("total_xp", user_id),
+            achievements=sum(achievement_counts.values()),
+            completed_achievements=achievement_counts.get(True, 0),
+        )
+
+
+# Each entity is stored as its JSON document plus the columns we look it up by.
+# Nested children are never stored on the user row; they are read back from
+# their own tables when a User is loaded.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks (user_id);
+CREATE TABLE IF NOT EXISTS fishes (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fishes_user_id ON fishes (user_id);
+CREATE TABLE IF NOT EXISTS achievements (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_achievements_user_id ON achievements (user_id);
+"""
+
+# Statement text is fixed so sqlite3's per-connection statement cache
+# prepares each one once and reuses it. List queries always take a lower ID
+# bound and a LIMIT (0 and -1 when unpaged) for the same reason.
+_SELECT_USER = "SELECT data FROM users WHERE id = ?"
+_USER_EXISTS = "SELECT 1 FROM users WHERE id = ?"
+_SELECT_USER_BY_USERNAME = "SELECT data FROM users WHERE username = ?"
+_SELECT_USERS = "SELECT data FROM users WHERE id > ? ORDER BY id LIMIT ?"
+_INSERT_USER = "INSERT INTO users (id, username, data) VALUES (?, ?, ?)"
+# Saves number the stored version in the statement itself, from the version
+# already stored, so concurrent writers never reuse a version
+_UPDATE_USER = (
+    "UPDATE users SET username = ?, data = json_set(?, '$.version', json_extract(data, '$.version') + 1) "
+    "WHERE id = ?"
+)
+_CHILD_TABLES = ("tasks", "fishes", "achievements")
+_SELECT_BY_ID = {table: f"SELECT data FROM {table} WHERE id = ?" for table in _CHILD_TABLES}
+_SELECT_BY_USER = {
+    table: f"SELECT data FROM {table} WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?" for table in _CHILD_TABLES
+}
+# Per-user aggregates for get_user_counters; fish XP needs the curve, so it is summed per level
+_COUNT_TASKS = "SELECT json_extract(data, '$.status'), COUNT(*) FROM tasks WHERE user_id = ? GROUP BY 1"
+_SUM_FISHES = (
+    "SELECT json_extract(data, '$.level'), COUNT(*), SUM(json_extract(data, '$.alive')), "
+    "SUM(json_extract(data, '$.xp')) FROM fishes WHERE user_id = ? GROUP BY 1"
+)
+_COUNT_ACHIEVEMENTS = (
+    "SELECT COUNT(*), COALESCE(SUM(json_extract(data, '$.is_completed')), 0) FROM achievements WHERE user_id = ?"
+)
+_SELECT_ALL = {table: f"SELECT data FROM {table} WHERE id > ? ORDER BY id LIMIT ?" for table in _CHILD_TABLES}
+_UPSERT = {
+    table: f"INSERT INTO {table} (id, user_id, data) VALUES (?, ?, ?) "
+           f"ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, "
+           f"data = json_set(excluded.data, '$.version', json_extract({table}.data, '$.version') + 1)"
+    for table in _CHILD_TABLES
+}
+# Reads back the versions a save stored, for a JSON array of IDs
+_SELECT_VERSIONS = {
+    table: f"SELECT id, json_extract(data, '$.version') FROM {table} "
+           f"WHERE id IN (SELECT value FROM json_each(?))"
+    for table in ("users",) + _CHILD_TABLES
+}
+# Conditional on the stored version, so a batch job cannot overwrite a concurrent write
+_UPDATE_IF_CURRENT = {
+    table: f"UPDATE {table} SET user_id = ?, data = ? WHERE id = ? AND json_extract(data, '$.version') = ?"
+    for table in _CHILD_TABLES
+}
+_DELETE = {table: f"DELETE FROM {table} WHERE id = ?" for table in _CHILD_TABLES}
+
+_ID_KINDS = {"users": "user", "tasks": "task", "fishes": "fish", "achievements": "achievement"}
+
+
+def _sql_limit(limit: int | None) -> int:
+    return -1 if limit is None else limit
+
+
+class SQLiteRepository(Repository):
+    """Repository backed by an SQLite database in WAL mode.
+
+    WAL lets readers in every uvicorn worker proceed while one writer commits,
+    so several processes can share one database file. Each thread gets its own
+    connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+        # Seed the allocator so IDs stay unique even if its state file was lost
+        for table, kind in _ID_KINDS.items():
+            id_service.ensure_above(kind, self._conn().execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0])
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, cached_statements=256, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _fetch_one(self, sql: str, params: tuple) -> str | None:
+        row = self._conn().execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    def _fetch_all(self, sql: str, params: tuple = ()) -> list[str]:
+        return [row[0] for row in self._conn().execute(sql, params)]
+
+    def _load_user(self, data: str | None, children=_USER_CHILDREN) -> User | None:
+        """The stored user with those of its children named, one query each"""
+        if data is None:
+            return None
+        user = User.model_validate_json(data)
+        if "tasks" in children:
+            user.tasks = {task.id: task for task in self.list_tasks(user.id)}
+        if "fishes" in children:
+            user.fishes = {fish.id: fish for fish in self.list_fishes(user.id)}
+        if "achievements" in children:
+            user.achievements = {achievement.id: achievement for achievement in self.list_achievements(user.id)}
+        return user
+
+    def _write(self, sql: str, params: tuple):
+        conn = self._conn()
+        with conn:
+            conn.execute(sql, params)
+
+    @staticmethod
+    def _store_versioned(conn: sqlite3.Connection, table: str, sql: str, models: list, params: list[tuple]):
+        """Run a batch save inside conn's transaction and set the stored versions on models.
+
+        models have been stamped already, which is the version a new row starts
+        at; an existing row gets the one after its stored version instead.
+        """
+        conn.executemany(sql, params)
+        versions = dict(conn.execute(
+            _SELECT_VERSIONS[table], (json.dumps([model.id for model in models]),)
+        ).fetchall())
+        for model in models:
+            model.version = versions.get(model.id, model.version)
+        return models
+
+    def get_user(self, user_id: int) -> User | None:
+        return self._load_user(self._fetch_one(_SELECT_USER, (user_id,)))
+
+    def has_user(self, user_id: int) -> bool:
+        return self._fetch_one(_USER_EXISTS, (user_id,)) is not None
+
+    def get_user_without_children(self, user_id: int) -> User | None:
+        data = self._fetch_one(_SELECT_USER, (user_id,))
+        return User.model_validate_json(data) if data is not None else None
+
+    def get_user_by_username(self, username: str) -> User | None:
+        return self._load_user(self._fetch_one(_SELECT_USER_BY_USERNAME, (username,)))
+
+    def list_users(self, after_id: int | None = None, limit: int | None = None,
+                   fields: set[str] | None = None) -> list[User]:
+        rows = self._fetch_all(_SELECT_USERS, (after_id or 0, _sql_limit(limit)))
+        children = _USER_CHILDREN if fields is None else _USER_CHILDREN & fields
+        return [self._load_user(data, children) for data in rows]
+
+    def add_user(self, user: User) -> User:
+        _stamp(user)
+        try:
+            self._write(_INSERT_USER, (user.id, user.username, user.model_dump_json(exclude=_USER_CHILDREN)))
+        except sqlite3.IntegrityError as e:
+            user.version -= 1
+            raise DuplicateUsernameError(user.username) from e
+        return user
+
+    def save_user(self, user: User) -> User:
+        return self.save_users([user])[0]
+
+    def save_users(self, users: list[User]) -> list[User]:
+        conn = self._conn()
+        with conn:
+            self._store_versioned(conn, "users", _UPDATE_USER, users, [
+                (user.username, _stamp(user).model_dump_json(exclude=_USER_CHILDREN), user.id) for user in users
+            ])
+        return users
+
+    def _get_child(self, table: str, model, child_id: int):
+        data = self._fetch_one(_SELECT_BY_ID[table], (child_id,))
+        return model.model_validate_json(data) if data is not None else None
+
+    def _list_children(self, table: str, model, user_id: int | None,
+                       after_id: int | None = None, limit: int | None = None) -> list:
+        if user_id is None:
+            rows = self._fetch_all(_SELECT_ALL[table], (after_id or 0, _sql_limit(limit)))
+        else:
+            rows = self._fetch_all(_SELECT_BY_USER[table], (user_id, after_id or 0, _sql_limit(limit)))
+        return [model.model_validate_json(data) for data in rows]
+
+    def _save_child(self, table: str, child):
+        conn = self._conn()
+        with conn:
+            if conn.execute(_USER_EXISTS, (child.user_id,)).fetchone() is None:
+                raise UserNotFoundError(child.user_id)
+            self._store_versioned(conn, table, _UPSERT[table], [child], [
+                (child.id, child.user_id, _stamp(child).model_dump_json())
+            ])
+        return child
+
+    def get_task(self, task_id: int) -> Task | None:
+        return self._get_child("tasks", Task, task_id)
+
+    def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]:
+        return self._list_children("tasks", Task, user_id, after_id, limit)
+
+    def add_task(self, task: Task) -> Task:
+        return self._save_child("tasks", task)
+
+    def save_task(self, task: Task) -> Task:
+        return self._save_child("tasks", task)
+
+    def add_tasks(self, tasks: list[Task]) -> list[Task]:
+        return self.save_tasks(tasks)
+
+    def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        conn = self._conn()
+        with conn:
+            self._store_versioned(conn, "tasks", _UPSERT["tasks"], tasks, [
+                (task.id, task.user_id, _stamp(task).model_dump_json()) for task in tasks
+            ])
+        return tasks
+
+    def delete_task(self, task_id: int) -> bool:
+        conn = self._conn()
+        with conn:
+            return conn.execute(_DELETE["tasks"], (task_id,)).rowcount > 0
+
+    def get_fish(self, fish_id: int) -> Fish | None:
+        return self._get_child("fishes", Fish, fish_id)
+
+    def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return self._list_children("fishes", Fish, user_id, after_id, limit)
+
+    def add_fish(self, fish: Fish) -> Fish:
+        return self._save_child("fishes", fish)
+
+    def save_fish(self, fish: Fish) -> Fish:
+        return self._save_child("fishes", fish)
+
+    def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return self._list_children("fishes", Fish, None, after_id, limit)
+
+    def save_fishes(self, fishes: list[Fish]) -> list[Fish]:
+        conn = self._conn()
+        with conn:
+            self._store_versioned(conn, "fishes", _UPSERT["fishes"], fishes, [
+                (fish.id, fish.user_id, _stamp(fish).model_dump_json()) for fish in fishes
+            ])
+        return fishes
+
+    def save_fishes_if_current(self, fishes: list[Fish]) -> list[Fish]:
+        conn = self._conn()
+        saved = []
+        with conn:
+            for fish in fishes:
+                version = fish.version
+                cursor = conn.execute(_UPDATE_IF_CURRENT["fishes"], (
+                    fish.user_id, _stamp(fish).model_dump_json(), fish.id, version
+                ))
+                if cursor.rowcount:
+                    saved.append(fish)
+                else:
+                    fish.version = version
+        return saved
+
+    def get_achievement(self, achievement_id: int) -> Achievement | None:
+        return self._get_child("achievements", Achievement, achievement_id)
+
+    def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                          limit: int | None = None) -> list[Achievement]:
+        return self._list_children("achievements", Achievement, user_id or None, after_id, limit)
+
+    def add_achievement(self, achievement: Achievement) -> Achievement:
+        return self._save_child("achievements", achievement)
+
+    def save_achievement(self, achievement: Achievement) -> Achievement:
+        return self._save_child("achievements", achievement)
+
+    def get_user_counters(self, user_id: int) -> UserCounters:
+        conn = self._conn()
+        tasks = dict(conn.execute(_COUNT_TASKS, (user_id,)).fetchall())
+        counters = UserCounters(
+            pending_tasks=tasks.pop(TaskStatus.PENDING.value, 0),
+            completed_tasks=tasks.pop(TaskStatus.COMPLETED.value, 0),
+            cancelled_tasks=sum(tasks.values()),
+        )
+        for level, count, living, xp in conn.execute(_SUM_FISHES, (user_id,)):
+            counters.fishes += count
+            counters.living_fishes += living
+            counters.total_xp += DEFAULT_XP_CURVE.total(level) * count + xp
+        counters.achievements, counters.completed_achievements = conn.execute(
+            _COUNT_ACHIEVEMENTS, (user_id,)
+        ).fetchone()
+        return counters
+
+
+def create_repository(database_type: str, database_url: str | None = None,
+                      memory_data_dir: str | None = None) -> Repository:
+    """Build the repository for a ``database_type`` setting"""
+    if database_type == "memory":
+        if memory_data_dir:
+            from .wal import DurableMemoryRepository
+            return DurableMemoryRepository(
+                memory_data_dir, settings.wal_fsync,
+                snapshot_wal_bytes=settings.snapshot_wal_bytes,
+                snapshot_interval_seconds=settings.snapshot_interval_seconds,
+            )
+        return MemoryRepository()
+    if database_type == "sqlite":
+        return SQLiteRepository(database_url or DEFAULT_SQLITE_PATH)
+    if database_type == "shared":
+        from .shared import DEFAULT_STATE_SOCKET, SharedRepository
+        return SharedRepository(database_url or DEFAULT_STATE_SOCKET)
+    raise ValueError(f"Unsupported database_type: {database_type}")
+
+
+repository = create_repository(settings.database_type, settings.database_url, settings.memory_data_dir)
@@ -0,0 +1,396 @@
+"""State shared by every worker on a host, served over a Unix socket.
+
+With ``database_type = "shared"`` the in-memory tables live in one state
+server process instead of in each uvicorn worker. Workers reach it through
+``SharedRepository``, which sends each repository call over a Unix socket and
+waits for the answer. The server (``app/db/state_server.py``) runs one call
+at a time on a ``MemoryRepository``, so every worker sees every committed
+write at once (read-your-writes holds whichever worker serves the next
+request), and one call never observes another half done.
+
+The first worker that cannot connect starts the server itself, under a file
+lock so only one is started; it keeps running, and keeps the data, when the
+workers exit, and logs to ``state.log`` beside the socket (for the default
+socket path). It can also be run on its own::
+
+    python -m app.db.state_server --socket app/db/data/state.sock
+
+This module holds the worker side and the wire format: each message is a
+4-byte little-endian length and a pickle of ``(method, args)`` one way and
+``(ok, result or exception)`` the other.
+
+Event streams go through the server too, so a stream sees changes made by
+any worker: each worker's ``EventRelay`` keeps one more connection, opened
+with an ``events`` message, on which it sends ``watch``, ``unwatch`` and
+``publish`` messages (no replies) and receives ``(user_id, event_type,
+data)`` for every user it watches.
+
+Messages are pickled, so the socket is created readable and writable by its
+owner only: anything that can connect can run code in the server.
+"""
+
+import os
+import pickle
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from ..core.file_lock import locked
+from ..core.logging import logger
+from ..models import User, Task, Fish, Achievement, UserCounters
+from .repository import Repository, _without_children
+
+DEFAULT_STATE_SOCKET = os.path.join(os.path.dirname(__file__), "data", "state.sock")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# How long a worker waits for a server it started to accept connections
+STARTUP_TIMEOUT = 10
+# How long an event relay waits between attempts to reach a lost server
+RECONNECT_DELAY = 1
+# Relay messages queued for the state server before new ones are dropped
+MAX_PENDING_EVENTS = 10_000
+
+HEADER = struct.Struct("<I")
+
+# Repository calls workers may send. The server answers reads with the stored rows,
+READ_METHODS = frozenset({
+    "get_user", "has_user", "get_user_without_children", "get_user_by_username", "list_users",
+    "get_task", "list_tasks",
+    "get_fish", "list_fishes", "scan_fishes",
+    "get_achievement", "list_achievements", "get_user_counters",
+})
+# ...writes of one model with its new version
+WRITE_METHODS = frozenset({
+    "add_user", "save_user", "add_task", "save_task",
+    "add_fish", "save_fish", "add_achievement", "save_achievement",
+})
+# ...and writes of a list of models with their new versions
+BATCH_WRITE_METHODS = frozenset({"save_users", "add_tasks", "save_tasks", "save_fishes"})
+# ...and conditional batch writes, with None for each model left unsaved
+CONDITIONAL_WRITE_METHODS = frozenset({"save_fishes_if_current"})
+# ...and deletes, with whether the row existed
+DELETE_METHODS = frozenset({"delete_task"})
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    """Read exactly size bytes from sock"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("state server closed the connection")
+        view = view[received:]
+    return bytes(buffer)
+
+
+def frame(message) -> bytes:
+    """Encode one message for the wire"""
+    payload = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(payload)) + payload
+
+
+def start_state_server(path: str):
+    """Start a detached state server at path unless one is already accepting connections"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + ".lock", "a+") as lock_file, locked(lock_file):
+        # Another worker may have started it while we waited for the lock
+        if _can_connect(path):
+            return
+        # Fully detached, so it does not hold the worker's terminal or pipes
+        # open; it logs to a file next to the socket instead
+        with open(server_log_path(path), "ab") as log_file:
+            subprocess.Popen(
+                [sys.executable, "-m", "app.db.state_server", "--socket", path],
+                cwd=BACKEND_DIR,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        logger.info("Started state server at %s, logging to %s", path, server_log_path(path))
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while not _can_connect(path):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"State server did not start at {path} within {STARTUP_TIMEOUT}s")
+            time.sleep(0.05)
+
+
+def server_log_path(path: str) -> str:
+    """Where a state server started for the socket at path writes its log"""
+    return os.path.splitext(path)[0] + ".log"
+
+
+def _can_connect(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class SharedRepository(Repository):
+    """Repository whose data lives in the state server at ``path``.
+
+    Each thread keeps its own connection, opened on first use, so importing
+    this never touches the server. Returned models are copies; as with SQLite
+    they have to be saved back for changes to be stored. Versions assigned by
+    the server are copied onto the models passed to ``add_*`` and ``save_*``.
+    """
+
+    # A call is a local round trip and every worker must see writes at once
+    write_behind = False
+
+    def __init__(self, path: str, autostart: bool = True):
+        self.path = path
+        self.autostart = autostart
+        self._local = threading.local()
+
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            if self.autostart and not _can_connect(self.path):
+                start_state_server(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+            # A restarted server reuses IDs and versions for other data, so
+            # ETags follow the server instance
+            self.etag_epoch = self._call("etag_epoch")
+        return sock
+
+    def _call(self, method: str, *args):
+        sock = self._socket()
+        try:
+            sock.sendall(frame((method, args)))
+            (size,) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+            ok, value = pickle.loads(recv_exactly(sock, size))
+        except OSError:
+            # Drop the connection; the next call opens a new one
+            self._local.sock = None
+            sock.close()
+            raise
+        if not ok:
+            raise value
+        return value
+
+    def _write(self, method: str, model):
+        sent = _without_children(model) if isinstance(model, User) else model
+        model.version = self._call(method, sent)
+        return model
+
+    def _write_many(self, method: str, models: list) -> list:
+        sent = [_without_children(model) if isinstance(model, User) else model for model in models]
+        for model, version in zip(models, self._call(method, sent)):
+            model.version = version
+        return models
+
+    def get_user(self, user_id: int) -> User | None:
+        return self._call("get_user", user_id)
+
+    def has_user(self, user_id: int) -> bool:
+        return self._call("has_user", user_id)
+
+    def get_user_without_children(self, user_id: int) -> User | None:
+        return self._call("get_user_without_children", user_id)
+
+    def get_user_by_username(self, username: str) -> User | None:
+        return self._call("get_user_by_username", username)
+
+    def list_users(self, after_id: int | None = None, limit: int | None = None,
+                   fields: set[str] | None = None) -> list[User]:
+        return self._call("list_users", after_id, limit, fields)
+
+    def add_user(self, user: User) -> User:
+        return self._write("add_user", user)
+
+    def save_user(self, user: User) -> User:
+        return self._write("save_user", user)
+
+    def save_users(self, users: list[User]) -> list[User]:
+        return self._write_many("save_users", users)
+
+    def get_task(self, task_id: int) -> Task | None:
+        return self._call("get_task", task_id)
+
+    def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]:
+        return self._call("list_tasks", user_id, after_id, limit)
+
+    def add_task(self, task: Task) -> Task:
+        return self._write("add_task", task)
+
+    def save_task(self, task: Task) -> Task:
+        return self._write("save_task", task)
+
+    def add_tasks(self, tasks: list[Task]) -> list[Task]:
+        return self._write_many("add_tasks", tasks)
+
+    def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        return self._write_many("save_tasks", tasks)
+
+    def delete_task(self, task_id: int) -> bool:
+        return self._call("delete_task", task_id)
+
+    def get_fish(self, fish_id: int) -> Fish | None:
+        return self._call("get_fish", fish_id)
+
+    def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return self._call("list_fishes", user_id, after_id, limit)
+
+    def add_fish(self, fish: Fish) -> Fish:
+        return self._write("add_fish", fish)
+
+    def save_fish(self, fish: Fish) -> Fish:
+        return self._write("save_fish", fish)
+
+    def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        return self._call("scan_fishes", after_id, limit)
+
+    def save_fishes(self, fishes: list[Fish]) -> list[Fish]:
+        return self._write_many("save_fishes", fishes)
+
+    def save_fishes_if_current(self, fishes: list[Fish]) -> list[Fish]:
+        saved = []
+        for fish, version in zip(fishes, self._call("save_fishes_if_current", fishes)):
+            if version is not None:
+                fish.version = version
+                saved.append(fish)
+        return saved
+
+    def get_achievement(self, achievement_id: int) -> Achievement | None:
+        return self._call("get_achievement", achievement_id)
+
+    def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                          limit: int | None = None) -> list[Achievement]:
+        return self._call("list_achievements", user_id, after_id, limit)
+
+    def add_achievement(self, achievement: Achievement) -> Achievement:
+        return self._write("add_achievement", achievement)
+
+    def save_achievement(self, achievement: Achievement) -> Achievement:
+        return self._write("save_achievement", achievement)
+
+    def get_user_counters(self, user_id: int) -> UserCounters:
+        return self._call("get_user_counters", user_id)
+
+
+class EventRelay:
+    """Carries EventBus publishes between workers through the state server.
+
+    Installed as the bus's ``relay``. Publishes are queued for a sender
+    thread, so the event loop never waits on the socket; the server forwards
+    each to every worker watching its user, and a reader thread hands those
+    to the local bus. Users with open streams here are watched again whenever
+    the connection is reopened, and a lost server is retried every
+    ``RECONNECT_DELAY`` seconds while any stream is open. Events published
+    while the server is unreachable, or beyond ``MAX_PENDING_EVENTS`` queued
+    behind a slow one, are dropped, like events for a client that fell behind.
+    """
+
+    def __init__(self, path: str, bus, autostart: bool = True):
+        self.path = path
+        self.bus = bus
+        self.autostart = autostart
+        self._lock = threading.Lock()  # guards _sock between the sender and reader threads
+        self._sock: socket.socket | None = None
+        self._closed = False
+        self._outbox = queue.Queue(MAX_PENDING_EVENTS)
+        threading.Thread(target=self._send_loop, name="event-relay-send", daemon=True).start()
+
+    def _connect(self) -> socket.socket:
+        # Called from the sender thread only
+        if self._sock is None:
+            if self.autostart and not _can_connect(self.path):
+                start_state_server(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                sock.sendall(frame(("events", ())) + b"".join(
+                    frame(("watch", (user_id,))) for user_id in self.bus.watched_users()
+                ))
+            except OSError:
+                sock.close()
+                raise
+            with self._lock:
+                self._sock = sock
+            threading.Thread(target=self._read, args=(sock,), name="event-relay", daemon=True).start()
+        return self._sock
+
+    def _send(self, message):
+        """Queue a message for the sender thread; never blocks the caller"""
+        if self._closed:
+            return
+        try:
+            self._outbox.put_nowait(message)
+        except queue.Full:
+            logger.warning("Event relay to %s is backed up, dropping a %s", self.path, message[0])
+
+    def _send_loop(self):
+        """Send queued messages in order, reconnecting while streams are open"""
+        while not self._closed:
+            try:
+                message = self._outbox.get(timeout=RECONNECT_DELAY)
+            except queue.Empty:
+                # Streams still open here would otherwise wait forever after a lost connection
+                if self._sock is None and self.bus.watched_users():
+                    try:
+                        self._connect()
+                    except OSError:
+                        pass
+                continue
+            if self._closed:
+                return
+            try:
+                self._connect().sendall(frame(message))
+            except OSError as e:
+                logger.warning("Event relay to %s failed: %s", self.path, e)
+                self._drop(self._sock)
+
+    def _drop(self, sock: socket.socket | None):
+        with self._lock:
+            if sock is None or sock is not self._sock:
+                return
+            self._sock = None
+        try:
+            # Wakes a thread blocked sending or reading on it
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def watch(self, user_id: int):
+        self._send(("watch", (user_id,)))
+
+    def unwatch(self, user_id: int):
+        self._send(("unwatch", (user_id,)))
+
+    def publish(self, user_id: int, event_type: str, data: dict):
+        self._send(("publish", (user_id, event_type, data)))
+
+    def _read(self, sock: socket.socket):
+        """Deliver events from the server to the local bus until the connection goes"""
+        while True:
+            try:
+                (size,) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+                user_id, event_type, data = pickle.loads(recv_exactly(sock, size))
+            except OSError:
+                break
+            self.bus.deliver(user_id, event_type, data)
+        self._drop(sock)
+
+    def close(self):
+        self._closed = True
+        try:
+            # Wake the sender so it sees the relay is closed
+            self._outbox.put_nowait(None)
+        except queue.Full:
+            pass
+        self._drop(self._sock)
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""The state server for ``database_type = "shared"``.
+
+Usage: python -m app.db.state_server [--socket PATH]
+
+Holds the in-memory tables for every worker on the host and answers their
+repository calls over a Unix socket (see ``app/db/shared.py`` for the worker
+side). Workers start one on demand, so running it by hand is only needed to
+put it under a process supervisor. Stop it with SIGTERM or Ctrl+C; its data
+goes with it.
+"""
+
+import argparse
+import os
+import pickle
+import signal
+import socket
+import sys
+import threading
+from ..core.config import settings
+from ..core.exceptions import DopamineHunterException
+from ..core.logging import logger
+# Import the repository module before shared: when it is the configured
+# backend, building the global repository imports shared itself
+from .repository import MemoryRepository
+from .shared import (
+    BATCH_WRITE_METHODS, CONDITIONAL_WRITE_METHODS, DEFAULT_STATE_SOCKET, DELETE_METHODS, HEADER, READ_METHODS,
+    WRITE_METHODS, frame, recv_exactly,
+)
+
+
+class StateRepository(MemoryRepository):
+    """The repository the state server runs calls on.
+
+    Users arrive without their nested tasks, fishes and achievements, which
+    are stored in their own tables anyway, so saving a user leaves them be.
+    """
+
+    def handle(self, method: str, args: tuple):
+        """Run one call and return what goes back to the worker"""
+        if method in READ_METHODS:
+            return getattr(self, method)(*args)
+        if method in WRITE_METHODS:
+            return getattr(self, method)(*args).version
+        if method in BATCH_WRITE_METHODS:
+            return [model.version for model in getattr(self, method)(*args)]
+        if method in CONDITIONAL_WRITE_METHODS:
+            saved = {model.id: model.version for model in getattr(self, method)(*args)}
+            return [saved.get(model.id) for model in args[0]]
+        if method in DELETE_METHODS:
+            return getattr(self, method)(*args)
+        if method == "etag_epoch":
+            # Random per server instance (see MemoryRepository)
+            return self.etag_epoch
+        raise ValueError(f"Unknown repository method: {method}")
+
+
+class StateServer:
+    """Serves a StateRepository to every worker connected to a Unix socket"""
+
+    def __init__(self, path: str, repository: StateRepository | None = None):
+        self.path = path
+        self.repository = repository or StateRepository()
+        self._lock = threading.Lock()
+        self._listener: socket.socket | None = None
+        # user_id -> {event connection of a worker watching the user: its send lock}
+        self._watchers: dict[int, dict[socket.socket, threading.Lock]] = {}
+        self._watchers_lock = threading.Lock()
+
+    def bind(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left behind by a server that did not shut down cleanly
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(128)
+        self._listener = listener
+
+    def serve_forever(self):
+        """Accept workers until close() is called"""
+        if self._listener is None:
+            self.bind()
+        logger.info("State server listening on %s", self.path)
+        while self._listener is not None:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _serve_connection(self, conn: socket.socket):
+        # One thread per connection waits on its socket; the calls themselves
+        # take turns on the lock, so each is atomic against every other
+        with conn:
+            while True:
+                try:
+                    (size,) = HEADER.unpack(recv_exactly(conn, HEADER.size))
+                    method, args = pickle.loads(recv_exactly(conn, size))
+                except OSError:
+                    return
+                if method == "events":
+                    self._relay_events(conn)
+                    return
+                try:
+                    with self._lock:
+                        reply = (True, self.repository.handle(method, args))
+                except DopamineHunterException as e:
+                    reply = (False, e)
+                except Exception as e:
+                    logger.exception("State server call %s failed", method)
+                    reply = (False, RuntimeError(f"State server call {method} failed: {e!r}"))
+                try:
+                    conn.sendall(frame(reply))
+                except OSError:
+                    return
+
+    def _relay_events(self, conn: socket.socket):
+        """Serve a worker's event connection: record its watches and fan out its publishes"""
+        send_lock = threading.Lock()
+        watching = set()
+        try:
+            while True:
+                try:
+                    (size,) = HEADER.unpack(recv_exactly(conn, HEADER.size))
+                    kind, args = pickle.loads(recv_exactly(conn, size))
+                except OSError:
+                    return
+                if kind == "publish":
+                    self._fan_out(*args)
+                    continue
+                (user_id,) = args
+                with self._watchers_lock:
+                    if kind == "watch":
+                        self._watchers.setdefault(user_id, {})[conn] = send_lock
+                        watching.add(user_id)
+                    elif kind == "unwatch":
+                        self._unwatch(user_id, conn)
+                        watching.discard(user_id)
+        finally:
+            with self._watchers_lock:
+                for user_id in watching:
+                    self._unwatch(user_id, conn)
+
+    def _unwatch(self, user_id: int, conn: socket.socket):
+        # Called with self._watchers_lock held
+        watchers = self._watchers.get(user_id)
+        if watchers is not None:
+            watchers.pop(conn, None)
+            if not watchers:
+                del self._watchers[user_id]
+
+    def _fan_out(self, user_id: int, event_type: str, data: dict):
+        """Send an event to every worker watching its user"""
+        with self._watchers_lock:
+            watchers = list(self._watchers.get(user_id, {}).items())
+        if not watchers:
+            return
+        message = frame((user_id, event_type, data))
+        for conn, send_lock in watchers:
+            with send_lock:
+                try:
+                    conn.sendall(message)
+                except OSError:
+                    pass  # its reader sees the connection go and unwatches
+
+
+def main(argv=None) -> int:
+    default = settings.database_url if settings.database_type == "shared" and settings.database_url else DEFAULT_STATE_SOCKET
+    parser = argparse.ArgumentParser(description="Serve shared in-memory state to the workers on this host")
+    parser.add_argument("--socket", default=default, help=f"Unix socket path (default {default})")
+    args = parser.parse_args(argv)
+
+    server = StateServer(args.socket)
+    server.bind()
+    signal.signal(signal.SIGTERM, lambda *_: server.close())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,445 @@
 # in-memory storage
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Callable, Iterator, MutableMapping
+from datetime import datetime, timedelta
 from ..models import User, Achievement, Task, Fish
+from ..services.xp_curve import DEFAULT_XP_CURVE
+
+_MISSING = object()
+
+
+class Table(dict):
+    """A dict of id -> row that keeps secondary indexes in step with it.
+
+    Unique indexes map a key to one row ID; group indexes map a key to a list
+    of the IDs of every row sharing it, in insertion order. Indexes are updated
+    on every insert, replace and delete, including writes made directly through
+    the dict API, so lookups by an indexed key cost a dict probe rather than a
+    scan; deleting a row scans its groups, which are meant to be small (one
+    user's rows, say).
+    Row IDs are also kept sorted so a page of rows after a given ID can be
+    found by bisection. Indexed fields must not be changed in place on a stored row; store the
+    changed row again instead.
+
+    Each group also has a revision that changes whenever one of its rows is
+    stored or deleted, so anything built from a group can tell it is stale
+    without looking at the rows.
+
+    Count indexes keep, for each group of a group index, how many of its rows
+    have each key (say, how many of a user's tasks have each status). The key
+    a row was counted under is remembered, so unlike indexed fields the
+    counted field may be changed in place before the row is stored again.
+    """
+
+    def __init__(self, unique_indexes: dict[str, Callable] | None = None,
+                 group_indexes: dict[str, Callable] | None = None,
+                 count_indexes: dict[str, tuple[str, Callable]] | None = None):
+        super().__init__()
+        self._unique_keys = dict(unique_indexes or {})
+        self._group_keys = dict(group_indexes or {})
+        self._count_keys = dict(count_indexes or {})  # name -> (group index, key)
+        self._counted: dict[str, dict] = {name: {} for name in self._count_keys}  # row ID -> key counted under
+        self._counts: dict[str, dict[object, dict]] = {name: {} for name in self._count_keys}  # group -> key -> count
+        self._unique: dict[str, dict] = {name: {} for name in self._unique_keys}
+        self._groups: dict[str, dict[object, list]] = {name: {} for name in self._group_keys}
+        self._sorted_ids: list = []
+        # Revisions come from one counter that never goes back, even on clear()
+        self._revision = 0
+        self._group_revisions: dict[str, dict] = {name: {} for name in self._group_keys}
+
+    def _touch(self, row):
+        self._revision += 1
+        for name, key in self._group_keys.items():
+            self._group_revisions[name][key(row)] = self._revision
+
+    def _index(self, row_id, row, old=None):
+        for name, key in self._unique_keys.items():
+            self._unique[name][key(row)] = row_id
+        for name, key in self._group_keys.items():
+            if old is not None and key(old) == key(row):
+                continue
+            self._groups[name].setdefault(key(row), []).append(row_id)
+
+    def _unindex(self, row_id, row, new=None):
+        for name, key in self._unique_keys.items():
+            index = self._unique[name]
+            if index.get(key(row)) == row_id:
+                del index[key(row)]
+        for name, key in self._group_keys.items():
+            if new is not None and key(new) == key(row):
+                continue
+            group = self._groups[name].get(key(row))
+            if group is not None:
+                group.remove(row_id)
+                if not group:
+                    del self._groups[name][key(row)]
+
+    def _count(self, row_id, row, sign: int):
+        for name, (group_index, key) in self._count_keys.items():
+            if sign > 0:
+                counted = self._counted[name][row_id] = key(row)
+            else:
+                counted = self._counted[name].pop(row_id)
+            group = self._group_keys[group_index](row)
+            counts = self._counts[name].setdefault(group, {})
+            counts[counted] = counts.get(counted, 0) + sign
+            if not counts[counted]:
+                del counts[counted]
+                if not counts:
+                    del self._counts[name][group]
+
+    def get_by(self, index: str, value):
+        """Return the row whose unique indexed key equals value, or None"""
+        row_id = self._unique[index].get(value)
+        return None if row_id is None else self.get(row_id)
+
+    def page(self, after_id=None, limit: int | None = None) -> list:
+        """Return up to limit rows in ID order, starting after after_id"""
+        start = 0 if after_id is None else bisect_right(self._sorted_ids, after_id)
+        stop = None if limit is None else start + limit
+        return [self[row_id] for row_id in self._sorted_ids[start:stop]]
+
+    def get_group(self, index: str, value) -> list:
+        """Return every row whose grouped key equals value, in insertion order"""
+        group = self._groups[index].get(value)
+        if not group:
+            return []
+        return [self[row_id] for row_id in group]
+
+    def counts(self, index: str, group) -> dict:
+        """How many rows of a group have each key of a count index; keys with none are left out"""
+        return dict(self._counts[index].get(group, {}))
+
+    def group_revision(self, index: str, value) -> int:
+        """Revision of a group; 0 if no row in it has been written since the table was cleared"""
+        return self._group_revisions[index].get(value, 0)
+
+    def __setitem__(self, row_id, row):
+        old = self.get(row_id)
+        if old is not None:
+            self._unindex(row_id, old, new=row)
+            self._count(row_id, old, -1)
+        elif not self._sorted_ids or row_id > self._sorted_ids[-1]:
+            self._sorted_ids.append(row_id)
+        else:
+            insort(self._sorted_ids, row_id)
+        super().__setitem__(row_id, row)
+        self._index(row_id, row, old=old)
+        self._count(row_id, row, 1)
+        if old is not None:
+            self._touch(old)
+        self._touch(row)
+
+    def __delitem__(self, row_id):
+        self._touch(self[row_id])
+        self._unindex(row_id, self[row_id])
+        self._count(row_id, self[row_id], -1)
+        super().__delitem__(row_id)
+        del self._sorted_ids[bisect_right(self._sorted_ids, row_id) - 1]
+
+    def pop(self, row_id, default=_MISSING):
+        if row_id not in self:
+            if default is _MISSING:
+                raise KeyError(row_id)
+            return default
+        row = self[row_id]
+        del self[row_id]
+        return row
+
+    def popitem(self):
+        row_id = next(reversed(self))
+        return row_id, self.pop(row_id)
+
+    def setdefault(self, row_id, default=None):
+        if row_id not in self:
+            self[row_id] = default
+        return self[row_id]
+
+    def update(self, *args, **kwargs):
+        for row_id, row in dict(*args, **kwargs).items():
+            self[row_id] = row
+
+    def clear(self):
+        super().clear()
+        self._sorted_ids.clear()
+        for index in self._unique.values():
+            index.clear()
+        for groups in self._groups.values():
+            groups.clear()
+        for revisions in self._group_revisions.values():
+            revisions.clear()
+        for counted in (*self._counted.values(), *self._counts.values()):
+            counted.clear()
+
+
+# Fish columns and their array typecodes; strings and times are kept apart below
+_FISH_NUMBERS = {
+    "user_id": "q", "level": "i", "xp": "q", "achievements_completed": "i",
+    "tasks_completed": "i", "feed_meter": "b", "alive": "b", "version": "i",
+}
+_FISH_TIMES = ("last_fed", "created_at")
+_FISH_FIELDS = tuple(Fish.model_fields)
+# Naive datetimes are kept as microseconds since this instant
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _sentinel(typecode: str) -> int:
+    """The smallest value of an array typecode, marking a value kept in the overflow dict"""
+    return -(1 << (8 * array(typecode).itemsize - 1))
+
+
+class FishStore(MutableMapping):
+    """Fish state in parallel typed arrays instead of one model object per fish.
+
+    A Fish model takes around a kilobyte; here a fish costs a few bytes per
+    numeric field plus its name, which is what lets an aquarium of millions
+    of fish fit in memory. Rows are kept sorted by ID, so an ID is found by
+    bisection and new fish (whose IDs only grow) are appended. A per-user
+    index holds the IDs of each user's fish.
+
+    It reads and writes like a dict of ``Fish``, but every read builds a new
+    model from the arrays: changing one does not change the store, so store
+    it again instead. Values that do not fit their column (an aware datetime,
+    an integer beyond 64 bits) are kept as they are in a small side dict.
+    Like a Table group, each user's fish have a revision that changes on every
+    write to them.
+
+    Sum indexes keep a running total per user of a number computed from each
+    fish (1 for a living fish, say, to count them). What each fish added is
+    kept in a column of its own, so a store can take it back out.
+    """
+
+    def __init__(self, sum_indexes: dict[str, Callable[[Fish], int]] | None = None):
+        self._ids = array("q")
+        self._numbers = {name: array(typecode) for name, typecode in _FISH_NUMBERS.items()}
+        self._times = {name: array("q") for name in _FISH_TIMES}
+        self._names: list[str] = []
+        self._categories: list[str] = []
+        self._by_user: dict[int, array] = {}
+        self._overflow: dict[tuple[int, str], object] = {}
+        self._sentinels = {name: _sentinel(typecode) for name, typecode in _FISH_NUMBERS.items()}
+        self._time_sentinel = _sentinel("q")
+        self._revision = 0
+        self._user_revisions: dict[int, int] = {}
+        self._sum_keys = dict(sum_indexes or {})
+        self._sum_columns = {name: array("q") for name in self._sum_keys}
+        self._sums: dict[str, dict[int, int]] = {name: {} for name in self._sum_keys}  # name -> user_id -> total
+
+    def _touch(self, user_id: int):
+        self._revision += 1
+        self._user_revisions[user_id] = self._revision
+
+    def _position(self, fish_id: int) -> int:
+        """Index of fish_id in the arrays, or -1"""
+        i = bisect_left(self._ids, fish_id)
+        return i if i < len(self._ids) and self._ids[i] == fish_id else -1
+
+    def _pack(self, fish_id: int, name: str, value, column: array, sentinel: int, i: int, insert: bool):
+        self._overflow.pop((fish_id, name), None)
+        try:
+            if value == sentinel:
+                raise OverflowError
+            packed = int(value)
+            if insert:
+                column.insert(i, packed)
+            else:
+                column[i] = packed
+            return
+        except (OverflowError, TypeError, ValueError):
+            pass
+        self._overflow[(fish_id, name)] = value
+        if insert:
+            column.insert(i, sentinel)
+        else:
+            column[i] = sentinel
+
+    def _add_to_sums(self, fish_id: int, user_id: int, i: int, sign: int):
+        """Add the sum columns of row i to the user's totals (sign 1), or take them out (-1)"""
+        for name, column in self._sum_columns.items():
+            value = column[i]
+            if value == self._time_sentinel:
+                value = self._overflow[(fish_id, "sum:" + name)]
+            totals = self._sums[name]
+            total = totals.get(user_id, 0) + sign * value
+            if total:
+                totals[user_id] = total
+            else:
+                totals.pop(user_id, None)
+
+    def _pack_time(self, value: datetime | None):
+        if value is None or value.tzinfo is not None:
+            return value
+        return (value - _EPOCH) // _MICROSECOND
+
+    def __setitem__(self, fish_id: int, fish: Fish):
+        values = fish.__dict__
+        i = self._position(fish_id)
+        insert = i < 0
+        if insert:
+            i = len(self._ids) if not self._ids or fish_id > self._ids[-1] else bisect_left(self._ids, fish_id)
+            self._ids.insert(i, fish_id)
+            self._names.insert(i, values["name"])
+            self._categories.insert(i, sys.intern(values["category"]))
+        else:
+            old_user = self._numbers["user_id"][i]
+            self._add_to_sums(fish_id, old_user, i, -1)
+            if old_user != values["user_id"]:
+                self._by_user[old_user].remove(fish_id)
+                if not self._by_user[old_user]:
+                    del self._by_user[old_user]
+                self._touch(old_user)
+            self._names[i] = values["name"]
+            self._categories[i] = sys.intern(values["category"])
+        if insert or old_user != values["user_id"]:
+            owned = self._by_user.get(values["user_id"])
+            if owned is None:
+                owned = self._by_user[values["user_id"]] = array("q")
+            if not owned or fish_id > owned[-1]:
+                owned.append(fish_id)
+            else:
+                owned.insert(bisect_left(owned, fish_id), fish_id)
+
+        for name, column in self._numbers.items():
+            self._pack(fish_id, name, values[name], column, self._sentinels[name], i, insert)
+        for name, column in self._times.items():
+            self._pack(fish_id, name, self._pack_time(values[name]), column, self._time_sentinel, i, insert)
+        for name, column in self._sum_columns.items():
+            self._pack(fish_id, "sum:" + name, self._sum_keys[name](fish), column, self._time_sentinel, i, insert)
+        self._add_to_sums(fish_id, values["user_id"], i, 1)
+        self._touch(values["user_id"])
+
+    def _build(self, i: int) -> Fish:
+        fish_id = self._ids[i]
+        values = {"id": fish_id, "name": self._names[i], "category": self._categories[i]}
+        for name, column in self._numbers.items():
+            value = column[i]
+            values[name] = self._overflow[(fish_id, name)] if value == self._sentinels[name] else value
+        values["alive"] = bool(values["alive"])
+        for name, column in self._times.items():
+            value = column[i]
+            if value == self._time_sentinel:
+                values[name] = self._overflow.get((fish_id, name))
+            else:
+                values[name] = _EPOCH + value * _MICROSECOND
+        # Same as Fish.model_construct, at half the cost: the values were validated when stored
+        fish = Fish.__new__(Fish)
+        object.__setattr__(fish, "__dict__", {field: values[field] for field in _FISH_FIELDS})
+        object.__setattr__(fish, "__pydantic_fields_set__", set(_FISH_FIELDS))
+        object.__setattr__(fish, "__pydantic_extra__", None)
+        object.__setattr__(fish, "__pydantic_private__", None)
+        return fish
+
+    def __getitem__(self, fish_id: int) -> Fish:
+        i = self._position(fish_id)
+        if i < 0:
+            raise KeyError(fish_id)
+        return self._build(i)
+
+    def __delitem__(self, fish_id: int):
+        i = self._position(fish_id)
+        if i < 0:
+            raise KeyError(fish_id)
+        user_id = self._numbers["user_id"][i]
+        self._add_to_sums(fish_id, user_id, i, -1)
+        owned = self._by_user[user_id]
+        owned.remove(fish_id)
+        if not owned:
+            del self._by_user[user_id]
+        self._touch(user_id)
+        del self._ids[i], self._names[i], self._categories[i]
+        for column in (*self._numbers.values(), *self._times.values(), *self._sum_columns.values()):
+            del column[i]
+        for name in (*_FISH_NUMBERS, *_FISH_TIMES, *("sum:" + name for name in self._sum_columns)):
+            self._overflow.pop((fish_id, name), None)
+
+    def __contains__(self, fish_id) -> bool:
+        return self._position(fish_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def values(self) -> Iterator[Fish]:
+        """Build every fish, in ID order, one at a time"""
+        return (self._build(i) for i in range(len(self._ids)))
+
+    def page(self, after_id=None, limit: int | None = None) -> list[Fish]:
+        """Return up to limit fish in ID order, starting after after_id"""
+        start = 0 if after_id is None else bisect_right(self._ids, after_id)
+        stop = len(self._ids) if limit is None else min(len(self._ids), start + limit)
+        return [self._build(i) for i in range(start, stop)]
+
+    def for_user(self, user_id: int) -> dict[int, Fish]:
+        """Build a user's fish, keyed by ID in ID order"""
+        owned = self._by_user.get(user_id)
+        if not owned:
+            return {}
+        return {fish_id: self._build(bisect_left(self._ids, fish_id)) for fish_id in owned}
+
+    def has_user(self, user_id: int) -> bool:
+        """Whether a user owns any fish, without building them"""
+        return user_id in self._by_user
+
+    def count_for_user(self, user_id: int) -> int:
+        """How many fish a user owns, without building them"""
+        owned = self._by_user.get(user_id)
+        return len(owned) if owned else 0
+
+    def sum_for_user(self, index: str, user_id: int) -> int:
+        """A user's running total of a sum index"""
+        return self._sums[index].get(user_id, 0)
+
+    def version_of(self, fish_id: int) -> int | None:
+        """A fish's stored version without building it; None if it is not stored"""
+        i = self._position(fish_id)
+        if i < 0:
+            return None
+        value = self._numbers["version"][i]
+        return self._overflow[(fish_id, "version")] if value == self._sentinels["version"] else value
+
+    def user_revision(self, user_id: int) -> int:
+        """Revision of a user's fish; 0 if none has been written since the store was cleared"""
+        return self._user_revisions.get(user_id, 0)
+
+    def copy(self) -> "FishStore":
+        """A snapshot of the store; the arrays are copied in bulk"""
+        clone = FishStore.__new__(FishStore)
+        clone.__dict__.update(self.__dict__)
+        clone._ids = array("q", self._ids)
+        clone._numbers = {name: array(column.typecode, column) for name, column in self._numbers.items()}
+        clone._times = {name: array("q", column) for name, column in self._times.items()}
+        clone._names = list(self._names)
+        clone._categories = list(self._categories)
+        clone._by_user = {user_id: array("q", owned) for user_id, owned in self._by_user.items()}
+        clone._overflow = dict(self._overflow)
+        clone._user_revisions = dict(self._user_revisions)
+        clone._sum_columns = {name: array("q", column) for name, column in self._sum_columns.items()}
+        clone._sums = {name: dict(totals) for name, totals in self._sums.items()}
+        return clone
+
+    def clear(self):
+        revision = self._revision
+        self.__init__(self._sum_keys)
+        self._revision = revision
+
 
 # In-memory storage with proper typing
-users: dict[int, User] = {}  # user_id -> User
-achievements: dict[int, Achievement] = {}  # achievement_id -> Achievement
-tasks: dict[int, Task] = {}  # task_id -> Task
-fishes: dict[int, Fish] = {}  # fish_id -> Fish
\ No newline at end of file
+# The count and sum indexes are the per-user counters behind GET /users/{user_id}/dashboard
+users: Table[int, User] = Table(unique_indexes={"username": lambda user: user.username})  # user_id -> User
+achievements: Table[int, Achievement] = Table(
+    group_indexes={"user_id": lambda achievement: achievement.user_id},
+    count_indexes={"is_completed": ("user_id", lambda achievement: achievement.is_completed)},
+)  # achievement_id -> Achievement
+tasks: Table[int, Task] = Table(
+    group_indexes={"user_id": lambda task: task.user_id},
+    count_indexes={"status": ("user_id", lambda task: task.status)},
+)  # task_id -> Task
+fishes = FishStore(sum_indexes={
+    "living": lambda fish: int(fish.alive),
+    "total_xp": lambda fish: DEFAULT_XP_CURVE.total(fish.level) + fish.xp,
+})  # fish_id -> Fish, kept as columns; users' fishes come from here too
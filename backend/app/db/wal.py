@@ -0,0 +1,467 @@
+"""Snapshot + write-ahead-log persistence for the in-memory backend.
+
+With ``memory_data_dir`` set, the memory backend is a
+``DurableMemoryRepository``: every write made through it is also appended to
+a write-ahead log in that directory, and the tables are periodically written
+out as a snapshot. On startup the latest snapshot is loaded and the log
+written since it is replayed.
+
+The log is a series of segment files (``wal.00000001.log``, ...) of JSON
+lines, one per stored row (``{"put": table, "row": {...}}``) or deleted row
+(``{"del": table, "id": ...}``). A snapshot starts a new segment, then
+copies the stored rows ``SNAPSHOT_CHUNK_SIZE`` at a time, taking the lock
+for each chunk only, and serializes and writes them in the background while
+requests carry on. The snapshot records the segment it was cut at, and
+replaying from there brings every row to its last logged state, including
+rows written while it was being copied.
+
+Appending to the log, and with ``always`` fsyncing it, waits on the disk,
+so the repository is ``blocking``: async callers run it in the thread pool.
+Reads take the same lock as writes, so a read never sees a write half
+applied to the tables.
+
+A log record or snapshot row that no longer validates (say, written by an
+older version with laxer rules) is skipped with a warning on recovery
+rather than stopping the server from starting; ``skipped_records`` counts
+them.
+
+Startup cost is bounded by data size, not history: a snapshot is taken once
+``snapshot_wal_bytes`` of log have built up, so at most about that much log
+is ever replayed. Segments are kept back to the previous snapshot, so the
+``.bak`` copy of the snapshot can still be recovered from.
+
+``wal_fsync`` picks durability against write latency: ``always`` fsyncs
+every write, ``everysec`` (default) fsyncs in the background once a second,
+``no`` leaves it to the OS. Every write reaches the OS before it returns, so
+only a machine crash can lose the unsynced tail.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from ..core.exceptions import CorruptDataFileError
+from ..core.logging import logger
+from ..core.metrics import metrics
+from pydantic import ValidationError
+from ..models import User, Task, Fish, Achievement, UserCounters
+from ..services.id_service import id_service
+from . import storage
+from .files import _fsync_dir, _load_json_file, _save_json_file
+from .repository import MemoryRepository, _USER_CHILDREN
+
+FSYNC_POLICIES = ("always", "everysec", "no")
+SNAPSHOT_FILE = "snapshot.db"
+# Rows a snapshot copies per hold of the repository lock
+SNAPSHOT_CHUNK_SIZE = 1_000
+_SEGMENT_NAME = re.compile(r"^wal\.(\d{8})\.log$")
+
+# Every table a snapshot holds, in the order it is written and replayed
+_TABLES = {"users": User, "tasks": Task, "fishes": Fish, "achievements": Achievement}
+_ID_KINDS = {"users": "user", "tasks": "task", "fishes": "fish", "achievements": "achievement"}
+
+
+def _put_line(table: str, model) -> bytes:
+    row = model.__pydantic_serializer__.to_json(model, exclude=_USER_CHILDREN if table == "users" else None)
+    return b'{"put":"%s","row":%s}\n' % (table.encode(), row)
+
+
+def _delete_line(table: str, row_id: int) -> bytes:
+    return b'{"del":"%s","id":%d}\n' % (table.encode(), row_id)
+
+
+class WriteAheadLog:
+    """Append-only log of row changes, split into numbered segment files"""
+
+    def __init__(self, directory: str, fsync: str = "everysec"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"wal_fsync must be one of {', '.join(FSYNC_POLICIES)}, not {fsync!r}")
+        self.directory = directory
+        self.fsync = fsync
+        self.segment = 0
+        self.bytes_since_snapshot = 0
+        self._file = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal.{segment:08d}.log")
+
+    def segments(self) -> list[int]:
+        """Numbers of the segment files on disk, oldest first"""
+        found = (_SEGMENT_NAME.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def open(self, segment: int):
+        """Start appending to a new segment"""
+        with self._lock:
+            self._open(segment)
+
+    def _open(self, segment: int):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self.segment = segment
+        self._file = open(self.segment_path(segment), "ab")
+        self.bytes_since_snapshot = 0
+        _fsync_dir(self.directory)
+
+    def append(self, lines: bytes):
+        """Write records and hand them to the OS; fsync too if the policy says so"""
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+            self.bytes_since_snapshot += len(lines)
+            if self.fsync == "always":
+                os.fsync(self._file.fileno())
+            else:
+                self._dirty = True
+
+    def rotate(self) -> int:
+        """Close the current segment and start the next for a snapshot; return its number"""
+        with self._lock:
+            self._open(self.segment + 1)
+            return self.segment
+
+    def sync(self):
+        """fsync anything appended since the last sync"""
+        with self._lock:
+            if self._dirty and self._file is not None:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def remove_before(self, segment: int):
+        """Delete segments older than segment"""
+        for number in self.segments():
+            if number < segment:
+                os.remove(self.segment_path(number))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def read(self, segment: int, last: bool):
+        """Yield the records of one segment.
+
+        A crash mid-append leaves a torn final line in the newest segment;
+        it is cut off. Anything unreadable in an older segment means lost
+        history, so that raises CorruptDataFileError instead.
+        """
+        path = self.segment_path(segment)
+        good_offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("torn record")
+                    record = json.loads(line)
+                except ValueError as e:
+                    if not last:
+                        raise CorruptDataFileError(f"{path} is corrupt at byte {good_offset}") from e
+                    logger.warning("Dropping torn write-ahead log tail of %s at byte %d", path, good_offset)
+                    break
+                good_offset += len(line)
+                yield record
+        if last and good_offset < os.path.getsize(path):
+            os.truncate(path, good_offset)
+
+
+class DurableMemoryRepository(MemoryRepository):
+    """Memory repository that logs every write and recovers from disk on startup"""
+
+    # Writes wait on the log file; memory is still current at once, so
+    # there is nothing to gain from deferring user saves
+    blocking = True
+    write_behind = False
+
+    def __init__(self, directory: str, fsync: str = "everysec",
+                 snapshot_wal_bytes: int = 64 * 1024 * 1024, snapshot_interval_seconds: float = 300):
+        super().__init__()
+        # Versions are recovered with the data, so ETags stay valid across restarts
+        self.etag_epoch = 0
+        self.wal = WriteAheadLog(directory, fsync)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.snapshot_wal_bytes = snapshot_wal_bytes
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        self.snapshots = 0
+        self.last_snapshot_seconds = 0.0
+        self.recovery_seconds = 0.0
+        self.skipped_records = 0
+        # Writes apply and log under this lock, so a snapshot sees every
+        # write either in its rows or in the segments after it
+        self._lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._last_snapshot_at = time.monotonic()
+        # The first segment the current snapshot does not cover
+        self._covered_from = 0
+        self.recover()
+
+    # Recovery
+    def recover(self):
+        """Load the snapshot, replay the log after it, and open a fresh segment"""
+        start = time.perf_counter()
+        for table in (storage.users, storage.tasks, storage.fishes, storage.achievements):
+            table.clear()
+        self.skipped_records = 0
+
+        rows = _load_json_file(self.snapshot_path)
+        first_segment = 0
+        if rows:
+            first_segment = rows[0]["segment"]
+            for row in rows[1:]:
+                self._recover_record(row, self.snapshot_path)
+        self._covered_from = first_segment
+
+        segments = [number for number in self.wal.segments() if number >= first_segment]
+        replayed_bytes = sum(os.path.getsize(self.wal.segment_path(number)) for number in segments)
+        records = 0
+        for i, segment in enumerate(segments):
+            for record in self.wal.read(segment, last=i == len(segments) - 1):
+                self._recover_record(record, self.wal.segment_path(segment))
+                records += 1
+
+        for name, kind in _ID_KINDS.items():
+            table = getattr(storage, name)
+            if table:
+                id_service.ensure_above(kind, max(table))
+        self.wal.open(max(segments + [first_segment]) + 1)
+        # Still unsnapshotted, so it counts towards the next snapshot
+        self.wal.bytes_since_snapshot = replayed_bytes
+        self.recovery_seconds = time.perf_counter() - start
+        logger.info("Recovered %d users from %s and %d log records in %.3fs (%d skipped)",
+                    len(storage.users), self.wal.directory, records, self.recovery_seconds, self.skipped_records)
+
+    def _recover_record(self, record: dict, path: str):
+        """Apply one snapshot row or log record, skipping it with a warning if it is invalid"""
+        try:
+            if "table" in record:
+                self._apply_put(record["table"], record["row"])
+            elif "put" in record:
+                self._apply_put(record["put"], record["row"])
+            else:
+                self._apply_delete(record["del"], record["id"])
+        except (KeyError, TypeError, ValidationError) as e:
+            self.skipped_records += 1
+            logger.warning("Skipping invalid record in %s: %s", path, e)
+
+    def _apply_put(self, table: str, row: dict):
+        model = _TABLES[table].model_validate(row)
+        getattr(storage, table)[model.id] = model
+
+    def _apply_delete(self, table: str, row_id: int):
+        getattr(storage, table).pop(row_id, None)
+
+    # Logged writes
+    def add_user(self, user: User) -> User:
+        with self._lock:
+            super().add_user(user)
+            self.wal.append(_put_line("users", user))
+        return user
+
+    def save_user(self, user: User) -> User:
+        with self._lock:
+            super().save_user(user)
+            self.wal.append(_put_line("users", user))
+        return user
+
+    def save_users(self, users: list[User]) -> list[User]:
+        with self._lock:
+            for user in users:
+                MemoryRepository.save_user(self, user)
+            self.wal.append(b"".join(_put_line("users", user) for user in users))
+        return users
+
+    def save_task(self, task: Task) -> Task:
+        with self._lock:
+            super().save_task(task)
+            self.wal.append(_put_line("tasks", task))
+        return task
+
+    def save_tasks(self, tasks: list[Task]) -> list[Task]:
+        with self._lock:
+            for task in tasks:
+                MemoryRepository.save_task(self, task)
+            self.wal.append(b"".join(_put_line("tasks", task) for task in tasks))
+        return tasks
+
+    def delete_task(self, task_id: int) -> bool:
+        with self._lock:
+            if not super().delete_task(task_id):
+                return False
+            self.wal.append(_delete_line("tasks", task_id))
+        return True
+
+    def save_fish(self, fish: Fish) -> Fish:
+        with self._lock:
+            super().save_fish(fish)
+            self.wal.append(_put_line("fishes", fish))
+        return fish
+
+    def save_fishes(self, fishes: list[Fish]) -> list[Fish]:
+        with self._lock:
+            for fish in fishes:
+                MemoryRepository.save_fish(self, fish)
+            self.wal.append(b"".join(_put_line("fishes", fish) for fish in fishes))
+        return fishes
+
+    def save_fishes_if_current(self, fishes: list[Fish]) -> list[Fish]:
+        # Check and write under one hold of the lock
+        with self._lock:
+            return super().save_fishes_if_current(fishes)
+
+    def save_achievement(self, achievement: Achievement) -> Achievement:
+        with self._lock:
+            super().save_achievement(achievement)
+            self.wal.append(_put_line("achievements", achievement))
+        return achievement
+
+    # Reads
+    def get_user(self, user_id: int) -> User | None:
+        with self._lock:
+            return super().get_user(user_id)
+
+    def has_user(self, user_id: int) -> bool:
+        with self._lock:
+            return super().has_user(user_id)
+
+    def get_user_without_children(self, user_id: int) -> User | None:
+        with self._lock:
+            return super().get_user_without_children(user_id)
+
+    def get_user_by_username(self, username: str) -> User | None:
+        with self._lock:
+            return super().get_user_by_username(username)
+
+    def list_users(self, after_id: int | None = None, limit: int | None = None,
+                   fields: set[str] | None = None) -> list[User]:
+        with self._lock:
+            return super().list_users(after_id, limit, fields)
+
+    def get_task(self, task_id: int) -> Task | None:
+        with self._lock:
+            return super().get_task(task_id)
+
+    def list_tasks(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Task]:
+        with self._lock:
+            return super().list_tasks(user_id, after_id, limit)
+
+    def get_fish(self, fish_id: int) -> Fish | None:
+        with self._lock:
+            return super().get_fish(fish_id)
+
+    def list_fishes(self, user_id: int, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        with self._lock:
+            return super().list_fishes(user_id, after_id, limit)
+
+    def scan_fishes(self, after_id: int | None = None, limit: int | None = None) -> list[Fish]:
+        with self._lock:
+            return super().scan_fishes(after_id, limit)
+
+    def get_achievement(self, achievement_id: int) -> Achievement | None:
+        with self._lock:
+            return super().get_achievement(achievement_id)
+
+    def list_achievements(self, user_id: int | None = None, after_id: int | None = None,
+                          limit: int | None = None) -> list[Achievement]:
+        with self._lock:
+            return super().list_achievements(user_id, after_id, limit)
+
+    def get_user_counters(self, user_id: int) -> UserCounters:
+        with self._lock:
+            return super().get_user_counters(user_id)
+
+    # Snapshots
+    def snapshot(self):
+        """Write every table to the snapshot file and drop log segments it makes redundant"""
+        with self._snapshot_lock:
+            start = time.perf_counter()
+            with self._lock:
+                segment = self.wal.rotate()
+            self._last_snapshot_at = time.monotonic()
+
+            # Rows are copied a chunk at a time, letting requests in between.
+            # A row written meanwhile may be copied before or after the write,
+            # but the write is also in a segment from this one on, so replay
+            # still brings it to its last logged state.
+            rows = [{"segment": segment}]
+            for name in _TABLES:
+                table = getattr(storage, name)
+                exclude = _USER_CHILDREN if name == "users" else None
+                after_id = None
+                while True:
+                    with self._lock:
+                        chunk = table.page(after_id, SNAPSHOT_CHUNK_SIZE)
+                        if name != "fishes":
+                            # Shallow copies: every field is a scalar, and later writes must not reach them
+                            chunk = [model.model_copy() for model in chunk]
+                    if not chunk:
+                        break
+                    rows.extend({"table": name, "row": model.model_dump(exclude=exclude)} for model in chunk)
+                    after_id = chunk[-1].id
+            _save_json_file(self.snapshot_path, rows)
+
+            # The snapshot just replaced is now the .bak; keep what it needs
+            self.wal.remove_before(self._covered_from)
+            self._covered_from = segment
+            self.snapshots += 1
+            self.last_snapshot_seconds = time.perf_counter() - start
+            logger.info("Snapshot of %d rows written in %.3fs",
+                        len(rows) - 1, self.last_snapshot_seconds)
+
+    def snapshot_due(self) -> bool:
+        """Whether enough log has built up, or enough time passed since a write, to snapshot"""
+        if self.wal.bytes_since_snapshot >= self.snapshot_wal_bytes:
+            return True
+        return (self.wal.bytes_since_snapshot > 0
+                and time.monotonic() - self._last_snapshot_at >= self.snapshot_interval_seconds)
+
+    async def run_forever(self, check_interval: float = 1.0):
+        """Sync the log and take snapshots when due, until cancelled"""
+        try:
+            while True:
+                await asyncio.sleep(check_interval)
+                try:
+                    if self.wal.fsync == "everysec":
+                        await asyncio.to_thread(self.wal.sync)
+                    if self.snapshot_due():
+                        await asyncio.to_thread(self.snapshot)
+                except Exception:
+                    logger.exception("Write-ahead log sync or snapshot failed")
+        finally:
+            self.wal.sync()
+
+    def close(self):
+        self.wal.close()
+
+
+def _wal_metrics():
+    from .repository import repository
+
+    if not isinstance(repository, DurableMemoryRepository):
+        return
+    yield "# HELP wal_bytes_since_snapshot Write-ahead log bytes a restart would replay"
+    yield "# TYPE wal_bytes_since_snapshot gauge"
+    yield f"wal_bytes_since_snapshot {repository.wal.bytes_since_snapshot}"
+    yield "# HELP snapshots_total Snapshots of the in-memory tables written"
+    yield "# TYPE snapshots_total counter"
+    yield f"snapshots_total {repository.snapshots}"
+    yield "# HELP snapshot_last_duration_seconds Time the last snapshot took"
+    yield "# TYPE snapshot_last_duration_seconds gauge"
+    yield f"snapshot_last_duration_seconds {repository.last_snapshot_seconds}"
+    yield "# HELP recovery_duration_seconds Time startup took to load the snapshot and replay the log"
+    yield "# TYPE recovery_duration_seconds gauge"
+    yield f"recovery_duration_seconds {repository.recovery_seconds}"
+    yield "# HELP recovery_skipped_records Invalid snapshot rows and log records skipped by the last recovery"
+    yield "# TYPE recovery_skipped_records gauge"
+    yield f"recovery_skipped_records {repository.skipped_records}"
+
+
+metrics.register_collector(_wal_metrics)
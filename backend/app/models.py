@@ -21,6 +21,13 @@ class TaskCreate(BaseModel):
     description: str | None = None
     status: TaskStatus = TaskStatus.PENDING
 
+# For sending to the task batch update route; unset fields are left unchanged
+class TaskUpdate(BaseModel):
+    id: int
+    title: str | None = None
+    description: str | None = None
+    status: TaskStatus | None = None
+
 class Task(BaseModel):
     id: int | None = None
     title: str
@@ -29,6 +36,14 @@ class Task(BaseModel):
     created_at: datetime = datetime.now()
     completed_at: datetime | None = None
     user_id: int
+    version: int = Field(default=0, ge=0)  # bumped by the repository on every save
+
+# One entry per item in a task batch response
+class TaskBatchResult(BaseModel):
+    index: int
+    status_code: int
+    task: Task | None = None
+    detail: str | None = None
 
 class Achievement(BaseModel):
     id: int | None = None
@@ -48,6 +63,8 @@ class Achievement(BaseModel):
     total_required: int | None = None
     total_completed: int | None = 0
 
+    version: int = Field(default=0, ge=0)  # bumped by the repository on every save
+
 # For sending to the fish create route
 class FishCreate(BaseModel):
     name: str
@@ -66,6 +83,7 @@ class Fish(BaseModel):
     last_fed: datetime | None = None
     alive: bool = True
     created_at: datetime = Field(default_factory=datetime.now)
+    version: int = Field(default=0, ge=0)  # bumped by the repository on every save
 
 # For sending to the user create route
 class UserCreate(BaseModel):
@@ -82,3 +100,15 @@ class User(BaseModel):
     last_login: datetime | None = None
     total_visits: int = 0  # total number of page visits recorded for streaks
     best_streak: int = 0
+    version: int = Field(default=0, ge=0)  # bumped by the repository on every save; children have their own
+
+# What the dashboard shows of a user's tasks, fishes and achievements, without the rows themselves
+class UserCounters(BaseModel):
+    pending_tasks: int = 0
+    completed_tasks: int = 0
+    cancelled_tasks: int = 0
+    fishes: int = 0
+    living_fishes: int = 0
+    total_xp: int = 0  # XP every fish has earned since level 1, not just towards its next level
+    achievements: int = 0
+    completed_achievements: int = 0
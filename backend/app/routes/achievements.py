@@ -1,21 +1,29 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query
 from ..models import Achievement
-from ..db.storage import achievements
+from ..db.async_repository import async_repository
 from ..core.exceptions import AchievementNotFoundError
+from .responses import conditional_response
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, parse_fields, page_response
 
 router = APIRouter()
 
 @router.get("/", response_model=list[Achievement])
-async def get_achievements_endpoint(user_id: int | None = Query(None)):
-    """Get all achievements, optionally filtered by user_id"""
-    if user_id:
-        return [achievement for achievement in achievements.values() if achievement.user_id == user_id]
-    return list(achievements.values())
+async def get_achievements_endpoint(
+    user_id: int | None = Query(None),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    if_none_match: str | None = Header(None)
+):
+    """Get a page of achievements, optionally filtered by user_id"""
+    projection = parse_fields(fields, Achievement)
+    rows = await async_repository.list_achievements(user_id, after_id=decode_cursor(cursor), limit=limit + 1)
+    return page_response(rows, limit, projection, if_none_match)
 
 @router.get("/{achievement_id}", response_model=Achievement)
-async def get_achievement_endpoint(achievement_id: int):
+async def get_achievement_endpoint(achievement_id: int, if_none_match: str | None = Header(None)):
     """Get a specific achievement by ID"""
-    achievement = achievements.get(achievement_id)
+    achievement = await async_repository.get_achievement(achievement_id)
     if not achievement:
         raise HTTPException(status_code=404, detail="Achievement not found")
-    return achievement
+    return conditional_response(achievement, if_none_match)
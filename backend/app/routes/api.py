@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from . import users, tasks, achievements, fish
+from . import users, tasks, achievements, fish, events
 
 api_router = APIRouter()
 
@@ -7,3 +7,4 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
 api_router.include_router(achievements.router, prefix="/achievements", tags=["achievements"])
 api_router.include_router(fish.router, tags=["fish"])
+api_router.include_router(events.router, tags=["events"])
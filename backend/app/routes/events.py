@@ -0,0 +1,52 @@
+"""Server-sent event streams of a user's fish, task and streak changes.
+
+``GET /users/{user_id}/events`` stays open and pushes one SSE message per
+event (``fish.fed``, ``fish.level_up``, ``fish.died``, ``task.completed``,
+``streak.updated``), with the event type as the SSE ``event`` name and the
+changed state as JSON ``data``. A ``resync`` event means the client fell
+behind and some events were dropped, so it should refetch. Idle streams get
+a comment line every ``EVENT_KEEPALIVE_SECONDS``.
+"""
+
+from collections.abc import AsyncIterator
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+from ..core.config import settings
+from ..core.events import Event, Subscription, event_bus
+from ..db.async_repository import async_repository
+
+router = APIRouter()
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def format_event(event: Event) -> bytes:
+    """Encode an event as one SSE message"""
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event.id, event.type.encode(), to_json(event.data))
+
+
+async def event_stream(subscription: Subscription, keepalive: float) -> AsyncIterator[bytes]:
+    """Yield SSE messages for a subscription until the client goes away"""
+    try:
+        # Tell the client how long to wait before reconnecting, and flush headers now
+        yield b"retry: 3000\n\n"
+        while True:
+            event = await subscription.get(keepalive)
+            yield KEEPALIVE if event is None else format_event(event)
+    finally:
+        subscription.close()
+
+
+@router.get("/users/{user_id}/events")
+async def user_events_endpoint(user_id: int):
+    """Stream a user's state changes as server-sent events"""
+    if not await async_repository.has_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    subscription = event_bus.subscribe(user_id)
+    return StreamingResponse(
+        event_stream(subscription, settings.event_keepalive_seconds),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
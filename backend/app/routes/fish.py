@@ -1,17 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query
 from ..models import Fish, FishCreate
-from ..db.storage import users, fishes
+from ..db.async_repository import async_repository
 from ..services.id_service import id_service
 from ..services.fish_service import FishService
+from ..services.decay_service import decay_job
 from ..core.exceptions import UserNotFoundError, FishNotFoundError
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, parse_fields, page_response
 
 router = APIRouter()
 
 @router.post("/users/{user_id}/fish", response_model=Fish)
 async def create_fish_endpoint(user_id: int, fish: FishCreate):
     """Create a new fish for a user"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
     fish_obj = Fish(
@@ -20,79 +21,88 @@ async def create_fish_endpoint(user_id: int, fish: FishCreate):
         category=fish.category, 
         user_id=user_id
     )
-    user.fishes[fish_obj.id] = fish_obj
-    fishes[fish_obj.id] = fish_obj
+    await async_repository.add_fish(fish_obj)
     return fish_obj
 
 @router.post("/users/{user_id}/fish/{fish_id}/complete_task", response_model=Fish)
 async def complete_task_endpoint(user_id: int, fish_id: int, num_tasks: int = 1):
     """Complete tasks for a fish"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    fish = user.fishes.get(fish_id)
-    if not fish:
+    fish = await async_repository.get_fish(fish_id)
+    if not fish or fish.user_id != user_id:
         raise HTTPException(status_code=404, detail="Fish not found")
 
     # Use service layer for business logic
+    level = fish.level
     FishService.complete_task(fish, num_tasks)
+    await async_repository.save_fish(fish)
+    if fish.level != level:
+        FishService.notify_level_up(fish)
     return fish
 
 @router.post("/users/{user_id}/fish/{fish_id}/complete_achievement", response_model=Fish)
 async def complete_achievement_endpoint(user_id: int, fish_id: int):
     """Complete an achievement for a fish"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    fish = user.fishes.get(fish_id)
-    if not fish:
+    fish = await async_repository.get_fish(fish_id)
+    if not fish or fish.user_id != user_id:
         raise HTTPException(status_code=404, detail="Fish not found")
 
     # Use service layer for business logic
     FishService.complete_achievement(fish)
+    await async_repository.save_fish(fish)
     return fish
 
 @router.post("/users/{user_id}/feed_all")
 async def feed_all_fish_endpoint(user_id: int):
     """Feed all fishes for a user"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    fed_today = False
-    for fish in user.fishes.values():
-        if fish.alive:
-            FishService.feed(fish)
-            fed_today = True
+    fish_list = await async_repository.list_fishes(user_id)
+    fed = [fish for fish in fish_list if fish.alive]
+    for fish in fed:
+        FishService.feed(fish)
+    await async_repository.save_fishes(fed)
+    for fish in fed:
+        FishService.notify_fed(fish)
+    fed_today = bool(fed)
 
     return {
         "message": "All fishes fed!",
-        "fishes_fed": len([f for f in user.fishes.values() if f.alive]),
+        "fishes_fed": len([f for f in fish_list if f.alive]),
         "fed_today": fed_today
     }
 
 @router.post("/users/{user_id}/daily_feed_check")
 async def daily_feed_check_endpoint(user_id: int):
-    """Perform daily feed check for all user's fishes"""
-    user = users.get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    """Run today's fish decay if no one has yet, and report the user's deaths from it.
 
-    deaths = 0
-    for fish in user.fishes.values():
-        FishService.daily_feed_check(fish)
-        if not fish.alive:
-            deaths += 1
+    Goes through the daily decay job, so fishes decay at most once a day
+    however often this is called; once today's pass has run, this is a no-op.
+    """
+    if not await async_repository.has_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
 
-    return {"deaths_today": deaths}
+    result = await decay_job.run_async()
+    return {"deaths_today": result["deaths_by_user"].get(user_id, 0) if result else 0}
 
 @router.get("/users/{user_id}/fishes", response_model=list[Fish])
-async def get_user_fishes_endpoint(user_id: int):
-    """Get all fishes for a user"""
-    user = users.get(user_id)
-    if not user:
+async def get_user_fishes_endpoint(
+    user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    if_none_match: str | None = Header(None)
+):
+    """Get a page of fishes for a user"""
+    projection = parse_fields(fields, Fish)
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    return list(user.fishes.values())
\ No newline at end of file
+    rows = await async_repository.list_fishes(user_id, after_id=decode_cursor(cursor), limit=limit + 1)
+    return page_response(rows, limit, projection, if_none_match)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""Cursor pagination and field projection shared by the list endpoints.
+
+List endpoints return at most ``limit`` items. When more remain, the
+``X-Next-Cursor`` response header carries an opaque cursor to pass back as
+``?cursor=`` for the next page. ``?fields=id,username`` trims each item to
+the named fields, which skips serializing anything else (for example a user's
+nested tasks, achievements and fishes).
+
+Pages are returned as ``ModelJSONResponse``, serialized straight from the
+stored models without going through the route's response_model, and carry
+an ETag so an unchanged page can be answered with 304.
+"""
+
+import base64
+import binascii
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from .responses import conditional_response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the ID of the last item on a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> int | None:
+    """Decode a cursor back into the ID to continue after"""
+    if cursor is None:
+        return None
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, _, last_id = decoded.partition(":")
+        if prefix == "id":
+            return int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> set[str] | None:
+    """Parse a comma-separated fields parameter, rejecting unknown names"""
+    if fields is None:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def page_response(rows: list, limit: int, fields: set[str] | None = None,
+                  if_none_match: str | None = None) -> Response:
+    """Build a page from rows fetched with one extra look-ahead row.
+
+    The look-ahead row is dropped and turned into the next-page cursor.
+    """
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return conditional_response(rows, if_none_match, headers=headers, include=fields)
@@ -0,0 +1,193 @@
+"""JSON responses serialized straight from stored models.
+
+A route that returns models has FastAPI validate them again against its
+response_model and then serialize the result, which for a User means every
+nested task, achievement and fish twice over. Models coming out of the
+repository were validated when they were built, so routes opt out of that by
+returning a ``ModelJSONResponse``: each model goes to JSON bytes through its
+own pydantic-core serializer, and the bytes are kept for the next response
+of the same stored version. Keep ``response_model`` on the route for the
+OpenAPI schema.
+
+FastAPI itself already lets model instances through validation unchanged and
+dumps them in Rust, so the saving comes from the cache: models that have not
+been saved since the last response cost a version lookup instead of a dump,
+even when the backend builds a new object on every read, as it does for
+fish. SQLite workers saving one row at once may both store the same next
+version, so there the cache is off and each response is one ``dump_json``
+call, as in FastAPI.
+
+Responses also carry an ETag derived from the ``version`` of every model in
+them (nested children included), and a request whose ``If-None-Match``
+still matches gets a 304 without anything being serialized.
+"""
+
+from functools import lru_cache
+from hashlib import blake2b
+from typing import get_args, get_origin
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from ..core.metrics import metrics
+from ..db.repository import MemoryRepository, repository
+from ..db.shared import SharedRepository
+
+# Upper bound on cached encodings; the cache is dropped wholesale when full
+MAX_CACHED_MODELS = 100_000
+
+def _may_contain(annotation) -> bool:
+    """Whether values of this type can change without being reassigned"""
+    if get_origin(annotation) in (dict, list, set, tuple):
+        return True
+    if isinstance(annotation, type):
+        return issubclass(annotation, (BaseModel, dict, list, set))
+    return any(_may_contain(arg) for arg in get_args(annotation))
+
+
+@lru_cache(maxsize=None)
+def _container_fields(model_class: type[BaseModel]) -> tuple[str, ...]:
+    """Names of fields that may hold dicts, lists or models rather than scalars"""
+    return tuple(name for name, field in model_class.model_fields.items() if _may_contain(field.annotation))
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model_class: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model_class])
+
+
+class EncodedCache:
+    """JSON bytes of stored models, keyed by what their ETags are built from.
+
+    Every save bumps a model's version, so its type, ID and version, with
+    those of every model nested in it (a user's children change without the
+    user being saved), identify its content. An encoding is therefore reused
+    for any object with the same key, including a fresh copy of the same
+    row. The repository's ``etag_epoch`` is part of the key, so rows that
+    reuse old IDs and versions after a restart of the state server are not
+    mistaken for the old ones. Models never stored (version 0) or without a
+    version are encoded afresh every time.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_MODELS, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: dict[tuple, bytes] = {}
+
+    def encode(self, model: BaseModel) -> bytes:
+        """Return model as JSON bytes, reusing the encoding of the same stored version"""
+        values = model.__dict__
+        version = values.get("version")
+        if not version:
+            self.misses += 1
+            return model.__pydantic_serializer__.to_json(model)
+        model_class = type(model)
+        if _container_fields(model_class):
+            key = (model_class, repository.etag_epoch, _version_key(model))
+        else:
+            key = (model_class, repository.etag_epoch, values["id"], version)
+        encoded = self._entries.get(key)
+        if encoded is not None:
+            self.hits += 1
+            return encoded
+
+        self.misses += 1
+        encoded = model.__pydantic_serializer__.to_json(model)
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = encoded
+        return encoded
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _version_key(value):
+    """IDs and versions of a model and everything nested in it"""
+    if isinstance(value, BaseModel):
+        containers = _container_fields(type(value))
+        if not containers:
+            return value.id, value.version
+        return value.id, value.version, tuple([_version_key(getattr(value, name)) for name in containers])
+    if isinstance(value, dict):
+        return tuple(map(_version_key, value.values()))
+    if isinstance(value, (list, tuple)):
+        return tuple(map(_version_key, value))
+    return value
+
+
+def make_etag(content, *extra) -> str:
+    """ETag for a model or list of models; extra distinguishes other inputs to the body or headers"""
+    # repr + blake2b rather than hash(): str hashes differ between worker processes
+    key = repr((repository.etag_epoch, _version_key(content), extra)).encode()
+    return f'"{blake2b(key, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header lists etag (weak comparison, as RFC 9110 asks)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ModelJSONResponse(Response):
+    """JSON response for a model or a list of models, skipping response_model.
+
+    Only pass models that came from storage or were built by the route;
+    they are serialized as they are, without being validated again. With
+    ``include`` each model is trimmed to those fields and not cached.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, content, status_code: int = 200, headers=None,
+                 include: set[str] | None = None, background: BackgroundTask | None = None):
+        self.include = include
+        super().__init__(content, status_code=status_code, headers=headers, background=background)
+
+    def render(self, content) -> bytes:
+        cached = encoded_cache.enabled and self.include is None
+        if isinstance(content, BaseModel):
+            if cached:
+                return encoded_cache.encode(content)
+            return content.__pydantic_serializer__.to_json(content, include=self.include)
+        if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+            model_class = type(content[0])
+            if all(type(item) is model_class for item in content):
+                if cached:
+                    return b"[" + b",".join(map(encoded_cache.encode, content)) + b"]"
+                include = None if self.include is None else {"__all__": self.include}
+                return _list_adapter(model_class).dump_json(content, include=include)
+        return to_json(content)
+
+
+def conditional_response(content, if_none_match: str | None, headers: dict | None = None,
+                         include: set[str] | None = None) -> Response:
+    """A ModelJSONResponse with an ETag, or an empty 304 if the client's copy is current"""
+    headers = dict(headers or {})
+    headers["ETag"] = make_etag(content, tuple(sorted(include)) if include is not None else None,
+                                tuple(headers.items()))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return ModelJSONResponse(content, headers=headers, include=include)
+
+
+def _cache_metrics():
+    yield "# HELP response_cache_hits_total Responses encoded from cached model JSON"
+    yield "# TYPE response_cache_hits_total counter"
+    yield f"response_cache_hits_total {encoded_cache.hits}"
+    yield "# HELP response_cache_misses_total Models serialized afresh for a response"
+    yield "# TYPE response_cache_misses_total counter"
+    yield f"response_cache_misses_total {encoded_cache.misses}"
+
+
+# Global instance; on for backends that assign versions under one lock
+encoded_cache = EncodedCache(enabled=isinstance(repository, (MemoryRepository, SharedRepository)))
+metrics.register_collector(_cache_metrics)
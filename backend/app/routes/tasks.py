@@ -1,25 +1,52 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query
 from datetime import datetime
-from ..models import Task, TaskStatus, TaskCreate
-from ..db.storage import users, tasks
+from ..models import Task, TaskStatus, TaskCreate, TaskUpdate, TaskBatchResult
+from ..db.async_repository import async_repository
 from ..services.id_service import id_service
+from ..core.events import event_bus
 from ..core.exceptions import UserNotFoundError, TaskNotFoundError
+from .responses import conditional_response
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, parse_fields, page_response
 
 router = APIRouter()
 
+# Largest number of items accepted by one batch request
+MAX_BATCH_SIZE = 1000
+
+def _mark_completion(task: Task, previous_status: TaskStatus) -> bool:
+    """Set completion time if a task is being completed, returning whether it was"""
+    if task.completed_at is None and previous_status != TaskStatus.COMPLETED and task.status == TaskStatus.COMPLETED:
+        task.completed_at = datetime.now()
+        return True
+    return False
+
+def _publish_completed(task: Task):
+    """Announce a completion; call only once the task is saved"""
+    event_bus.publish(task.user_id, "task.completed", {"task_id": task.id, "completed_at": task.completed_at})
+
+def _check_batch_size(items: list):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_SIZE} items")
+
 @router.get("/users/{user_id}/tasks", response_model=list[Task])
-async def get_tasks_endpoint(user_id: int):
-    """Get all tasks for a specific user"""
-    user = users.get(user_id)
-    if not user:
+async def get_tasks_endpoint(
+    user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    if_none_match: str | None = Header(None)
+):
+    """Get a page of tasks for a specific user"""
+    projection = parse_fields(fields, Task)
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
-    return list(user.tasks.values())
+    rows = await async_repository.list_tasks(user_id, after_id=decode_cursor(cursor), limit=limit + 1)
+    return page_response(rows, limit, projection, if_none_match)
 
 @router.post("/users/{user_id}/tasks", response_model=Task)
 async def create_task_endpoint(user_id: int, task: TaskCreate):
     """Create a new task"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
     task_obj = Task(
@@ -29,58 +56,112 @@ async def create_task_endpoint(user_id: int, task: TaskCreate):
         status=task.status, 
         user_id=user_id
     )
-    user.tasks[task_obj.id] = task_obj
-    tasks[task_obj.id] = task_obj
+    await async_repository.add_task(task_obj)
     return task_obj
 
 @router.get("/users/{user_id}/tasks/{task_id}", response_model=Task)
-async def get_task_endpoint(user_id: int, task_id: int):
+async def get_task_endpoint(user_id: int, task_id: int, if_none_match: str | None = Header(None)):
     """Get a specific task by ID"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    task = user.tasks.get(task_id)
-    if not task:
+    task = await async_repository.get_task(task_id)
+    if not task or task.user_id != user_id:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    return task
+    return conditional_response(task, if_none_match)
 
 @router.put("/users/{user_id}/tasks/{task_id}", response_model=Task)
 async def update_task_endpoint(user_id: int, task_id: int, task_update: Task):
     """Update a task"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
-    task = user.tasks.get(task_id)
-    if not task:
+    task = await async_repository.get_task(task_id)
+    if not task or task.user_id != user_id:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    # Preserve original creation time
+    # Preserve original creation time and version
     task_update.created_at = task.created_at
+    task_update.version = task.version
     task_update.id = task_id
     task_update.user_id = user_id
     
     # Set completion time if task is being completed
-    if task_update.completed_at is None and task.status != TaskStatus.COMPLETED and task_update.status == TaskStatus.COMPLETED:
-        task_update.completed_at = datetime.now()
+    completed = _mark_completion(task_update, task.status)
     
-    user.tasks[task_id] = task_update
-    tasks[task_id] = task_update
+    await async_repository.save_task(task_update)
+    if completed:
+        _publish_completed(task_update)
     return task_update
 
 @router.delete("/users/{user_id}/tasks/{task_id}")
 async def delete_task_endpoint(user_id: int, task_id: int):
     """Delete a task"""
-    user = users.get(user_id)
-    if not user:
+    if not await async_repository.has_user(user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    task = user.tasks.get(task_id)
-    if not task:
+    task = await async_repository.get_task(task_id)
+    if not task or task.user_id != user_id:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    user.tasks.pop(task_id)
-    tasks.pop(task_id, None)
-    return {"message": "Task deleted successfully"}
\ No newline at end of file
+    await async_repository.delete_task(task_id)
+    return {"message": "Task deleted successfully"}
+
+@router.post("/users/{user_id}/tasks:batch", response_model=list[TaskBatchResult])
+async def create_tasks_batch_endpoint(user_id: int, items: list[TaskCreate]):
+    """Create many tasks in one request and one storage transaction"""
+    _check_batch_size(items)
+    if not await async_repository.has_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    task_ids = id_service.reserve("task", len(items))
+    created = [
+        Task(
+            id=task_id,
+            title=item.title,
+            description=item.description,
+            status=item.status,
+            user_id=user_id
+        )
+        for task_id, item in zip(task_ids, items)
+    ]
+    await async_repository.add_tasks(created)
+    return [TaskBatchResult(index=i, status_code=200, task=task) for i, task in enumerate(created)]
+
+@router.patch("/users/{user_id}/tasks:batch", response_model=list[TaskBatchResult])
+async def update_tasks_batch_endpoint(user_id: int, items: list[TaskUpdate]):
+    """Apply partial updates to many tasks in one request and one storage transaction.
+
+    Items that name a missing task, or another user's task, get a 404 result and
+    are skipped; the rest are still applied.
+    """
+    _check_batch_size(items)
+    if not await async_repository.has_user(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    updated: dict[int, Task] = {}
+    completed: set[int] = set()
+    results = []
+    for i, item in enumerate(items):
+        task = updated.get(item.id) or await async_repository.get_task(item.id)
+        if not task or task.user_id != user_id:
+            results.append(TaskBatchResult(index=i, status_code=404, detail="Task not found"))
+            continue
+        # title and status cannot be cleared, so an explicit null leaves them unchanged
+        changes = {
+            field: value for field, value in item.model_dump(exclude_unset=True, exclude={"id"}).items()
+            if value is not None or field == "description"
+        }
+        changed = task.model_copy(update=changes)
+        if _mark_completion(changed, task.status):
+            completed.add(item.id)
+        updated[item.id] = changed
+        results.append(TaskBatchResult(index=i, status_code=200, task=changed))
+
+    await async_repository.save_tasks(list(updated.values()))
+    for task_id in completed:
+        # A later item may have reopened the task within the same batch
+        if updated[task_id].status == TaskStatus.COMPLETED:
+            _publish_completed(updated[task_id])
+    return results
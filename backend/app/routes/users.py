@@ -1,48 +1,56 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query
 from ..models import User, UserCreate
-from ..db.storage import users
+from ..db.async_repository import async_repository
 from ..services.id_service import id_service
 from ..services.user_service import UserService
-from ..core.exceptions import UserNotFoundError, DuplicateUsernameError
+from ..core.exceptions import DuplicateUsernameError
 from ..core.logging import logger
-from datetime import datetime
+from .responses import conditional_response
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, parse_fields, page_response
 
 router = APIRouter()
 
 @router.get("/", response_model=list[User])
-async def get_users_endpoint():
-    """Get all users"""
+async def get_users_endpoint(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    if_none_match: str | None = Header(None)
+):
+    """Get a page of users, optionally projected to a subset of fields"""
     logger.info("Retrieving all users")
-    return list(users.values())
+    projection = parse_fields(fields, User)
+    rows = await async_repository.list_users(
+        after_id=decode_cursor(cursor), limit=limit + 1, fields=projection
+    )
+    return page_response(rows, limit, projection, if_none_match)
 
 @router.post("/", response_model=User)
 async def create_user_endpoint(user: UserCreate):
     """Create a new user"""
-    logger.info(f"Creating new user: {user.username}")
-    
-    # Check for duplicate username
-    for existing_user in users.values():
-        if existing_user.username == user.username:
-            logger.warning(f"Attempted to create user with existing username: {user.username}")
-            raise HTTPException(
-                status_code=400, 
-                detail="Username already exists"
-            )
+    logger.info("Creating new user: %s", user.username)
     
     user_obj = User(id=id_service.generate_user_id(), username=user.username)
-    users[user_obj.id] = user_obj
-    logger.info(f"Successfully created user with ID: {user_obj.id}")
+    try:
+        await async_repository.add_user(user_obj)
+    except DuplicateUsernameError:
+        logger.warning("Attempted to create user with existing username: %s", user.username)
+        raise HTTPException(
+            status_code=400, 
+            detail="Username already exists"
+        )
+    logger.info("Successfully created user with ID: %s", user_obj.id)
     return user_obj
 
 @router.get("/{user_id}", response_model=User)
-async def get_user_endpoint(user_id: int):
+async def get_user_endpoint(user_id: int, if_none_match: str | None = Header(None)):
     """Get a specific user by ID"""
-    logger.info(f"Retrieving user with ID: {user_id}")
-    user = users.get(user_id)
+    logger.info("Retrieving user with ID: %s", user_id)
+    user = await async_repository.get_user(user_id)
     if not user:
-        logger.warning(f"User not found with ID: {user_id}")
+        logger.warning("User not found with ID: %s", user_id)
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return conditional_response(user, if_none_match)
 
 
 @router.post("/{user_id}/login", response_model=User) #pen + ai addition
@@ -52,11 +60,12 @@ async def login_endpoint(user_id: int):
     Note: This is a placeholder for a real authentication flow. Replace with proper
     password checks and token issuance in a production app.
     """
-    user = users.get(user_id)
+    user = await async_repository.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     UserService.update_login_streak(user)
+    await async_repository.save_user(user)
     return user
 
 
@@ -66,7 +75,7 @@ async def streak_visit(user_id: int):
 
     Follows the contract in frontend-documentation/backend-integration.md
     """
-    stats = UserService.record_streak_visit(user_id)
+    stats = await UserService.record_streak_visit(user_id)
     if stats is None:
         raise HTTPException(status_code=404, detail="User not found")
     return stats
@@ -74,16 +83,23 @@ async def streak_visit(user_id: int):
 @router.get("/{user_id}/streak/streak")
 async def get_streak(user_id: int):
     """Get the current login streak for a user."""
-    stats = UserService.get_streak(user_id)
+    stats = await UserService.get_streak(user_id)
     if stats is None:
         raise HTTPException(status_code=404, detail="User not found")
     return stats
 
 @router.get("/{user_id}/stats/last-visit")
-async
-def get_last_visit(user_id: int):
+async def get_last_visit(user_id: int):
     """Get the last visit date for a user."""
-    stats = UserService.get_last_visit(user_id)
+    stats = await UserService.get_last_visit(user_id)
     if stats is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return stats
\ No newline at end of file
+    return stats
+
+@router.get("/{user_id}/dashboard")
+async def get_dashboard(user_id: int):
+    """Get the counts and streak stats the home page shows, in one request."""
+    dashboard = await UserService.get_dashboard(user_id)
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return dashboard
@@ -0,0 +1,256 @@
+"""Daily fish decay, applied to every user's fishes in one batch pass"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import Counter
+from functools import partial
+from datetime import date, datetime, time, timedelta
+from ..core.config import settings
+from ..core.file_lock import locked
+from ..core.logging import logger
+from ..db.repository import repository
+from ..models import Fish
+from .fish_service import FishService
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives the same results
+    np = None
+
+FEED_DECAY_PER_DAY = 2
+DEFAULT_CHUNK_SIZE = 100_000
+# Fishes per chunk when the pass runs on the event loop, which it gives back after each chunk
+LOOP_CHUNK_SIZE = 1_000
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "data", "decay.json")
+
+
+class FishColumns:
+    """Column-oriented view of the decay state of a list of fishes.
+
+    Holds one array per field the decay rule reads (feed meter, day last fed,
+    alive) so the rule runs as a handful of whole-array operations instead of
+    a Python branch per fish. Uses NumPy when it is installed.
+    """
+
+    def __init__(self, fishes: list[Fish]):
+        self.fishes = fishes
+        # Day ordinals; 0 means never fed
+        last_fed = [fish.last_fed.toordinal() if fish.last_fed else 0 for fish in fishes]
+        feed_meter = [fish.feed_meter for fish in fishes]
+        alive = [fish.alive for fish in fishes]
+        if np is not None:
+            self.last_fed = np.array(last_fed, dtype=np.int64)
+            self.feed_meter = np.array(feed_meter, dtype=np.int64)
+            self.alive = np.array(alive, dtype=bool)
+        else:
+            self.last_fed, self.feed_meter, self.alive = last_fed, feed_meter, alive
+
+    def decay(self, today: date) -> tuple[list[int], list[int]]:
+        """Apply one daily feed check to every column.
+
+        Returns the positions of fishes whose state changed and of fishes that
+        died, and writes the new values back to those fishes only.
+        """
+        day = today.toordinal()
+        if np is not None:
+            hungry = self.alive & (self.last_fed > 0) & (self.last_fed < day)
+            feed_meter = np.maximum(self.feed_meter - FEED_DECAY_PER_DAY * hungry, 0)
+            died = self.alive & (feed_meter <= 0)
+            changed = np.flatnonzero(hungry | died).tolist()
+            died = np.flatnonzero(died).tolist()
+            feed_meter = feed_meter.tolist()
+        else:
+            feed_meter = list(self.feed_meter)
+            changed, died = [], []
+            for i, (alive, last_fed) in enumerate(zip(self.alive, self.last_fed)):
+                if not alive:
+                    continue
+                hungry = 0 < last_fed < day
+                if hungry:
+                    feed_meter[i] = max(0, feed_meter[i] - FEED_DECAY_PER_DAY)
+                if feed_meter[i] <= 0:
+                    died.append(i)
+                    changed.append(i)
+                elif hungry:
+                    changed.append(i)
+
+        for i in changed:
+            self.fishes[i].feed_meter = feed_meter[i]
+        for i in died:
+            self.fishes[i].alive = False
+        return changed, died
+
+
+def decay_fishes(fishes: list[Fish], today: date | None = None) -> tuple[list[Fish], list[Fish]]:
+    """Run the daily feed check over fishes; return (changed, died).
+
+    Nothing is saved or announced; callers save the changed fishes and then
+    notify owners of the deaths.
+    """
+    if not fishes:
+        return [], []
+    changed, died = FishColumns(fishes).decay(today or datetime.now().date())
+    return [fishes[i] for i in changed], [fishes[i] for i in died]
+
+
+class DailyDecayJob:
+    """Applies fish decay across all users at most once per calendar day.
+
+    The day last processed is kept in memory, or with a ``state_file`` in a
+    small JSON file locked for the whole pass, so that only one of several
+    worker processes runs each day's pass. A day is recorded as processed
+    only once its pass finishes; until then the file holds the last fish ID
+    done, so a pass cut short resumes where it stopped.
+    """
+
+    def __init__(self, repository, state_file: str | None = None, chunk_size: int | None = None):
+        self.repository = repository
+        self.state_file = state_file
+        self.chunk_size = chunk_size or (DEFAULT_CHUNK_SIZE if repository.blocking else LOOP_CHUNK_SIZE)
+        self.last_run: date | None = None
+        self._state: dict = {}
+        # Held for a whole pass, so a second caller in this process skips rather than repeats it
+        self._running = threading.Lock()
+
+    def run(self, today: date | None = None) -> dict | None:
+        """Decay every fish once for today; None if today was already processed or is in progress elsewhere"""
+        steps = self.steps(today)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+
+    async def run_async(self, today: date | None = None) -> dict | None:
+        """Like run, without blocking the event loop.
+
+        Blocking backends are processed in a worker thread. The in-memory one
+        runs on the event loop, one chunk at a time, letting requests in
+        between chunks; a fish they write is re-read rather than overwritten.
+        """
+        if self.repository.blocking:
+            return await asyncio.to_thread(self.run, today)
+        steps = self.steps(today)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+            await asyncio.sleep(0)
+
+    def steps(self, today: date | None = None):
+        """Generator doing the work of run, pausing after each chunk; returns run's result"""
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            today = today or datetime.now().date()
+            if self.state_file is None:
+                return (yield from self._run(today, self._state, lambda state: None))
+
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with open(self.state_file, "a+", encoding="utf-8") as f, locked(f, blocking=False) as acquired:
+                if not acquired:
+                    return None
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content.strip() else {}
+                return (yield from self._run(today, state, partial(_write_state, f)))
+        finally:
+            self._running.release()
+
+    def _run(self, today: date, state: dict, save):
+        last_run = state.get("last_run")
+        if last_run is not None and date.fromisoformat(last_run) >= today:
+            self.last_run = date.fromisoformat(last_run)
+            return None
+
+        progress = state.get("progress")
+        after_id = None
+        if progress is not None:
+            if date.fromisoformat(progress["date"]) < today:
+                # Finish the day a previous pass left unfinished first
+                yield from self._pass(date.fromisoformat(progress["date"]), progress["after_id"], state, save)
+            else:
+                after_id = progress["after_id"]
+        result = yield from self._pass(today, after_id, state, save)
+
+        state["last_run"] = today.isoformat()
+        state.pop("progress", None)
+        save(state)
+        self.last_run = today
+        return result
+
+    def _pass(self, day: date, after_id: int | None, state: dict, save):
+        """Decay the fishes after after_id for day, recording progress after each chunk"""
+        checked = 0
+        deaths = Counter()
+        while True:
+            chunk = self.repository.scan_fishes(after_id, self.chunk_size)
+            if not chunk:
+                break
+            changed, _ = decay_fishes(chunk, day)
+            for fish in self._save(changed, day):
+                if not fish.alive:
+                    deaths[fish.user_id] += 1
+                    FishService.notify_died(fish)
+            checked += len(chunk)
+            after_id = chunk[-1].id
+            state["progress"] = {"date": day.isoformat(), "after_id": after_id}
+            save(state)
+            yield
+
+        logger.info("Daily decay for %s: %d fishes checked, %d died", day, checked, sum(deaths.values()))
+        return {
+            "date": day.isoformat(),
+            "fishes_checked": checked,
+            "deaths_by_user": dict(deaths),
+        }
+
+    def _save(self, changed: list[Fish], day: date) -> list[Fish]:
+        """Save decayed fishes, re-reading and decaying again any written since they were read"""
+        saved = []
+        while changed:
+            written = self.repository.save_fishes_if_current(changed)
+            saved += written
+            written_ids = {fish.id for fish in written}
+            stale = (self.repository.get_fish(fish.id) for fish in changed if fish.id not in written_ids)
+            changed, _ = decay_fishes([fish for fish in stale if fish is not None], day)
+        return saved
+
+    async def run_forever(self):
+        """Run the job now, then again just after every local midnight"""
+        while True:
+            try:
+                await self.run_async()
+            except Exception:
+                logger.exception("Daily decay job failed")
+            tomorrow = datetime.combine(datetime.now().date() + timedelta(days=1), time.min)
+            await asyncio.sleep(max((tomorrow - datetime.now()).total_seconds(), 1))
+
+
+def _write_state(f, state: dict):
+    """Replace the contents of the locked state file with state"""
+    f.seek(0)
+    f.truncate()
+    f.write(json.dumps(state))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def default_state_file() -> str | None:
+    """Where the job records its progress: beside persistent data, or nowhere for plain memory"""
+    if settings.decay_state_file:
+        return settings.decay_state_file
+    if settings.database_type != "memory":
+        return DEFAULT_STATE_FILE
+    if settings.memory_data_dir:
+        # The fishes survive a restart, so the day they were decayed must too
+        return os.path.join(settings.memory_data_dir, "decay.json")
+    return None
+
+
+# Global instance, started by the app on startup. Persistent backends share a
+# state file so each day is processed once however many workers run.
+decay_job = DailyDecayJob(repository, default_state_file())
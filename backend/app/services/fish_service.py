@@ -1,5 +1,10 @@
 from datetime import datetime
+from ..core.events import event_bus
 from ..models import Fish
+from .xp_curve import DEFAULT_XP_CURVE, XPCurve
+
+# Upper bound of Fish.feed_meter; feeding past it would make the fish fail validation when reloaded
+MAX_FEED_METER = 10
 
 class FishService:
     """Service class for fish-related business logic"""
@@ -26,11 +31,9 @@ class FishService:
         return fish
 
     @staticmethod
-    def check_level_up(fish: Fish) -> Fish:
+    def check_level_up(fish: Fish, curve: XPCurve = DEFAULT_XP_CURVE) -> Fish:
         """Check if fish should level up based on XP"""
-        while fish.xp >= fish.level * 10:  # Example XP per level
-            fish.xp -= fish.level * 10
-            fish.level += 1
+        fish.level, fish.xp = curve.level_up(fish.level, fish.xp)
         return fish
 
     @staticmethod
@@ -38,7 +41,7 @@ class FishService:
         """Feed a fish and update feed meter"""
         if not fish.alive:
             return "This fish is dead."
-        fish.feed_meter += 1
+        fish.feed_meter = min(fish.feed_meter + 1, MAX_FEED_METER)
         fish.last_fed = datetime.now()
         return "Fish fed successfully"
 
@@ -57,3 +60,22 @@ class FishService:
             fish.alive = False  # fish dies
         
         return fish
+
+    # Events go out only once the route has saved the fish, so a failed save announces nothing
+
+    @staticmethod
+    def notify_fed(fish: Fish):
+        """Tell the owner's open event streams that a fish was fed"""
+        event_bus.publish(fish.user_id, "fish.fed", {
+            "fish_id": fish.id, "feed_meter": fish.feed_meter, "last_fed": fish.last_fed,
+        })
+
+    @staticmethod
+    def notify_level_up(fish: Fish):
+        """Tell the owner's open event streams that a fish reached a new level"""
+        event_bus.publish(fish.user_id, "fish.level_up", {"fish_id": fish.id, "level": fish.level, "xp": fish.xp})
+
+    @staticmethod
+    def notify_died(fish: Fish):
+        """Tell the owner's open event streams that a fish died"""
+        event_bus.publish(fish.user_id, "fish.died", {"fish_id": fish.id})
@@ -1,33 +1,116 @@
 """Service for generating unique IDs across the application"""
 
+import itertools
+import json
+import os
+import threading
+from ..core.config import settings
+from ..core.file_lock import locked
+
+ID_KINDS = ("user", "task", "fish", "achievement")
+DEFAULT_BLOCK_SIZE = 100
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "data", "ids.json")
+
+
 class IDService:
-    """Thread-safe ID generation service"""
-    
-    def __init__(self):
-        self._user_id_counter = 0
-        self._task_id_counter = 0
-        self._fish_id_counter = 0
-        self._achievement_id_counter = 0
-    
+    """Thread- and process-safe ID generation service.
+
+    IDs are handed out from blocks reserved ahead of time. Inside a block an ID
+    costs one ``next()`` on an ``itertools.count``, which is atomic under the
+    GIL, so only reserving the next block takes a lock.
+
+    With a ``state_file`` each block is reserved by raising a high-water mark
+    stored in that file under an exclusive file lock. Every process sharing
+    the file then draws disjoint blocks, and a restart resumes above every ID
+    handed out before. The cost is one small write per block rather than one
+    per ID. IDs left unused in a block when a process exits are skipped.
+    """
+
+    def __init__(self, state_file: str | None = None, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.state_file = state_file
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._high_water = {kind: 0 for kind in ID_KINDS}
+        # kind -> (counter, first ID of the block, end of the block); starts exhausted
+        self._blocks = {kind: (itertools.count(1), 1, 1) for kind in ID_KINDS}
+
+    def _reserve(self, kind: str, count: int, floor: int = 0) -> range:
+        """Raise the high-water mark for kind by count, starting above floor"""
+        if self.state_file is None:
+            start = max(self._high_water[kind], floor) + 1
+            self._high_water[kind] = start + count - 1
+            return range(start, start + count)
+
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file, "a+", encoding="utf-8") as f, locked(f):
+            f.seek(0)
+            content = f.read()
+            high_water = json.loads(content) if content.strip() else {}
+            start = max(high_water.get(kind, 0), floor) + 1
+            high_water[kind] = start + count - 1
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(high_water))
+            f.flush()
+            os.fsync(f.fileno())
+        return range(start, start + count)
+
+    def reserve(self, kind: str, count: int) -> range:
+        """Reserve count consecutive IDs of one kind, e.g. for a batch insert"""
+        with self._lock:
+            return self._reserve(kind, count)
+
+    def generate(self, kind: str) -> int:
+        """Generate a unique ID of the given kind"""
+        counter, _, end = self._blocks[kind]
+        value = next(counter)
+        if value < end:
+            return value
+        with self._lock:
+            # Another thread may have refilled the block while we waited
+            counter, _, end = self._blocks[kind]
+            value = next(counter)
+            if value < end:
+                return value
+            block = self._reserve(kind, self.block_size)
+            counter = itertools.count(block.start)
+            self._blocks[kind] = (counter, block.start, block.stop)
+            return next(counter)
+
+    def ensure_above(self, kind: str, value: int):
+        """Make sure every future ID of kind is greater than value.
+
+        Used to seed the allocator from IDs already present in storage. Only a
+        value at or past the end of the current block reserves a new one: IDs
+        inside the block were handed out from it, and other processes draw
+        from blocks of their own.
+        """
+        if value < self._blocks[kind][2]:
+            return
+        with self._lock:
+            if value < self._blocks[kind][2]:
+                return
+            block = self._reserve(kind, self.block_size, floor=value)
+            self._blocks[kind] = (itertools.count(block.start), block.start, block.stop)
+
     def generate_user_id(self) -> int:
         """Generate a unique user ID"""
-        self._user_id_counter += 1
-        return self._user_id_counter
-    
+        return self.generate("user")
+
     def generate_task_id(self) -> int:
         """Generate a unique task ID"""
-        self._task_id_counter += 1
-        return self._task_id_counter
-    
+        return self.generate("task")
+
     def generate_fish_id(self) -> int:
         """Generate a unique fish ID"""
-        self._fish_id_counter += 1
-        return self._fish_id_counter
-    
+        return self.generate("fish")
+
     def generate_achievement_id(self) -> int:
         """Generate a unique achievement ID"""
-        self._achievement_id_counter += 1
-        return self._achievement_id_counter
+        return self.generate("achievement")
 
-# Global instance
-id_service = IDService()
+# Global instance. Persistent backends share a state file so IDs never repeat
+# across restarts or between worker processes.
+id_service = IDService(
+    settings.id_state_file or (None if settings.database_type == "memory" else DEFAULT_STATE_FILE)
+)
@@ -2,69 +2,119 @@
 
 from datetime import datetime
 from ..models import User
-from ..db.database import get_users, _save_json_file, _model_to_dict, USERS_FILE
+from ..db.async_repository import async_repository
+from ..core.events import event_bus
 from ..core.logging import logger
 
+# Days of streak that fill the home page's streak ring (the frontend's "mastery" target)
+STREAK_RING_DAYS = 30
+
 
 class UserService:
     """Service class for user-related business logic"""
     
     @staticmethod
-    def record_streak_visit(user_id: int) -> dict | None:
+    async def record_streak_visit(user_id: int) -> dict | None:
         """Record a page visit for streak tracking and return updated stats.
 
         Returns a dict with keys: totalVisits, currentDailyStreak, bestStreak, lastVisitDate
         """
-        logger.info(f"Recording streak visit for user {user_id}")
-        
-        users = get_users()
-        for i, user in enumerate(users):
-            if user.id == user_id:
-                now = datetime.now()
-                # Determine day delta
-                if user.last_login:
-                    delta = now.date() - user.last_login.date()
-                    if delta.days == 0:
-                        # same day: only increment total_visits
-                        user.total_visits = (user.total_visits or 0) + 1
-                        logger.debug(f"Same day visit for user {user_id}, total_visits now {user.total_visits}")
-                    elif delta.days == 1:
-                        # consecutive day
-                        user.login_streak = (user.login_streak or 0) + 1
-                        user.total_visits = (user.total_visits or 0) + 1
-                        logger.debug(f"Consecutive day visit for user {user_id}, streak now {user.login_streak}")
-                    else:
-                        # missed day(s)
-                        user.login_streak = 1
-                        user.total_visits = (user.total_visits or 0) + 1
-                        logger.debug(f"Missed day visit for user {user_id}, streak reset to 1")
-                else:
-                    # first visit ever
-                    user.login_streak = 1
-                    user.total_visits = (user.total_visits or 0) + 1
-                    logger.debug(f"First visit for user {user_id}")
-
-                # update best streak
-                if user.login_streak and user.login_streak > (user.best_streak or 0):
-                    user.best_streak = user.login_streak
-                    logger.debug(f"New best streak for user {user_id}: {user.best_streak}")
-
-                user.last_login = now
-                users[i] = user
-                _save_json_file(USERS_FILE, [_model_to_dict(u) for u in users])
-
-                stats = {
-                    "totalVisits": user.total_visits,
-                    "currentDailyStreak": user.login_streak,
-                    "bestStreak": user.best_streak,
-                    "lastVisitDate": user.last_login.date().isoformat()
-                }
-                
-                logger.info(f"Streak visit recorded for user {user_id}: {stats}")
-                return stats
+        logger.info("Recording streak visit for user %s", user_id)
         
-        logger.warning(f"User {user_id} not found for streak visit")
-        return None
+        # A pending write-behind version is current and needs no storage read
+        user = async_repository.pending_user(user_id) or await async_repository.get_user_without_children(user_id)
+        if user is None:
+            logger.warning("User %s not found for streak visit", user_id)
+            return None
+
+        now = datetime.now()
+        # Determine day delta
+        if user.last_login:
+            delta = now.date() - user.last_login.date()
+            if delta.days == 0:
+                # same day: only increment total_visits
+                user.total_visits = (user.total_visits or 0) + 1
+                logger.debug("Same day visit for user %s, total_visits now %s", user_id, user.total_visits)
+            elif delta.days == 1:
+                # consecutive day
+                user.login_streak = (user.login_streak or 0) + 1
+                user.total_visits = (user.total_visits or 0) + 1
+                logger.debug("Consecutive day visit for user %s, streak now %s", user_id, user.login_streak)
+            else:
+                # missed day(s)
+                user.login_streak = 1
+                user.total_visits = (user.total_visits or 0) + 1
+                logger.debug("Missed day visit for user %s, streak reset to 1", user_id)
+        else:
+            # first visit ever
+            user.login_streak = 1
+            user.total_visits = (user.total_visits or 0) + 1
+            logger.debug("First visit for user %s", user_id)
+
+        # update best streak
+        if user.login_streak and user.login_streak > (user.best_streak or 0):
+            user.best_streak = user.login_streak
+            logger.debug("New best streak for user %s: %s", user_id, user.best_streak)
+
+        user.last_login = now
+        await async_repository.save_user_later(user)
+
+        stats = UserService.streak_stats(user)
+        event_bus.publish(user_id, "streak.updated", stats)
+
+        logger.info("Streak visit recorded for user %s: %s", user_id, stats)
+        return stats
+
+    @staticmethod
+    def streak_stats(user: User) -> dict:
+        """Build the streak stats payload described in backend-integration.md"""
+        return {
+            "totalVisits": user.total_visits,
+            "currentDailyStreak": user.login_streak,
+            "bestStreak": user.best_streak,
+            "lastVisitDate": user.last_login.date().isoformat() if user.last_login else None
+        }
+
+    @staticmethod
+    async def get_streak(user_id: int) -> dict | None:
+        """Return streak stats for a user without recording a visit"""
+        user = await async_repository.get_user_without_children(user_id)
+        if user is None:
+            return None
+        return UserService.streak_stats(user)
+
+    @staticmethod
+    async def get_dashboard(user_id: int) -> dict | None:
+        """Return everything the home page shows for a user in one payload.
+
+        Counts come from counters the repository keeps up to date on every
+        write, so this costs the same however many tasks and fishes there are.
+        """
+        user = await async_repository.get_user_without_children(user_id)
+        if user is None:
+            return None
+        counters = await async_repository.get_user_counters(user_id)
+        streak = UserService.streak_stats(user)
+        streak["ringPercent"] = min(user.login_streak / STREAK_RING_DAYS * 100, 100)
+        return {
+            "user": {"id": user.id, "username": user.username, "profilePic": user.profile_pic},
+            "tasks": {
+                "pending": counters.pending_tasks,
+                "completed": counters.completed_tasks,
+                "cancelled": counters.cancelled_tasks,
+            },
+            "fishes": {"total": counters.fishes, "living": counters.living_fishes, "totalXp": counters.total_xp},
+            "achievements": {"total": counters.achievements, "completed": counters.completed_achievements},
+            "streak": streak,
+        }
+
+    @staticmethod
+    async def get_last_visit(user_id: int) -> dict | None:
+        """Return the date of a user's last recorded visit"""
+        user = await async_repository.get_user_without_children(user_id)
+        if user is None:
+            return None
+        return {"lastVisitDate": user.last_login.date().isoformat() if user.last_login else None}
 
     @staticmethod
     def update_login_streak(user: User) -> User:
@@ -81,4 +131,5 @@ class UserService:
             user.login_streak = 1
 
         user.last_login = now
+        event_bus.publish(user.id, "streak.updated", UserService.streak_stats(user))
         return user
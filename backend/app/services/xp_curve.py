@@ -0,0 +1,81 @@
+"""XP curves: how much XP each fish level costs"""
+
+from abc import ABC, abstractmethod
+from math import isqrt
+
+
+class XPCurve(ABC):
+    """Maps a level to the XP needed to advance from it to the next level.
+
+    Subclasses must define ``cost``. ``total`` and ``level_for`` have generic
+    implementations; curves with a closed form should override both so that
+    levelling up costs the same however many levels are gained at once.
+    """
+
+    @abstractmethod
+    def cost(self, level: int) -> int:
+        """XP needed to go from level to level + 1"""
+
+    def total(self, level: int) -> int:
+        """Cumulative XP needed to reach level from level 1"""
+        return sum(self.cost(n) for n in range(1, level))
+
+    def level_for(self, total_xp: int) -> int:
+        """Highest level whose cumulative XP is at most total_xp"""
+        # Gallop to an upper bound, then bisect
+        high = 2
+        while self.total(high) <= total_xp:
+            high *= 2
+        low = high // 2
+        while low + 1 < high:
+            mid = (low + high) // 2
+            if self.total(mid) <= total_xp:
+                low = mid
+            else:
+                high = mid
+        return low
+
+    def level_up(self, level: int, xp: int) -> tuple[int, int]:
+        """Spend xp on as many levels as it buys; return (new level, leftover xp)"""
+        if xp < self.cost(level):
+            return level, xp
+        total_xp = self.total(level) + xp
+        new_level = self.level_for(total_xp)
+        return new_level, total_xp - self.total(new_level)
+
+
+class LinearCurve(XPCurve):
+    """Every level costs the same XP"""
+
+    def __init__(self, step: int = 10):
+        self.step = step
+
+    def cost(self, level: int) -> int:
+        return self.step
+
+    def total(self, level: int) -> int:
+        return self.step * (level - 1)
+
+    def level_for(self, total_xp: int) -> int:
+        return total_xp // self.step + 1
+
+
+class TriangularCurve(XPCurve):
+    """Level n costs n * step XP, so reaching level n takes step * n(n-1)/2"""
+
+    def __init__(self, step: int = 10):
+        self.step = step
+
+    def cost(self, level: int) -> int:
+        return self.step * level
+
+    def total(self, level: int) -> int:
+        return self.step * level * (level - 1) // 2
+
+    def level_for(self, total_xp: int) -> int:
+        # Largest n with n(n-1)/2 <= total_xp // step, i.e. (2n-1)^2 <= 8q+1
+        return (isqrt(8 * (total_xp // self.step) + 1) + 1) // 2
+
+
+# The curve fish have always used: level * 10 XP per level
+DEFAULT_XP_CURVE = TriangularCurve(10)
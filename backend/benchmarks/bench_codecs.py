@@ -0,0 +1,89 @@
+"""
+Benchmark the on-disk codecs: save/load time and file size against the
+original format (pretty-printed JSON of mode="json" dumps)
+
+Usage: python benchmarks/bench_codecs.py [--users 10000]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import gc
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from app.db.codecs import CODECS
+from app.db.files import _load_json_file, _save_json_file
+from app.models import Fish, Task, User
+
+
+def make_users(count: int) -> list[User]:
+    now = datetime.now()
+    users = []
+    for user_id in range(1, count + 1):
+        tasks = {
+            task_id: Task(id=task_id, title=f"Task {task_id}", description="Something to do",
+                          user_id=user_id, created_at=now - timedelta(days=task_id))
+            for task_id in range(user_id * 10, user_id * 10 + 5)
+        }
+        fish = Fish(id=user_id, name="Bubbles", category="Work", user_id=user_id, last_fed=now)
+        users.append(User(id=user_id, username=f"user{user_id}", created_at=now, last_login=now,
+                          tasks=tasks, fishes={fish.id: fish}, login_streak=3, total_visits=12))
+    return users
+
+
+def timed(fn, repeat: int = 5) -> float:
+    # Like timeit, time with the cyclic GC off: whether a full collection lands
+    # inside a run depends on allocation history, not on the format under test
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+
+def bench_original(users: list[User], path: str) -> tuple[float, float, int]:
+    """The format before codecs: mode="json" rows, indent=2, parsed back from strings"""
+    def save():
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([user.model_dump(mode="json") for user in users], f, indent=2, default=str)
+
+    def load():
+        with open(path, 'r', encoding='utf-8') as f:
+            [User(**row) for row in json.load(f)]
+
+    return timed(save), timed(load), os.path.getsize(path)
+
+
+def bench_codec(users: list[User], path: str, codec: str) -> tuple[float, float, int]:
+    def save():
+        _save_json_file(path, [user.model_dump() for user in users], codec)
+
+    def load():
+        [User(**row) for row in _load_json_file(path)]
+
+    return timed(save), timed(load), os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    print(f"{args.users} users, 5 tasks and 1 fish each")
+    print(f"{'format':>10} {'save ms':>9} {'load ms':>9} {'size KB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {"original": bench_original(users, os.path.join(tmp, "original.json"))}
+        for name in CODECS:
+            results[name] = bench_codec(users, os.path.join(tmp, f"users.{name}"), name)
+    for name, (save, load, size) in results.items():
+        print(f"{name:>10} {save * 1000:9.1f} {load * 1000:9.1f} {size / 1024:9.1f}")
@@ -0,0 +1,61 @@
+"""
+Benchmark response encoding: cached bytes by stored version vs dumping every time
+
+Renders the bodies of two GET responses from the in-memory backend: a page
+of a user's fish (new Fish objects on every read) and a user with its tasks
+and fish nested. Each is timed with the encoded cache on and off, for the
+render alone and with the rows read again first, as the routes do.
+
+Usage: python benchmarks/bench_encoded_cache.py [--children 100]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import timeit
+from app.db.repository import MemoryRepository
+from app.models import Fish, Task, User
+from app.routes.responses import ModelJSONResponse, encoded_cache
+
+
+def fill(repo: MemoryRepository, children: int):
+    repo.add_user(User(id=1, username="bench"))
+    repo.add_tasks([Task(id=i, title=f"Task {i}", description="Benchmark task", user_id=1)
+                    for i in range(1, children + 1)])
+    for i in range(1, children + 1):
+        repo.add_fish(Fish(id=i, name=f"Fish {i}", category="Work", user_id=1, level=i % 30 + 1, xp=i))
+
+
+def best(run, number: int = 200) -> float:
+    """Seconds per call of run, best of five"""
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--children", type=int, default=100, help="tasks and fish the user owns")
+    args = parser.parse_args(argv)
+
+    repo = MemoryRepository()
+    fill(repo, args.children)
+    cases = {
+        f"page of {args.children} fish": lambda: repo.list_fishes(1),
+        f"user with {args.children} tasks + fish": lambda: repo.get_user(1),
+    }
+    for name, read in cases.items():
+        rows = read()
+        for label, run in (("render", lambda: ModelJSONResponse(rows)),
+                           ("read + render", lambda: ModelJSONResponse(read()))):
+            encoded_cache.enabled = False
+            dumped = best(run)
+            encoded_cache.enabled = True
+            encoded_cache.clear()
+            cached = best(run)
+            print(f"{name:32} {label:14} dump {dumped * 1e6:7.1f} us  cached {cached * 1e6:7.1f} us  "
+                  f"({dumped / cached:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Benchmark fish memory: a dict of Fish models vs the FishStore columns
+
+Measures the bytes each fish takes in memory both ways (with tracemalloc,
+so only allocations made while filling the table count) and what reading one
+fish costs now that the model is built on the way out.
+
+Usage: python benchmarks/bench_fish_memory.py [--fishes 100000]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+from app.db.storage import FishStore
+from app.models import Fish
+
+CATEGORIES = ("Work", "Health", "Study", "Chores", "Fun")
+
+
+def make_fish(fish_id: int) -> Fish:
+    return Fish(
+        id=fish_id,
+        name=f"Fish {fish_id}",
+        category=CATEGORIES[fish_id % len(CATEGORIES)],
+        user_id=fish_id // 50 + 1,
+        level=fish_id % 30 + 1,
+        xp=fish_id % 1000,
+        tasks_completed=fish_id % 200,
+        feed_meter=fish_id % 11,
+        last_fed=datetime(2024, 1, 1) + timedelta(seconds=fish_id),
+    )
+
+
+def bytes_per_fish(table, count: int) -> float:
+    """Fill table with count fish and return the bytes it grew by per fish"""
+    gc.collect()
+    tracemalloc.start()
+    for fish_id in range(1, count + 1):
+        table[fish_id] = make_fish(fish_id)
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return used / count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fishes", type=int, default=100_000, help="fish to store")
+    args = parser.parse_args(argv)
+
+    models: dict[int, Fish] = {}
+    store = FishStore()
+    before = bytes_per_fish(models, args.fishes)
+    after = bytes_per_fish(store, args.fishes)
+    print(f"{args.fishes} fish")
+    print(f"dict of Fish models: {before:8.0f} bytes/fish")
+    print(f"FishStore columns:   {after:8.0f} bytes/fish  ({before / after:.1f}x smaller)")
+
+    # The price: every read now builds a Fish instead of returning a stored one
+    fish_id = args.fishes // 2
+    dict_read = min(timeit.repeat(lambda: models[fish_id], number=10_000, repeat=5)) / 10_000
+    store_read = min(timeit.repeat(lambda: store[fish_id], number=10_000, repeat=5)) / 10_000
+    print(f"read one fish:       dict {dict_read * 1e6:6.2f} us  FishStore {store_read * 1e6:6.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
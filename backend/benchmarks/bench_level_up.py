@@ -0,0 +1,26 @@
+"""
+Benchmark level up: closed form vs the original per-level loop
+
+Usage: python benchmarks/bench_level_up.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timeit
+from app.services.xp_curve import DEFAULT_XP_CURVE
+
+
+def loop_level_up(level, xp):
+    while xp >= level * 10:
+        xp -= level * 10
+        level += 1
+    return level, xp
+
+
+if __name__ == "__main__":
+    for xp in (10, 1_000, 100_000, 10_000_000):
+        loop = min(timeit.repeat(lambda: loop_level_up(1, xp), number=100, repeat=5)) / 100
+        closed = min(timeit.repeat(lambda: DEFAULT_XP_CURVE.level_up(1, xp), number=100, repeat=5)) / 100
+        print(f"xp={xp:>10}: loop {loop * 1e6:9.2f} us  closed form {closed * 1e6:6.2f} us  "
+              f"level {DEFAULT_XP_CURVE.level_up(1, xp)[0]}")
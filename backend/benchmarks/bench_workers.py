@@ -0,0 +1,153 @@
+"""
+Benchmark throughput of the shared backend as uvicorn workers are added
+
+For each worker count, starts a fresh state server and a local uvicorn with
+DATABASE_TYPE=shared using it, seeds it, and drives a read/write mix with
+enough client threads to keep every worker busy. The in-memory backend on one
+worker (the only way it can run) is measured first as the baseline.
+
+--direct leaves HTTP out: N client processes call SharedRepository
+directly, which shows how many calls per second the state server itself
+can take before it, rather than the workers, becomes the limit.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 8
+    python benchmarks/bench_workers.py --direct --workers 1 2 4
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import subprocess
+import tempfile
+import time
+from multiprocessing import Pool
+from run_benchmarks import BACKEND_DIR, SCENARIOS, run_scenario, seed, start_uvicorn
+
+MIX = ("task_get", "task_update", "streak_visit", "list_tasks")
+
+
+def start_state_server(path: str) -> subprocess.Popen:
+    from app.db.shared import _can_connect
+
+    server = subprocess.Popen([sys.executable, "-m", "app.db.state_server", "--socket", path], cwd=BACKEND_DIR)
+    deadline = time.monotonic() + 10
+    while not _can_connect(path):
+        if time.monotonic() > deadline:
+            server.terminate()
+            raise RuntimeError("state server did not start within 10s")
+        time.sleep(0.05)
+    return server
+
+
+def run_http(label: str, workers: int, env: dict, args) -> dict:
+    import httpx
+
+    uvicorn, url = start_uvicorn(workers, env)
+    try:
+        def make_client():
+            return httpx.Client(base_url=url, timeout=60)
+
+        data = seed(make_client(), args.rows)
+        results = {}
+        for name in MIX:
+            result = run_scenario(make_client, data, SCENARIOS[name], args.requests, args.concurrency)
+            if result["errors"]:
+                raise RuntimeError(f"{label}: {result['errors']} failed {name} requests")
+            results[name] = result["rps"]
+        return results
+    finally:
+        uvicorn.terminate()
+        uvicorn.wait()
+
+
+def bench_http(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rows = [("memory", 1, run_http("memory", 1, {"DATABASE_TYPE": "memory"}, args))]
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.sock")
+            server = start_state_server(path)
+            env = {
+                "DATABASE_TYPE": "shared",
+                "DATABASE_URL": path,
+                "ID_STATE_FILE": os.path.join(tmp, "ids.json"),
+                "DECAY_STATE_FILE": os.path.join(tmp, "decay.json"),
+            }
+            try:
+                rows.append(("shared", workers, run_http(f"shared x{workers}", workers, env, args)))
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"{'backend':<8} {'workers':>7} " + " ".join(f"{name:>13}" for name in MIX) + "  (requests/sec)")
+    for backend, workers, results in rows:
+        print(f"{backend:<8} {workers:>7} " + " ".join(f"{results[name]:>13.1f}" for name in MIX))
+
+
+def direct_client(job) -> int:
+    """Make calls against the state server for seconds; return how many were made"""
+    path, user_ids, seconds = job
+    from app.db.shared import SharedRepository
+
+    repository = SharedRepository(path, autostart=False)
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        user_id = user_ids[calls % len(user_ids)]
+        if calls % 4 == 3:
+            user = repository.get_user(user_id)
+            user.total_visits += 1
+            repository.save_user(user)
+            calls += 2
+        else:
+            repository.list_tasks(user_id, limit=10)
+            calls += 1
+    return calls
+
+
+def bench_direct(args):
+    from app.db.shared import SharedRepository
+    from app.models import Task, User
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.sock")
+        server = start_state_server(path)
+        try:
+            repository = SharedRepository(path, autostart=False)
+            user_ids = list(range(1, max(1, args.rows // 100) + 1))
+            for user_id in user_ids:
+                repository.add_user(User(id=user_id, username=f"bench-{user_id}"))
+                repository.add_tasks([
+                    Task(id=user_id * 1000 + n, title=f"Task {n}", user_id=user_id) for n in range(100)
+                ])
+            print(f"{'clients':>7} {'calls/sec':>10}")
+            for clients in args.workers:
+                with Pool(clients) as pool:
+                    calls = sum(pool.map(direct_client, [(path, user_ids, args.seconds)] * clients))
+                print(f"{clients:>7} {calls / args.seconds:>10.0f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4], help="worker (or client process) counts")
+    parser.add_argument("--rows", type=int, default=10_000, help="task rows to seed")
+    parser.add_argument("--requests", type=int, default=2_000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="client threads per scenario")
+    parser.add_argument("--direct", action="store_true", help="call the state server without HTTP")
+    parser.add_argument("--seconds", type=float, default=3, help="run time per client count with --direct")
+    args = parser.parse_args(argv)
+    if args.direct:
+        bench_direct(args)
+    else:
+        bench_http(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
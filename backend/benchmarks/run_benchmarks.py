@@ -0,0 +1,385 @@
+"""
+Latency and throughput benchmarks for the Dopamine Hunter API
+
+Drives main.app in-process through TestClient, a local uvicorn started for
+each dataset size, or an already running server. Every scenario is timed per
+request; results (p50/p99 latency, requests/sec, peak RSS) are printed and
+can be written as JSON and compared against a stored baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py                          # in-process, 1k rows
+    python benchmarks/run_benchmarks.py --rows 1k 100k 1m
+    python benchmarks/run_benchmarks.py --uvicorn --workers 4
+    python benchmarks/run_benchmarks.py --url http://127.0.0.1:8000
+    python benchmarks/run_benchmarks.py --output baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.2
+
+Dataset size is the number of task rows. They are spread over one user per
+100 tasks, and each user has one fish. With --url the server cannot be reset,
+so data from earlier sizes and runs stays in place.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import platform
+import random
+import resource
+import socket
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API = "/api/v1"
+TASKS_PER_USER = 100
+SEED_BATCH_SIZE = 1000
+METRICS = ("p50_ms", "p99_ms", "rps")
+
+
+def parse_rows(value: str) -> int:
+    """Parse a dataset size such as 1000, 100k or 1m"""
+    value = value.lower()
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_kb(pid: int | None = None) -> int | None:
+    """Peak resident set size in KB, of this process or of pid (Linux only)"""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def check(response, expected=(200,)):
+    if response.status_code not in expected:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}")
+    return response
+
+
+class Dataset:
+    """IDs of the seeded rows, used to pick request targets"""
+
+    def __init__(self):
+        self.run = uuid.uuid4().hex[:8]
+        self.users: list[int] = []
+        self.fishes: dict[int, int] = {}  # user_id -> fish_id
+        self.tasks: dict[int, list[int]] = {}  # user_id -> task IDs
+        self.created_tasks: list[tuple[int, int]] = []  # (user_id, task_id) made by task_create
+
+    def user(self) -> int:
+        return random.choice(self.users)
+
+    def task(self) -> tuple[int, int]:
+        user_id = self.user()
+        return user_id, random.choice(self.tasks[user_id])
+
+
+def seed(client, rows: int) -> Dataset:
+    """Create rows tasks spread over users, each with one fish"""
+    data = Dataset()
+    num_users = max(1, -(-rows // TASKS_PER_USER))
+    for i in range(num_users):
+        user = check(client.post(f"{API}/users/", json={"username": f"seed-{data.run}-{i}"})).json()
+        data.users.append(user["id"])
+        fish = check(client.post(f"{API}/users/{user['id']}/fish", json={"name": "Bench", "category": "Goldfish"}))
+        data.fishes[user["id"]] = fish.json()["id"]
+        data.tasks[user["id"]] = []
+
+    remaining = rows
+    for user_id in data.users:
+        count = min(TASKS_PER_USER, remaining)
+        remaining -= count
+        for start in range(0, count, SEED_BATCH_SIZE):
+            items = [{"title": f"Seed task {n}"} for n in range(start, min(count, start + SEED_BATCH_SIZE))]
+            results = check(client.post(f"{API}/tasks/users/{user_id}/tasks:batch", json=items)).json()
+            data.tasks[user_id].extend(result["task"]["id"] for result in results)
+    return data
+
+
+# Each scenario makes one request for iteration i and returns the response
+def signup(client, data, i):
+    return client.post(f"{API}/users/", json={"username": f"bench-{data.run}-{i}"})
+
+
+def task_create(client, data, i):
+    user_id = data.user()
+    response = client.post(f"{API}/tasks/users/{user_id}/tasks", json={"title": f"Bench task {i}"})
+    if response.status_code == 200:
+        data.created_tasks.append((user_id, response.json()["id"]))
+    return response
+
+
+def task_get(client, data, i):
+    user_id, task_id = data.task()
+    return client.get(f"{API}/tasks/users/{user_id}/tasks/{task_id}")
+
+
+def task_update(client, data, i):
+    user_id, task_id = data.task()
+    return client.put(f"{API}/tasks/users/{user_id}/tasks/{task_id}",
+                      json={"title": f"Updated {i}", "status": "completed", "user_id": user_id})
+
+
+def prepare_task_delete(client, data, requests: int):
+    """Create the tasks task_delete will remove that task_create did not leave behind"""
+    for i in range(len(data.created_tasks), requests):
+        check(task_create(client, data, f"delete-{i}"))
+
+
+def task_delete(client, data, i):
+    user_id, task_id = data.created_tasks.pop()
+    return client.delete(f"{API}/tasks/users/{user_id}/tasks/{task_id}")
+
+
+def fish_complete_task(client, data, i):
+    user_id = data.user()
+    return client.post(f"{API}/users/{user_id}/fish/{data.fishes[user_id]}/complete_task")
+
+
+def feed_all(client, data, i):
+    return client.post(f"{API}/users/{data.user()}/feed_all")
+
+
+def streak_visit(client, data, i):
+    return client.post(f"{API}/users/{data.user()}/streak/visit")
+
+
+def list_users(client, data, i):
+    return client.get(f"{API}/users/")
+
+
+def list_tasks(client, data, i):
+    return client.get(f"{API}/tasks/users/{data.user()}/tasks")
+
+
+def list_fishes(client, data, i):
+    return client.get(f"{API}/users/{data.user()}/fishes")
+
+
+def list_achievements(client, data, i):
+    return client.get(f"{API}/achievements/")
+
+
+# task_delete removes what task_create made; its setup tops that up untimed,
+# so it can also run alone or after failed creates
+SCENARIOS = {
+    "signup": signup,
+    "task_create": task_create,
+    "task_get": task_get,
+    "task_update": task_update,
+    "task_delete": task_delete,
+    "fish_complete_task": fish_complete_task,
+    "feed_all": feed_all,
+    "streak_visit": streak_visit,
+    "list_users": list_users,
+    "list_tasks": list_tasks,
+    "list_fishes": list_fishes,
+    "list_achievements": list_achievements,
+}
+
+# Untimed preparation some scenarios need before run_scenario starts the clock
+SETUP = {
+    "task_delete": prepare_task_delete,
+}
+
+
+def run_scenario(make_client, data: Dataset, scenario, requests: int, concurrency: int) -> dict:
+    """Time requests calls of one scenario spread over concurrency threads"""
+    def worker(indexes):
+        client = make_client()
+        latencies, errors = [], 0
+        for i in indexes:
+            start = time.perf_counter()
+            response = scenario(client, data, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        return latencies, errors
+
+    shards = [range(n, requests, concurrency) for n in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(worker, shards))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for shard, _ in outcomes for latency in shard)
+    return {
+        "requests": requests,
+        "errors": sum(errors for _, errors in outcomes),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_uvicorn(workers: int, env: dict | None = None) -> tuple[subprocess.Popen, str]:
+    """Start uvicorn on a free port and wait until /health answers; env adds to the environment"""
+    import httpx
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **(env or {})},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/health").status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn did not start within 30s")
+
+
+def reset_in_process_storage():
+    """Empty the in-memory backend between dataset sizes"""
+    from app.core.config import settings
+    from app.db import storage
+
+    if settings.database_type == "memory":
+        for table in (storage.users, storage.tasks, storage.fishes, storage.achievements):
+            table.clear()
+
+
+def benchmark(args) -> dict:
+    results = []
+    peak_rss = {}
+    for rows in args.rows:
+        server = None
+        if args.url or args.uvicorn:
+            import httpx
+
+            if args.uvicorn:
+                server, url = start_uvicorn(args.workers)
+            else:
+                url = args.url
+
+            def make_client():
+                return httpx.Client(base_url=url, timeout=60)
+        else:
+            from fastapi.testclient import TestClient
+            from main import app
+
+            reset_in_process_storage()
+
+            def make_client():
+                return TestClient(app)
+
+        try:
+            start = time.perf_counter()
+            data = seed(make_client(), rows)
+            print(f"rows={rows}: seeded in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            for name in args.scenarios:
+                if name in SETUP:
+                    SETUP[name](make_client(), data, args.requests)
+                result = run_scenario(make_client, data, SCENARIOS[name], args.requests, args.concurrency)
+                results.append({"rows": rows, "scenario": name, **result})
+                print(f"rows={rows} {name:<20} p50={result['p50_ms']:>8.3f}ms p99={result['p99_ms']:>8.3f}ms "
+                      f"rps={result['rps']:>9.1f} errors={result['errors']}", file=sys.stderr)
+            peak_rss[str(rows)] = {
+                "client_kb": peak_rss_kb(),
+                "server_kb": peak_rss_kb(server.pid) if server else None,
+            }
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    return {
+        "target": args.url or ("uvicorn" if args.uvicorn else "in-process"),
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "results": results,
+        "peak_rss": peak_rss,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """List every metric that is worse than the baseline by more than tolerance"""
+    previous = {(r["rows"], r["scenario"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["rows"], result["scenario"]))
+        if before is None:
+            continue
+        for metric in METRICS:
+            old, new = before[metric], result[metric]
+            # Latency regresses upward, throughput downward
+            worse = new < old * (1 - tolerance) if metric == "rps" else new > old * (1 + tolerance)
+            if old and worse:
+                regressions.append(f"rows={result['rows']} {result['scenario']} {metric}: {old} -> {new}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", nargs="+", type=parse_rows, default=[1_000], help="dataset sizes, e.g. 1k 100k 1m")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads per scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    target.add_argument("--uvicorn", action="store_true", help="start a local uvicorn per dataset size")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --uvicorn")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown for --compare")
+    args = parser.parse_args(argv)
+    # One log line per request would dominate the timings
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = benchmark(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
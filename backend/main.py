@@ -1,13 +1,47 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.events import event_bus
 from app.core.logging import logger
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, metrics
 from app.routes.api import api_router
+from app.routes.pagination import NEXT_CURSOR_HEADER
+from app.services.decay_service import decay_job
+from app.db.async_repository import async_repository
+from app.db.repository import repository
+from app.db.shared import EventRelay, SharedRepository
+from app.db.wal import DurableMemoryRepository
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start background jobs; cancelled on shutdown
+    jobs = [asyncio.create_task(async_repository.run_user_flusher())]
+    if settings.fish_decay_enabled:
+        jobs.append(asyncio.create_task(decay_job.run_forever()))
+    if isinstance(repository, DurableMemoryRepository):
+        jobs.append(asyncio.create_task(repository.run_forever()))
+    # Workers sharing state share events too, so streams see every worker's changes
+    if isinstance(repository, SharedRepository):
+        event_bus.relay = EventRelay(repository.path, event_bus, repository.autostart)
+    yield
+    if event_bus.relay is not None:
+        event_bus.relay.close()
+        event_bus.relay = None
+    for job in jobs:
+        job.cancel()
+    # Let the flusher write out pending users before the pool goes away
+    await asyncio.gather(*jobs, return_exceptions=True)
+    async_repository.shutdown()
+
 
 app = FastAPI(
     title=settings.app_name,
     version=settings.version,
-    debug=settings.debug
+    debug=settings.debug,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -17,8 +51,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
+# Outermost, so its timings cover the whole stack
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+
 # Include API routes
 app.include_router(api_router, prefix=settings.api_prefix)
 
@@ -28,7 +67,12 @@ async def health_check():
     logger.info("Health check endpoint accessed")
     return {"status": "healthy", "message": "Dopamine Hunter API is running"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
-    logger.info(f"Starting {settings.app_name} v{settings.version}")
+    logger.info("Starting %s v%s", settings.app_name, settings.version)
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from math import isqrt
 
 class Fish:
     def __init__(self, name: str, category: str):
@@ -25,9 +26,12 @@ class Fish:
         self.check_level_up()
 
     def check_level_up(self):
-        while self.xp >= self.level * 10:  # Example XP per level
-            self.xp -= self.level * 10
-            self.level += 1
+        # Level n costs n * 10 XP, so reaching level n takes 5 * n(n-1) in total
+        if self.xp < self.level * 10:
+            return
+        total_xp = 5 * self.level * (self.level - 1) + self.xp
+        self.level = (isqrt(8 * (total_xp // 10) + 1) + 1) // 2
+        self.xp = total_xp - 5 * self.level * (self.level - 1)
 
     def feed(self):
         if not self.alive:
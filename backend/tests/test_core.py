@@ -5,9 +5,10 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import asyncio
 import logging
 from app.core.config import Settings
-from app.core.logging import setup_logging, logger
+from app.core.logging import setup_logging, logger, JsonFormatter, SamplingFilter
 from app.core.exceptions import (
     DopamineHunterException,
     UserNotFoundError,
@@ -17,6 +18,7 @@ from app.core.exceptions import (
     AchievementNotFoundError,
     InvalidOperationError
 )
+from app.core.metrics import Histogram, Metrics, metrics
 
 
 class TestSettings:
@@ -109,6 +111,41 @@ class TestLogging:
             # Remove the handler
             logger.removeHandler(handler)
 
+    def test_setup_logging_idempotent(self):
+        """Test that calling setup_logging again does not duplicate handlers"""
+        setup_logging()
+        count = len(logging.getLogger().handlers)
+        setup_logging()
+        assert len(logging.getLogger().handlers) == count
+
+    def test_reload_does_not_duplicate_handlers(self):
+        """Test that reloading the logging module replaces its handler and listener thread"""
+        import importlib
+        import threading
+        import app.core.logging as logging_module
+        count = len(logging.getLogger().handlers)
+        threads = threading.active_count()
+        importlib.reload(logging_module)
+        assert len(logging.getLogger().handlers) == count
+        assert threading.active_count() == threads
+
+    def test_json_formatter(self):
+        """Test that JSON output carries the rendered message"""
+        import json
+        record = logging.LogRecord("dopamine_hunter", logging.INFO, __file__, 1, "User %s created", (7,), None)
+        entry = json.loads(JsonFormatter().format(record))
+        assert entry["message"] == "User 7 created"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "dopamine_hunter"
+
+    def test_sampling_filter(self):
+        """Test that info records are sampled and warnings always pass"""
+        sampler = SamplingFilter(every=4)
+        info = logging.LogRecord("x", logging.INFO, __file__, 1, "info", None, None)
+        warning = logging.LogRecord("x", logging.WARNING, __file__, 1, "warning", None, None)
+        assert sum(sampler.filter(info) for _ in range(100)) == 25
+        assert all(sampler.filter(warning) for _ in range(10))
+
 
 class TestExceptions:
     """Test custom exceptions"""
@@ -258,9 +295,115 @@ class TestCoreIntegration:
         assert hasattr(exceptions, 'DopamineHunterException')
 
 
+class TestMetrics:
+    """Test the metrics registry and /metrics endpoint"""
+
+    def test_histogram_buckets(self):
+        """Test that observations land in cumulative buckets"""
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 7, 50):
+            histogram.observe(value)
+        lines = list(histogram.render("x", 'a="b"'))
+        assert lines[:4] == ['x_bucket{a="b",le="1"} 2', 'x_bucket{a="b",le="5"} 3',
+                             'x_bucket{a="b",le="10"} 4', 'x_bucket{a="b",le="+Inf"} 5']
+        assert lines[-1] == 'x_count{a="b"} 5'
+
+    def test_route_series_reused(self):
+        """Test that a route's series is created once and then reused"""
+        registry = Metrics()
+        series = registry.route("GET", "/users/{user_id}")
+        assert registry.route("GET", "/users/{user_id}") is series
+        series.record(404, 0.002, 30)
+        assert 'http_requests_total{method="GET",route="/users/{user_id}",status="4xx"} 1' in registry.render()
+
+    def test_metrics_endpoint(self):
+        """Test that requests are recorded under their route template"""
+        from fastapi.testclient import TestClient
+        from main import app
+
+        client = TestClient(app)
+        client.get("/api/v1/users/999999")
+        body = client.get("/metrics").text
+        assert 'route="/api/v1/users/{user_id}",status="4xx"' in body
+        assert "http_requests_in_flight" in body
+        assert "http_response_size_bytes_bucket" in body
+
+    def test_storage_metrics(self, tmp_path):
+        """Test that JSON loads and saves record duration and bytes"""
+        from app.db.files import _load_json_file, _save_json_file
+
+        path = str(tmp_path / "metrics.json")
+        _save_json_file(path, [{"id": 1}])
+        assert _load_json_file(path) == [{"id": 1}]
+        body = metrics.render()
+        size = os.path.getsize(path)
+        assert f'storage_json_bytes_total{{operation="save",file="metrics.json"}} {size}' in body
+        assert f'storage_json_bytes_total{{operation="load",file="metrics.json"}} {size}' in body
+
+
+class TestEvents:
+    """Test the in-process event bus"""
+
+    def test_publish_reaches_user_subscribers(self):
+        """Test that an event goes to the user's streams only"""
+        from app.core.events import EventBus
+
+        async def scenario():
+            bus = EventBus()
+            mine, other = bus.subscribe(1), bus.subscribe(2)
+            bus.publish(1, "fish.fed", {"fish_id": 7})
+            event = await mine.get(1)
+            assert (event.type, event.user_id, event.data) == ("fish.fed", 1, {"fish_id": 7})
+            assert await other.get(0.01) is None
+            mine.close()
+            other.close()
+            assert bus.subscriber_count() == 0
+
+        asyncio.run(scenario())
+
+    def test_publish_without_subscribers(self):
+        """Test that publishing with no open streams is a no-op"""
+        from app.core.events import EventBus
+
+        bus = EventBus()
+        bus.publish(1, "fish.fed", {})
+        assert bus.published == 0
+
+    def test_slow_subscriber_gets_resync(self):
+        """Test that a full queue is replaced by one resync event"""
+        from app.core.events import EventBus, RESYNC
+
+        async def scenario():
+            bus = EventBus(max_queue=3)
+            subscription = bus.subscribe(1)
+            for i in range(5):
+                bus.publish(1, "fish.fed", {"n": i})
+            # 0-2 fill the queue; 3 overflows it and is dropped with them
+            events = [await subscription.get(0.01) for _ in range(3)]
+            assert events[0].type == RESYNC
+            assert events[1].data == {"n": 4}
+            assert events[2] is None
+            assert subscription.dropped == bus.dropped == 4
+
+        asyncio.run(scenario())
+
+    def test_publish_from_thread(self):
+        """Test that events published from a worker thread are delivered"""
+        from app.core.events import EventBus
+
+        async def scenario():
+            bus = EventBus()
+            subscription = bus.subscribe(1)
+            await asyncio.to_thread(bus.publish, 1, "fish.died", {"fish_id": 3})
+            event = await subscription.get(1)
+            assert event.type == "fish.died"
+
+        asyncio.run(scenario())
+
+
 if __name__ == "__main__":
     # Run tests
-    test_classes = [TestSettings, TestLogging, TestExceptions, TestCoreIntegration]
+    test_classes = [TestSettings, TestLogging, TestExceptions, TestCoreIntegration, TestMetrics, TestEvents]
     
     for test_class in test_classes:
         print(f"\nTesting {test_class.__name__}...")
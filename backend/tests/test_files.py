@@ -0,0 +1,179 @@
+"""
+Test the data file helpers, codecs and migration tool
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.core.exceptions import CorruptDataFileError
+from app.db import files
+from app.db.codecs import MAGIC, FORMAT_VERSION, decode_file, encode_file, get_codec
+from app.db.files import _load_json_file, _save_json_file
+from app.db.migrate import load_rows, migrate_file
+from app.models import User, Task, Fish, TaskStatus
+
+def test_save_keeps_previous_snapshot(tmp_path):
+    """Test that a save replaces the file atomically and keeps the old version"""
+    path = str(tmp_path / "users.json")
+    _save_json_file(path, [{"id": 1}])
+    _save_json_file(path, [{"id": 1}, {"id": 2}])
+
+    assert _load_json_file(path) == [{"id": 1}, {"id": 2}]
+    assert _load_json_file(path + ".bak") == [{"id": 1}]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_corrupt_file_recovers_from_backup(tmp_path):
+    """Test that a torn file is set aside and the last good snapshot is loaded"""
+    path = str(tmp_path / "users.json")
+    _save_json_file(path, [{"id": 1}])
+    _save_json_file(path, [{"id": 1}, {"id": 2}])
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('[{"id": 1}, {"i')
+
+    assert _load_json_file(path) == [{"id": 1}]
+    assert os.path.exists(path + ".corrupt")
+
+def test_corrupt_file_without_backup_raises(tmp_path):
+    """Test that corrupt data is never silently replaced by an empty list"""
+    path = str(tmp_path / "users.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('[{"id": 1')
+    with pytest.raises(CorruptDataFileError):
+        _load_json_file(path)
+
+def test_concurrent_saves_are_coalesced(tmp_path, monkeypatch):
+    """Test that saves arriving during a write share one later write"""
+    path = str(tmp_path / "tasks.json")
+    writes = []
+    first_write_started = threading.Event()
+    release_first_write = threading.Event()
+    original = files._write_atomically
+
+    def slow_write(file_path, data, codec):
+        writes.append(data)
+        if len(writes) == 1:
+            first_write_started.set()
+            release_first_write.wait()
+        original(file_path, data, codec)
+
+    monkeypatch.setattr(files, "_write_atomically", slow_write)
+    tickets = files._writer._tickets
+    first = threading.Thread(target=_save_json_file, args=(path, [{"id": 0}]))
+    first.start()
+    first_write_started.wait()
+    waiters = [threading.Thread(target=_save_json_file, args=(path, [{"id": i}])) for i in range(1, 6)]
+    for thread in waiters:
+        thread.start()
+    while files._writer._tickets < tickets + 6:
+        time.sleep(0.001)
+    release_first_write.set()
+    for thread in [first] + waiters:
+        thread.join()
+
+    assert len(writes) == 2
+    assert _load_json_file(path) == writes[-1]
+
+def test_binary_codec_round_trip():
+    """Test that the binary codec restores every value type, datetimes included"""
+    aware = datetime(2024, 5, 1, 12, 30, tzinfo=timezone(timedelta(hours=2)))
+    rows = [
+        {"id": 1, "name": "émoji 🐟", "at": datetime(2024, 1, 2, 3, 4, 5, 678), "tz": aware,
+         "score": 1.5, "ok": True, "maybe": None, "big": 1 << 80, "tags": ["a", "b"],
+         "tasks": {10: {"id": 10, "status": TaskStatus.COMPLETED}}, "empty": {}},
+        {"id": 2, "name": "", "at": datetime(1969, 12, 31), "tz": aware, "score": -2.0,
+         "ok": False, "maybe": 3, "big": -5, "tags": [], "tasks": {}, "empty": {}},
+        {"id": 3, "other": "shape"},
+    ]
+    decoded = decode_file(encode_file(rows, get_codec("binary")))
+
+    assert decoded == rows
+    assert decoded[0]["tz"].utcoffset() == timedelta(hours=2)
+    assert decoded[0]["tasks"][10]["status"] == "completed"
+
+def test_user_model_survives_binary_codec():
+    """Test that model rows decode back to equal models"""
+    user = User(id=1, username="binary", last_login=datetime.now(),
+                tasks={1: Task(id=1, title="Task", user_id=1)})
+    rows = decode_file(encode_file([user.model_dump()], get_codec("binary")))
+
+    assert User(**rows[0]) == user
+    assert isinstance(rows[0]["created_at"], datetime)
+
+def test_user_model_survives_msgpack_codec():
+    """Test that a user with tasks and fishes round-trips through msgpack, datetimes included"""
+    pytest.importorskip("msgpack")
+    user = User(id=1, username="msgpack", last_login=datetime.now(),
+                tasks={1: Task(id=1, title="Task", user_id=1, completed_at=datetime.now(timezone.utc))},
+                fishes={1: Fish(id=1, name="Bubbles", category="Work", user_id=1)})
+    rows = decode_file(encode_file([user.model_dump()], get_codec("msgpack")))
+
+    assert User(**rows[0]) == user
+    assert isinstance(rows[0]["created_at"], datetime)
+    assert rows[0]["tasks"][1]["completed_at"].utcoffset() == timedelta(0)
+
+def test_load_detects_codec_from_header(tmp_path):
+    """Test that files load whichever codec wrote them"""
+    path = str(tmp_path / "users.json")
+    _save_json_file(path, [{"id": 1, "at": datetime(2024, 1, 1)}], codec="binary")
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    assert _load_json_file(path) == [{"id": 1, "at": datetime(2024, 1, 1)}]
+
+    # Switching back to JSON writes the original headerless format
+    _save_json_file(path, [{"id": 1}], codec="json")
+    with open(path, encoding="utf-8") as f:
+        assert f.read().startswith("[")
+    assert _load_json_file(path) == [{"id": 1}]
+
+def test_corrupt_binary_file_recovers_from_backup(tmp_path):
+    """Test that a truncated binary snapshot falls back to its backup"""
+    path = str(tmp_path / "users.json")
+    _save_json_file(path, [{"id": 1}], codec="binary")
+    _save_json_file(path, [{"id": 1}, {"id": 2}], codec="binary")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    assert _load_json_file(path) == [{"id": 1}]
+
+def test_newer_format_version_is_rejected(tmp_path):
+    """Test that a file from a newer format version is not misread"""
+    path = str(tmp_path / "users.json")
+    with open(path, "wb") as f:
+        f.write(MAGIC + bytes((FORMAT_VERSION + 1, 1)))
+    with pytest.raises(CorruptDataFileError):
+        _load_json_file(path)
+
+def test_unknown_codec_is_rejected(tmp_path):
+    """Test that a misconfigured codec fails loudly"""
+    with pytest.raises(ValueError):
+        _save_json_file(str(tmp_path / "users.json"), [], codec="xml")
+
+def test_migrate_file_to_binary(tmp_path):
+    """Test that migration folds in the log, converts and keeps a backup"""
+    path = str(tmp_path / "tasks.json")
+    _save_json_file(path, [{"id": 1, "title": "Snapshotted"}, {"id": 2, "title": "Deleted"}])
+    with open(path + ".log", "w", encoding="utf-8") as f:
+        f.write('{"put": {"id": 3, "title": "Only in the log"}}\n{"del": 2}\n')
+
+    migrate_file(path, "binary")
+
+    assert [row["title"] for row in load_rows(path)] == ["Snapshotted", "Only in the log"]
+    assert os.path.getsize(path + ".log") == 0
+    assert _load_json_file(path + ".bak") == [{"id": 1, "title": "Snapshotted"}, {"id": 2, "title": "Deleted"}]
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+
+def test_migrate_ignores_torn_log_tail(tmp_path):
+    """Test that a partially written final log record is discarded"""
+    path = str(tmp_path / "tasks.json")
+    with open(path + ".log", "w", encoding="utf-8") as f:
+        f.write('{"put": {"id": 1, "title": "Kept"}}\n{"put": {"id": 2, "ti')
+
+    assert load_rows(path) == [{"id": 1, "title": "Kept"}]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -255,8 +255,9 @@ class TestIntegration:
         assert fish_id in fishes
         
         # Verify relationships are maintained
-        assert task_id in users[user_id].tasks
-        assert fish_id in users[user_id].fishes
+        user = client.get(f"/api/v1/users/{user_id}").json()
+        assert str(task_id) in user["tasks"]
+        assert str(fish_id) in user["fishes"]
         assert tasks[task_id].user_id == user_id
         assert fishes[fish_id].user_id == user_id
         
@@ -273,8 +274,9 @@ class TestIntegration:
         # Verify update is reflected in storage
         assert tasks[task_id].title == "Updated Consistency Task"
         assert tasks[task_id].status == TaskStatus.COMPLETED
-        assert users[user_id].tasks[task_id].title == "Updated Consistency Task"
-        assert users[user_id].tasks[task_id].status == TaskStatus.COMPLETED
+        user = client.get(f"/api/v1/users/{user_id}").json()
+        assert user["tasks"][str(task_id)]["title"] == "Updated Consistency Task"
+        assert user["tasks"][str(task_id)]["status"] == "completed"
         
         # Delete task and verify consistency
         delete_response = client.delete(f"/api/v1/tasks/users/{user_id}/tasks/{task_id}")
@@ -282,7 +284,7 @@ class TestIntegration:
         
         # Verify deletion is reflected in storage
         assert task_id not in tasks
-        assert task_id not in users[user_id].tasks
+        assert str(task_id) not in client.get(f"/api/v1/users/{user_id}").json()["tasks"]
     
     def test_fish_feeding_and_survival_workflow(self):
         """Test fish feeding and survival mechanics"""
@@ -0,0 +1,743 @@
+"""
+Test repository backends
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import asyncio
+import threading
+import time
+from app.db.repository import Repository, SQLiteRepository, MemoryRepository, create_repository
+from app.db.async_repository import AsyncRepository
+from app.db.shared import EventRelay, SharedRepository
+from app.db.state_server import StateServer
+from app.db.wal import DurableMemoryRepository
+from app.db.storage import users, tasks, achievements, fishes
+from app.models import User, Task, Achievement, Fish, TaskStatus, AchievementType, UserCounters
+from app.core.exceptions import DuplicateUsernameError, UserNotFoundError
+from app.core.events import EventBus
+
+
+class TestSQLiteRepository:
+    """Test the SQLite repository backend"""
+
+    def make_repository(self, tmp_path):
+        return SQLiteRepository(str(tmp_path / "test.sqlite3"))
+
+    def test_wal_mode(self, tmp_path):
+        """Test that the database is opened in WAL mode"""
+        repo = self.make_repository(tmp_path)
+        mode = repo._conn().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    def test_user_round_trip(self, tmp_path):
+        """Test storing and loading users"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="sqliteuser"))
+
+        assert repo.has_user(1)
+        assert not repo.has_user(2)
+        assert repo.get_user(1).username == "sqliteuser"
+        assert repo.get_user_by_username("sqliteuser").id == 1
+        assert repo.get_user_by_username("missing") is None
+
+        user = repo.get_user(1)
+        user.login_streak = 4
+        repo.save_user(user)
+        assert repo.get_user(1).login_streak == 4
+
+    def test_duplicate_username(self, tmp_path):
+        """Test that the unique username index rejects duplicates"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="taken"))
+        with pytest.raises(DuplicateUsernameError):
+            repo.add_user(User(id=2, username="taken"))
+
+    def test_children_are_nested_on_user(self, tmp_path):
+        """Test that a loaded user carries its tasks, fishes and achievements"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="parent"))
+        repo.add_user(User(id=2, username="other"))
+        repo.add_task(Task(id=1, title="Mine", user_id=1))
+        repo.add_task(Task(id=2, title="Theirs", user_id=2))
+        repo.add_fish(Fish(id=1, name="Goldie", category="Goldfish", user_id=1))
+        repo.add_achievement(Achievement(
+            id=1, title="First", description="Test",
+            achievement_type=AchievementType.CUSTOM, user_id=1
+        ))
+
+        user = repo.get_user(1)
+        assert list(user.tasks) == [1]
+        assert list(user.fishes) == [1]
+        assert list(user.achievements) == [1]
+        assert [task.title for task in repo.list_tasks(2)] == ["Theirs"]
+        assert len(repo.list_achievements()) == 1
+
+    def test_list_users_loads_only_requested_children(self, tmp_path):
+        """Test that a users page projected past the children skips their queries"""
+        repo = self.make_repository(tmp_path)
+        for user_id in (1, 2):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+            repo.add_task(Task(id=user_id, title="Task", user_id=user_id))
+        queries = []
+        repo._conn().set_trace_callback(queries.append)
+
+        page = repo.list_users(fields={"id", "username"})
+        assert [user.username for user in page] == ["user1", "user2"]
+        assert all(user.tasks == {} for user in page)
+        assert len(queries) == 1
+
+        queries.clear()
+        page = repo.list_users(fields={"id", "tasks"})
+        assert [list(user.tasks) for user in page] == [[1], [2]]
+        assert len(queries) == 3
+
+    def test_task_update_and_delete(self, tmp_path):
+        """Test saving and deleting tasks"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="tasker"))
+        task = repo.add_task(Task(id=1, title="Original", user_id=1))
+
+        task.status = TaskStatus.COMPLETED
+        repo.save_task(task)
+        assert repo.get_task(1).status == TaskStatus.COMPLETED
+
+        assert repo.delete_task(1) is True
+        assert repo.delete_task(1) is False
+        assert repo.get_task(1) is None
+
+    def test_batch_task_writes(self, tmp_path):
+        """Test that add_tasks/save_tasks write every task"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="batcher"))
+        batch = [Task(id=i, title=f"Task {i}", user_id=1) for i in range(1, 101)]
+        repo.add_tasks(batch)
+        assert len(repo.list_tasks(1)) == 100
+
+        for task in batch:
+            task.status = TaskStatus.COMPLETED
+        repo.save_tasks(batch)
+        assert all(task.status == TaskStatus.COMPLETED for task in repo.list_tasks(1))
+
+    def test_paging(self, tmp_path):
+        """Test after_id/limit paging on list queries"""
+        repo = self.make_repository(tmp_path)
+        for user_id in range(1, 6):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+            repo.add_task(Task(id=user_id, title=f"Task {user_id}", user_id=1))
+
+        assert [user.id for user in repo.list_users(limit=2)] == [1, 2]
+        assert [user.id for user in repo.list_users(after_id=2, limit=2)] == [3, 4]
+        assert [task.id for task in repo.list_tasks(1, after_id=4)] == [5]
+
+    def test_data_survives_reopen(self, tmp_path):
+        """Test that a second repository on the same file sees the data"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="persistent"))
+        fish = repo.add_fish(Fish(id=1, name="Nemo", category="Clownfish", user_id=1))
+        fish.xp = 7
+        repo.save_fish(fish)
+
+        reopened = self.make_repository(tmp_path)
+        assert reopened.get_user_by_username("persistent").id == 1
+        assert reopened.get_fish(1).xp == 7
+
+    def test_versions_persist_and_increase(self, tmp_path):
+        """Test that every save stores the next version"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="versioned"))
+        repo.add_fish(Fish(id=1, name="Fish", category="Work", user_id=1))
+        fish = repo.get_fish(1)
+        assert fish.version == 1
+
+        repo.save_fishes([fish])
+        repo.save_fish(fish)
+        assert self.make_repository(tmp_path).get_fish(1).version == 3
+        with pytest.raises(DuplicateUsernameError):
+            repo.add_user(User(id=2, username="versioned"))
+        assert repo.get_user(1).version == 1
+
+    def test_concurrent_saves_get_distinct_versions(self, tmp_path):
+        """Test that two workers saving the same rows read at one version store different versions"""
+        first, second = self.make_repository(tmp_path), self.make_repository(tmp_path)
+        first.add_user(User(id=1, username="racer"))
+        first.add_task(Task(id=1, title="Task", user_id=1))
+        first.add_fish(Fish(id=1, name="Fish", category="Work", user_id=1))
+
+        for get, save in (("get_user_without_children", "save_user"), ("get_task", "save_task"),
+                          ("get_fish", "save_fishes")):
+            mine, theirs = getattr(first, get)(1), getattr(second, get)(1)
+            for repo, model in ((first, mine), (second, theirs)):
+                getattr(repo, save)([model] if save == "save_fishes" else model)
+            assert (mine.version, theirs.version) == (2, 3)
+            assert getattr(first, get)(1).version == 3
+
+    def test_conditional_fish_save(self, tmp_path):
+        """Test that save_fishes_if_current leaves fishes written since they were read"""
+        repo = self.make_repository(tmp_path)
+        repo.add_user(User(id=1, username="racer"))
+        for fish_id in (1, 2):
+            repo.add_fish(Fish(id=fish_id, name="Fish", category="Work", user_id=1))
+        read = repo.scan_fishes()
+        concurrent = repo.get_fish(2)
+        concurrent.feed_meter = 9
+        repo.save_fish(concurrent)
+
+        for fish in read:
+            fish.feed_meter = 1
+        assert [fish.id for fish in repo.save_fishes_if_current(read)] == [1]
+        assert read[1].version == 1
+        assert repo.get_fish(1).feed_meter == 1
+        assert repo.get_fish(2).feed_meter == 9
+
+
+class TestMemoryRepository:
+    """Test the in-memory repository backend"""
+
+    def setup_method(self):
+        """Clear storage before each test"""
+        users.clear()
+        tasks.clear()
+        achievements.clear()
+        fishes.clear()
+
+    def test_writes_reach_storage_dicts(self):
+        """Test that each entity is stored once and users are assembled from the per-user indexes"""
+        repo = MemoryRepository()
+        repo.add_user(User(id=1, username="memoryuser"))
+        repo.add_task(Task(id=1, title="Task", user_id=1))
+
+        assert 1 in users
+        assert 1 in tasks
+        assert users[1].tasks == {}
+        assert list(repo.get_user(1).tasks) == [1]
+
+        repo.delete_task(1)
+        assert 1 not in tasks
+        assert repo.get_user(1).tasks == {}
+
+    def test_assembled_users_are_reused_until_written(self):
+        """Test that an assembled user is handed out again until it or a child is written"""
+        repo = MemoryRepository()
+        repo.add_user(User(id=1, username="assembled"))
+        assert repo.get_user(1) is users[1]
+
+        repo.add_task(Task(id=1, title="Task", user_id=1))
+        user = repo.get_user(1)
+        assert repo.get_user(1) is user
+
+        repo.add_achievement(Achievement(id=1, title="First", description="", achievement_type=AchievementType.CUSTOM,
+                                         user_id=1))
+        user = repo.get_user(1)
+        assert list(user.achievements) == [1] and repo.get_user(1) is user
+
+        user.total_visits = 3
+        repo.save_user(user)
+        assert repo.get_user(1) is not user
+        assert repo.get_user(1).total_visits == 3
+        assert users[1].tasks == {} and list(repo.get_user(1).tasks) == [1]
+
+    def test_list_users_skips_assembly_without_children(self):
+        """Test that a users page projected past the children hands out the stored users"""
+        repo = MemoryRepository()
+        repo.add_user(User(id=1, username="projected"))
+        repo.add_task(Task(id=1, title="Task", user_id=1))
+
+        assert repo.list_users(fields={"id", "username"})[0] is users[1]
+        assert list(repo.list_users(fields={"tasks"})[0].tasks) == [1]
+        assert list(repo.list_users()[0].tasks) == [1]
+
+    def test_children_need_their_user(self, tmp_path):
+        """Test that tasks, fishes and achievements cannot be saved for a missing user"""
+        for repo in (MemoryRepository(), SQLiteRepository(str(tmp_path / "orphans.sqlite3"))):
+            with pytest.raises(UserNotFoundError):
+                repo.add_task(Task(id=1, title="Orphan", user_id=99))
+            with pytest.raises(UserNotFoundError):
+                repo.add_fish(Fish(id=1, name="Orphan", category="Work", user_id=99))
+            with pytest.raises(UserNotFoundError):
+                repo.add_achievement(Achievement(id=1, title="Orphan", description="",
+                                                 achievement_type=AchievementType.CUSTOM, user_id=99))
+            assert repo.list_achievements(99) == [] and repo.get_task(1) is None
+
+    def test_user_counters(self, tmp_path):
+        """Test that the running counters agree with counting the rows, through updates and deletes"""
+        memory = MemoryRepository()
+        sqlite = SQLiteRepository(str(tmp_path / "counters.sqlite3"))
+        for repo in (memory, sqlite):
+            repo.add_user(User(id=1, username="counted"))
+            repo.add_tasks([Task(id=n, title=f"Task {n}", user_id=1) for n in range(1, 5)])
+            repo.add_fish(Fish(id=1, name="Nemo", category="Work", user_id=1, level=3, xp=4))
+            repo.add_fish(Fish(id=2, name="Dory", category="Work", user_id=1, alive=False))
+            repo.add_achievement(Achievement(id=1, title="First", description="", user_id=1,
+                                             achievement_type=AchievementType.CUSTOM, is_completed=True))
+
+            # Stored objects changed in place and saved again must not be counted twice
+            task = repo.get_task(1)
+            task.status = TaskStatus.COMPLETED
+            repo.save_task(task)
+            repo.save_task(task)
+            repo.save_task(Task(id=2, title="Task 2", user_id=1, status=TaskStatus.CANCELLED))
+            repo.delete_task(3)
+            fish = repo.get_fish(1)
+            fish.xp += 20
+            repo.save_fish(fish)
+
+        expected = UserCounters(pending_tasks=1, completed_tasks=1, cancelled_tasks=1, fishes=2, living_fishes=1,
+                                total_xp=30 + 24, achievements=1, completed_achievements=1)
+        assert memory.get_user_counters(1) == expected
+        assert sqlite.get_user_counters(1) == expected
+        # The aggregate queries agree with reading every row
+        assert Repository.get_user_counters(sqlite, 1) == expected
+        assert memory.get_user_counters(2) == sqlite.get_user_counters(2) == UserCounters()
+
+        for repo in (memory, sqlite):
+            user = repo.get_user_without_children(1)
+            assert (user.username, user.tasks, user.fishes, user.achievements) == ("counted", {}, {}, {})
+            assert repo.get_user_without_children(2) is None
+
+    def test_saves_bump_versions(self):
+        """Test that adds and saves give each model its next version"""
+        repo = MemoryRepository()
+        user = repo.add_user(User(id=1, username="versioned"))
+        task = repo.add_task(Task(id=1, title="Task", user_id=1))
+        assert (user.version, task.version) == (1, 1)
+
+        repo.save_tasks([task])
+        repo.save_user(user)
+        assert (user.version, task.version) == (2, 2)
+
+    def test_duplicate_username(self):
+        """Test that duplicate usernames are rejected"""
+        repo = MemoryRepository()
+        repo.add_user(User(id=1, username="taken"))
+        with pytest.raises(DuplicateUsernameError):
+            repo.add_user(User(id=2, username="taken"))
+
+
+class TestAsyncRepository:
+    """Test the awaitable wrapper used by the routes"""
+
+    def setup_method(self):
+        """Clear storage before each test"""
+        users.clear()
+
+    def test_memory_backend_runs_inline(self):
+        """Test that the non-blocking backend is called on the event loop thread"""
+        class Recording(MemoryRepository):
+            def get_user(self, user_id):
+                self.thread = threading.current_thread()
+                return super().get_user(user_id)
+
+        repo = Recording()
+        repo.add_user(User(id=1, username="inline"))
+        wrapper = AsyncRepository(repo)
+        assert asyncio.run(wrapper.get_user(1)).username == "inline"
+        assert repo.thread is threading.main_thread()
+
+    def test_blocking_backend_does_not_stall_loop(self, tmp_path):
+        """Test that a slow blocking call leaves the event loop free"""
+        class SlowSQLite(SQLiteRepository):
+            def get_user(self, user_id):
+                time.sleep(0.3)
+                return super().get_user(user_id)
+
+        repo = SlowSQLite(str(tmp_path / "slow.sqlite3"))
+        repo.add_user(User(id=1, username="slow"))
+        wrapper = AsyncRepository(repo, max_workers=2)
+
+        async def scenario():
+            order = []
+
+            async def fast():
+                await asyncio.sleep(0.01)
+                order.append("fast")
+
+            async def slow():
+                user = await wrapper.get_user(1)
+                order.append(user.username)
+
+            await asyncio.gather(slow(), fast())
+            return order
+
+        try:
+            assert asyncio.run(scenario()) == ["fast", "slow"]
+        finally:
+            wrapper.shutdown()
+
+    def test_write_behind_users(self, tmp_path):
+        """Test that deferred user saves are readable at once and group-committed later"""
+        repo = SQLiteRepository(str(tmp_path / "behind.sqlite3"))
+        for user_id in range(1, 4):
+            repo.add_user(User(id=user_id, username=f"visitor{user_id}"))
+        wrapper = AsyncRepository(repo, flush_interval_ms=60_000, flush_max_records=3)
+
+        async def scenario():
+            flusher = asyncio.create_task(wrapper.run_user_flusher())
+            await asyncio.sleep(0)
+
+            user = await wrapper.get_user(1)
+            user.total_visits = 5
+            await wrapper.save_user_later(user)
+            # Visible through the wrapper, with a new version, not yet in storage
+            assert (await wrapper.get_user(1)).total_visits == 5
+            assert (await wrapper.get_user(1)).version == 2
+            assert (await wrapper.list_users())[0].total_visits == 5
+            assert repo.get_user(1).total_visits == 0
+
+            # Reaching flush_max_records triggers a group commit
+            for user_id in (2, 3):
+                user = await wrapper.get_user(user_id)
+                user.total_visits = 1
+                await wrapper.save_user_later(user)
+            for _ in range(100):
+                if repo.get_user(3).total_visits == 1:
+                    break
+                await asyncio.sleep(0.01)
+            assert [repo.get_user(i).total_visits for i in (1, 2, 3)] == [5, 1, 1]
+            # Stored at the version readers were shown, not bumped again
+            assert repo.get_user(1).version == 2
+
+            # Stopping the flusher writes out what is still pending
+            user = await wrapper.get_user(2)
+            user.total_visits = 9
+            await wrapper.save_user_later(user)
+            # Changes to the caller's user or a pending copy do not reach the queue
+            user.total_visits = 10
+            wrapper.pending_user(2).total_visits = 11
+            assert (await wrapper.get_user(2)).total_visits == 9
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+            assert repo.get_user(2).total_visits == 9
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            wrapper.shutdown()
+
+    def test_direct_save_waits_for_flush(self, tmp_path):
+        """Test that a flush already writing an older user cannot overwrite a direct save"""
+        class SlowUsers(SQLiteRepository):
+            def save_users(self, users):
+                time.sleep(0.1)
+                return super().save_users(users)
+
+        repo = SlowUsers(str(tmp_path / "race.sqlite3"))
+        repo.add_user(User(id=1, username="racer"))
+        wrapper = AsyncRepository(repo, flush_interval_ms=60_000)
+
+        async def scenario():
+            flusher = asyncio.create_task(wrapper.run_user_flusher())
+            await asyncio.sleep(0)
+            user = await wrapper.get_user(1)
+            user.total_visits = 1
+            await wrapper.save_user_later(user)
+            flush = asyncio.create_task(wrapper.flush_users())
+            await asyncio.sleep(0.02)
+
+            user = await wrapper.get_user(1)
+            user.total_visits = 2
+            await wrapper.save_user(user)
+            await flush
+            flusher.cancel()
+            await asyncio.gather(flusher, return_exceptions=True)
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            wrapper.shutdown()
+        assert repo.get_user(1).total_visits == 2
+
+    def test_write_through_without_flusher(self, tmp_path):
+        """Test that deferred saves write at once when no flusher is running"""
+        repo = SQLiteRepository(str(tmp_path / "through.sqlite3"))
+        repo.add_user(User(id=1, username="direct"))
+        wrapper = AsyncRepository(repo)
+        user = repo.get_user(1)
+        user.total_visits = 3
+        try:
+            asyncio.run(wrapper.save_user_later(user))
+        finally:
+            wrapper.shutdown()
+        assert repo.get_user(1).total_visits == 3
+
+
+class TestSharedRepository:
+    """Test the shared backend against a state server running in a thread"""
+
+    def setup_method(self):
+        """Clear storage before each test; the server keeps its tables there"""
+        users.clear()
+        tasks.clear()
+        achievements.clear()
+        fishes.clear()
+
+    def start_server(self, tmp_path) -> StateServer:
+        server = StateServer(str(tmp_path / "state.sock"))
+        server.bind()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_workers_share_state(self, tmp_path):
+        """Test that a write through one connection is seen by another at once"""
+        server = self.start_server(tmp_path)
+        try:
+            first = SharedRepository(server.path, autostart=False)
+            second = SharedRepository(server.path, autostart=False)
+            user = first.add_user(User(id=1, username="shared"))
+            assert user.version == 1
+            assert second.get_user_by_username("shared").id == 1
+            with pytest.raises(DuplicateUsernameError):
+                second.add_user(User(id=2, username="shared"))
+
+            second.add_tasks([Task(id=1, title="One", user_id=1), Task(id=2, title="Two", user_id=1)])
+            assert [task.id for task in first.list_tasks(1)] == [1, 2]
+            assert first.delete_task(1)
+            assert [task.id for task in second.list_tasks(1)] == [2]
+
+            first.add_fish(Fish(id=1, name="Fish", category="Work", user_id=1))
+            stale = second.get_fish(1)
+            first.save_fish(first.get_fish(1))
+            assert second.save_fishes_if_current([stale]) == []
+            assert second.save_fishes_if_current([second.get_fish(1)])[0].version == 3
+        finally:
+            server.close()
+
+    def test_etag_epoch_follows_server(self, tmp_path):
+        """Test that workers take their ETag epoch from the server they are connected to"""
+        servers = [self.start_server(tmp_path / name) for name in ("first", "second")]
+        try:
+            epochs = []
+            for server in servers:
+                repo = SharedRepository(server.path, autostart=False)
+                assert not repo.has_user(1)
+                assert repo.etag_epoch == server.repository.etag_epoch
+                epochs.append(repo.etag_epoch)
+            assert epochs[0] != epochs[1]
+        finally:
+            for server in servers:
+                server.close()
+
+    def test_events_reach_every_worker(self, tmp_path):
+        """Test that an event published in one worker reaches streams open in every worker"""
+        server = self.start_server(tmp_path)
+        buses = [EventBus(), EventBus()]
+        for bus in buses:
+            bus.relay = EventRelay(server.path, bus, autostart=False)
+
+        async def wait_for_watchers(count):
+            for _ in range(100):
+                if len(server._watchers.get(1, ())) == count:
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError(f"server never saw {count} watchers")
+
+        async def scenario():
+            here, there = buses[0].subscribe(1), buses[1].subscribe(1)
+            await wait_for_watchers(2)
+            buses[0].publish(1, "fish.fed", {"fish_id": 7})
+            for subscription in (here, there):
+                event = await subscription.get(1)
+                assert (event.type, event.data) == ("fish.fed", {"fish_id": 7})
+
+            there.close()
+            await wait_for_watchers(1)
+            buses[1].publish(1, "fish.died", {"fish_id": 7})
+            assert (await here.get(1)).type == "fish.died"
+            here.close()
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            for bus in buses:
+                bus.relay.close()
+            server.close()
+
+    def test_relay_publish_does_not_block(self, tmp_path):
+        """Test that publishing never waits on a state server that stopped reading"""
+        import socket
+        path = str(tmp_path / "stalled.sock")
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.bind(path)
+        stalled.listen()
+        relay = EventRelay(path, EventBus(), autostart=False)
+        try:
+            start = time.monotonic()
+            for _ in range(200):
+                relay.publish(1, "fish.fed", {"padding": "x" * 65536})
+            assert time.monotonic() - start < 1
+        finally:
+            relay.close()
+            stalled.close()
+
+    def test_saving_user_keeps_children(self, tmp_path):
+        """Test that a stale copy of a user does not overwrite newer children"""
+        server = self.start_server(tmp_path)
+        try:
+            repo = SharedRepository(server.path, autostart=False)
+            repo.add_user(User(id=1, username="parent"))
+            stale = repo.get_user(1)
+            repo.add_fish(Fish(id=1, name="Nemo", category="Work", user_id=1))
+
+            stale.total_visits = 5
+            repo.save_user(stale)
+            assert stale.version == 2
+            stored = repo.get_user(1)
+            assert stored.total_visits == 5
+            assert list(stored.fishes) == [1]
+        finally:
+            server.close()
+
+    def test_user_saves_write_through(self, tmp_path):
+        """Test that streak saves are not held back where other workers could miss them"""
+        server = self.start_server(tmp_path)
+        try:
+            repo = SharedRepository(server.path, autostart=False)
+            repo.add_user(User(id=1, username="visitor"))
+            wrapper = AsyncRepository(repo, max_workers=2, flush_interval_ms=60_000)
+
+            async def scenario():
+                flusher = asyncio.create_task(wrapper.run_user_flusher())
+                await asyncio.sleep(0)
+                user = await wrapper.get_user(1)
+                user.total_visits = 3
+                await wrapper.save_user_later(user)
+                assert repo.get_user(1).total_visits == 3
+                flusher.cancel()
+                await asyncio.gather(flusher, return_exceptions=True)
+
+            try:
+                asyncio.run(scenario())
+            finally:
+                wrapper.shutdown()
+        finally:
+            server.close()
+
+
+class TestDurableMemoryRepository:
+    """Test snapshot + write-ahead-log persistence of the memory backend"""
+
+    def setup_method(self):
+        """Clear storage before each test"""
+        users.clear()
+        tasks.clear()
+        achievements.clear()
+        fishes.clear()
+
+    def test_restart_replays_log(self, tmp_path):
+        """Test that every logged write is back after a restart"""
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=1, username="durable"))
+        repo.add_tasks([Task(id=1, title="Keep", user_id=1), Task(id=2, title="Drop", user_id=1)])
+        repo.add_fish(Fish(id=1, name="Nemo", category="Work", user_id=1))
+        repo.delete_task(2)
+        user = repo.get_user(1)
+        user.total_visits = 4
+        repo.save_user(user)
+
+        repo = DurableMemoryRepository(str(tmp_path))
+        user = repo.get_user(1)
+        assert (user.total_visits, user.version) == (4, 2)
+        assert list(user.tasks) == [1] and list(tasks) == [1]
+        assert list(user.fishes) == [1]
+        counters = repo.get_user_counters(1)
+        assert (counters.pending_tasks, counters.living_fishes) == (1, 1)
+
+    def test_snapshot_then_log(self, tmp_path):
+        """Test recovery from a snapshot plus the writes made after it"""
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=1, username="snap"))
+        repo.add_task(Task(id=1, title="Before", user_id=1))
+        repo.snapshot()
+        repo.add_task(Task(id=2, title="After", user_id=1))
+        repo.snapshot()
+        repo.add_task(Task(id=3, title="Latest", user_id=1))
+
+        # Segments are kept back to the snapshot the .bak file holds
+        assert len(repo.wal.segments()) == 2
+        restarted = DurableMemoryRepository(str(tmp_path))
+        assert [task.title for task in restarted.list_tasks(1)] == ["Before", "After", "Latest"]
+
+    def test_snapshot_copies_in_chunks(self, tmp_path, monkeypatch):
+        """Test that writes between a snapshot's chunks are recovered, with the lock free in between"""
+        from app.db import wal
+        monkeypatch.setattr(wal, "SNAPSHOT_CHUNK_SIZE", 2)
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=1, username="chunked"))
+        repo.add_tasks([Task(id=i, title=f"Task {i}", user_id=1) for i in range(1, 6)])
+        dump = Task.model_dump
+        writes = []
+
+        def dump_then_write(task, **kwargs):
+            if not writes:
+                # Runs between chunks; another thread must be able to write now
+                writes.append(task.id)
+                other = threading.Thread(target=lambda: (
+                    repo.save_task(Task(id=1, title="Changed after copy", user_id=1)),
+                    repo.delete_task(5),
+                ))
+                other.start()
+                other.join(5)
+                assert not other.is_alive()
+            return dump(task, **kwargs)
+
+        monkeypatch.setattr(Task, "model_dump", dump_then_write)
+        repo.snapshot()
+        monkeypatch.undo()
+        assert writes == [1]
+
+        restarted = DurableMemoryRepository(str(tmp_path))
+        assert [task.title for task in restarted.list_tasks(1)] == [
+            "Changed after copy", "Task 2", "Task 3", "Task 4",
+        ]
+
+    def test_torn_tail_is_dropped(self, tmp_path):
+        """Test that a half-written last record is cut off, keeping everything before it"""
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=1, username="torn"))
+        with open(repo.wal.segment_path(repo.wal.segment), "ab") as f:
+            f.write(b'{"put":"tasks","row":{"id":')
+
+        restarted = DurableMemoryRepository(str(tmp_path))
+        assert restarted.get_user(1).username == "torn"
+        restarted.add_task(Task(id=1, title="After recovery", user_id=1))
+        assert DurableMemoryRepository(str(tmp_path)).get_task(1).title == "After recovery"
+
+    def test_invalid_record_is_skipped(self, tmp_path):
+        """Test that a record that no longer validates is skipped instead of aborting recovery"""
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=1, username="lenient"))
+        with open(repo.wal.segment_path(repo.wal.segment), "ab") as f:
+            f.write(b'{"put":"fishes","row":{"id":1,"name":"Nemo","category":"Work","user_id":1,"feed_meter":-1}}\n')
+        repo.add_task(Task(id=1, title="After the bad record", user_id=1))
+
+        restarted = DurableMemoryRepository(str(tmp_path))
+        assert restarted.skipped_records == 1
+        assert restarted.get_fish(1) is None
+        assert restarted.get_task(1).title == "After the bad record"
+
+    def test_snapshot_due_bounds_replay(self, tmp_path):
+        """Test that a snapshot is due once the log outgrows its budget"""
+        repo = DurableMemoryRepository(str(tmp_path), snapshot_wal_bytes=2_000)
+        repo.add_user(User(id=1, username="budget"))
+        assert not repo.snapshot_due()
+        repo.add_tasks([Task(id=i, title=f"Task {i}", user_id=1) for i in range(1, 20)])
+        assert repo.snapshot_due()
+        repo.snapshot()
+        assert not repo.snapshot_due()
+
+    def test_recovery_seeds_ids(self, tmp_path):
+        """Test that IDs handed out after a restart do not collide with recovered rows"""
+        from app.services.id_service import id_service
+
+        repo = DurableMemoryRepository(str(tmp_path))
+        repo.add_user(User(id=5000, username="high"))
+        DurableMemoryRepository(str(tmp_path))
+        assert id_service.generate_user_id() > 5000
+
+
+def test_create_repository_rejects_unknown_type():
+    """Test that an unsupported database_type fails loudly"""
+    with pytest.raises(ValueError):
+        create_repository("postgresql")
@@ -7,9 +7,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi.testclient import TestClient
 from main import app
+from app.db.repository import repository
 from app.db.storage import users, tasks, achievements, fishes
-from app.models import User, Task, Achievement, Fish, TaskStatus, AchievementType
-from app.services.id_service import id_service
+from app.models import User, Achievement, Fish, AchievementType
+from app.routes.responses import EncodedCache, ModelJSONResponse, encoded_cache
+from app.routes.events import event_stream
+from app.core.events import event_bus
+import asyncio
+import json
+from fastapi.encoders import jsonable_encoder
 
 client = TestClient(app)
 
@@ -92,6 +98,56 @@ class TestRoutes:
         assert response.status_code == 404
         assert "User not found" in response.json()["detail"]
     
+    def test_users_pagination(self):
+        """Test cursor pagination over the user list"""
+        for name in ["page1", "page2", "page3"]:
+            client.post("/api/v1/users/", json={"username": name})
+
+        response = client.get("/api/v1/users/?limit=2")
+        assert response.status_code == 200
+        assert [user["username"] for user in response.json()] == ["page1", "page2"]
+        cursor = response.headers["X-Next-Cursor"]
+
+        response = client.get(f"/api/v1/users/?limit=2&cursor={cursor}")
+        assert [user["username"] for user in response.json()] == ["page3"]
+        assert "X-Next-Cursor" not in response.headers
+
+        response = client.get("/api/v1/users/?cursor=not-a-cursor")
+        assert response.status_code == 400
+    
+    def test_users_field_projection(self):
+        """Test that fields= trims each user to the requested fields"""
+        client.post("/api/v1/users/", json={"username": "projected"})
+
+        response = client.get("/api/v1/users/?fields=id,username")
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data[0]) == {"id", "username"}
+        assert data[0]["username"] == "projected"
+
+        response = client.get("/api/v1/users/?fields=id,password")
+        assert response.status_code == 400
+        assert "password" in response.json()["detail"]
+    
+    def test_tasks_pagination(self):
+        """Test paging through a user's tasks with a projection"""
+        user_response = client.post("/api/v1/users/", json={"username": "pagedtasks"})
+        user_id = user_response.json()["id"]
+        for i in range(5):
+            client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": f"Task {i}"})
+
+        titles = []
+        url = f"/api/v1/tasks/users/{user_id}/tasks?limit=2&fields=title"
+        response = client.get(url)
+        while True:
+            assert response.status_code == 200
+            titles.extend(task["title"] for task in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            response = client.get(f"{url}&cursor={cursor}")
+        assert titles == [f"Task {i}" for i in range(5)]
+    
     def test_create_task(self):
         """Test creating a new task"""
         # Create a user first
@@ -203,6 +259,54 @@ class TestRoutes:
         get_response = client.get(f"/api/v1/tasks/users/{user_id}/tasks/{task_id}")
         assert get_response.status_code == 404
     
+    def test_create_tasks_batch(self):
+        """Test creating many tasks in one request"""
+        user_response = client.post("/api/v1/users/", json={"username": "batchuser"})
+        user_id = user_response.json()["id"]
+
+        items = [{"title": f"Imported {i}"} for i in range(50)]
+        response = client.post(f"/api/v1/tasks/users/{user_id}/tasks:batch", json=items)
+        assert response.status_code == 200
+        results = response.json()
+        assert [result["index"] for result in results] == list(range(50))
+        assert all(result["status_code"] == 200 for result in results)
+        ids = [result["task"]["id"] for result in results]
+        assert ids == list(range(ids[0], ids[0] + 50))  # one contiguous block
+
+        response = client.get(f"/api/v1/tasks/users/{user_id}/tasks")
+        assert len(response.json()) == 50
+
+        response = client.post("/api/v1/tasks/users/99999/tasks:batch", json=items)
+        assert response.status_code == 404
+    
+    def test_update_tasks_batch(self):
+        """Test partial updates with per-item results"""
+        user_response = client.post("/api/v1/users/", json={"username": "batchupdater"})
+        user_id = user_response.json()["id"]
+        other_response = client.post("/api/v1/users/", json={"username": "otheruser"})
+        other_id = other_response.json()["id"]
+
+        task_id = client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": "Mine", "description": "Keep"}).json()["id"]
+        other_task_id = client.post(f"/api/v1/tasks/users/{other_id}/tasks", json={"title": "Theirs"}).json()["id"]
+
+        items = [
+            {"id": task_id, "status": "completed"},
+            {"id": other_task_id, "title": "Hijacked"},
+            {"id": 99999, "title": "Missing"},
+        ]
+        response = client.patch(f"/api/v1/tasks/users/{user_id}/tasks:batch", json=items)
+        assert response.status_code == 200
+        results = response.json()
+        assert [result["status_code"] for result in results] == [200, 404, 404]
+        updated = results[0]["task"]
+        assert updated["status"] == "completed"
+        assert updated["completed_at"] is not None
+        assert updated["title"] == "Mine"
+        assert updated["description"] == "Keep"
+
+        response = client.get(f"/api/v1/tasks/users/{other_id}/tasks/{other_task_id}")
+        assert response.json()["title"] == "Theirs"
+    
     def test_get_achievements(self):
         """Test getting all achievements"""
         response = client.get("/api/v1/achievements/")
@@ -223,6 +327,24 @@ class TestRoutes:
         data = response.json()
         assert isinstance(data, list)
     
+    def test_get_achievements_filtered_by_user(self):
+        """Test that the user_id filter only returns that user's achievements"""
+        for achievement_id, user_id in [(1, 1), (2, 2), (3, 1)]:
+            achievements[achievement_id] = Achievement(
+                id=achievement_id,
+                title=f"Achievement {achievement_id}",
+                description="Test",
+                achievement_type=AchievementType.CUSTOM,
+                user_id=user_id
+            )
+
+        response = client.get("/api/v1/achievements/?user_id=1")
+        assert response.status_code == 200
+        assert [a["id"] for a in response.json()] == [1, 3]
+
+        response = client.get("/api/v1/achievements/")
+        assert len(response.json()) == 3
+    
     def test_get_achievement_by_id(self):
         """Test getting a specific achievement by ID"""
         # Try to get non-existent achievement
@@ -348,6 +470,25 @@ class TestRoutes:
         assert "deaths_today" in data
         assert data["deaths_today"] == 0  # Fish should still be alive
     
+    def test_daily_feed_check_decays_once_a_day(self):
+        """Test that calling daily feed check again the same day does not decay fishes twice"""
+        from datetime import datetime, timedelta
+        from app.routes import fish as fish_routes
+        from app.services.decay_service import DailyDecayJob
+        user_id = client.post("/api/v1/users/", json={"username": "oncedaily"}).json()["id"]
+        fish = Fish(id=1, name="Hungry", category="Test", user_id=user_id, feed_meter=5,
+                    last_fed=datetime.now() - timedelta(days=2))
+        repository.add_fish(fish)
+        job = fish_routes.decay_job
+        fish_routes.decay_job = DailyDecayJob(repository)
+        try:
+            for _ in range(2):
+                response = client.post(f"/api/v1/users/{user_id}/daily_feed_check")
+                assert response.json() == {"deaths_today": 0}
+                assert repository.get_fish(1).feed_meter == 3
+        finally:
+            fish_routes.decay_job = job
+
     def test_invalid_user_operations(self):
         """Test operations with invalid user IDs"""
         # Try to create task for non-existent user
@@ -406,6 +547,248 @@ class TestRoutes:
         assert response.status_code == 404
         assert "Fish not found" in response.json()["detail"]
 
+    def test_streak_visit(self):
+        """Test recording and reading streak visits for a route-created user"""
+        user_data = {"username": "streakuser"}
+        user_response = client.post("/api/v1/users/", json=user_data)
+        user_id = user_response.json()["id"]
+
+        response = client.post(f"/api/v1/users/{user_id}/streak/visit")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["totalVisits"] == 1
+        assert data["currentDailyStreak"] == 1
+        assert data["bestStreak"] == 1
+
+        client.post(f"/api/v1/users/{user_id}/streak/visit")
+        response = client.get(f"/api/v1/users/{user_id}/streak/streak")
+        assert response.status_code == 200
+        assert response.json()["totalVisits"] == 2
+
+        response = client.get(f"/api/v1/users/{user_id}/stats/last-visit")
+        assert response.status_code == 200
+        assert response.json()["lastVisitDate"] == data["lastVisitDate"]
+
+        response = client.post("/api/v1/users/99999/streak/visit")
+        assert response.status_code == 404
+
+    def test_dashboard(self):
+        """Test that the dashboard counts follow task, fish and streak changes"""
+        user_id = client.post("/api/v1/users/", json={"username": "dashboarduser"}).json()["id"]
+        for title in ("One", "Two", "Three"):
+            client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": title})
+        task_id = client.get(f"/api/v1/tasks/users/{user_id}/tasks").json()[0]["id"]
+        client.put(f"/api/v1/tasks/users/{user_id}/tasks/{task_id}",
+                   json={"id": task_id, "title": "One", "status": "completed", "user_id": user_id})
+        fish_id = client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Nemo", "category": "Work"}).json()["id"]
+        client.post(f"/api/v1/users/{user_id}/fish/{fish_id}/complete_task?num_tasks=15")
+        client.post(f"/api/v1/users/{user_id}/streak/visit")
+
+        response = client.get(f"/api/v1/users/{user_id}/dashboard")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["user"] == {"id": user_id, "username": "dashboarduser", "profilePic": None}
+        assert data["tasks"] == {"pending": 2, "completed": 1, "cancelled": 0}
+        assert data["fishes"] == {"total": 1, "living": 1, "totalXp": 15}
+        assert data["achievements"] == {"total": 0, "completed": 0}
+        assert data["streak"]["currentDailyStreak"] == 1
+        assert round(data["streak"]["ringPercent"], 2) == 3.33
+
+        response = client.get("/api/v1/users/99999/dashboard")
+        assert response.status_code == 404
+
+    def test_fast_responses_match_response_model(self):
+        """Test that directly serialized models match FastAPI's own serialization"""
+        user_id = client.post("/api/v1/users/", json={"username": "fastpath"}).json()["id"]
+        client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": "Ünïcode task"})
+        client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Fast", "category": "Work"})
+
+        user = repository.get_user(user_id)
+        response = client.get(f"/api/v1/users/{user_id}")
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == jsonable_encoder(User.model_validate(user.model_dump()))
+
+        page = client.get(f"/api/v1/tasks/users/{user_id}/tasks").json()
+        assert page == jsonable_encoder(list(user.tasks.values()))
+
+    def test_fast_responses_follow_changes(self):
+        """Test that cached encodings are not served after a model changes"""
+        user_id = client.post("/api/v1/users/", json={"username": "cached"}).json()["id"]
+        client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Fed", "category": "Work"})
+        before = client.get(f"/api/v1/users/{user_id}/fishes").json()[0]["feed_meter"]
+
+        client.post(f"/api/v1/users/{user_id}/feed_all")
+        assert client.get(f"/api/v1/users/{user_id}/fishes").json()[0]["feed_meter"] == before + 1
+        # The user's nested fish changed in place, so the user is re-encoded too
+        (fish,) = client.get(f"/api/v1/users/{user_id}").json()["fishes"].values()
+        assert fish["feed_meter"] == before + 1
+
+    def test_conditional_get_user(self):
+        """Test that an unchanged user is answered with 304 and a changed one is not"""
+        user_id = client.post("/api/v1/users/", json={"username": "etaguser"}).json()["id"]
+        first = client.get(f"/api/v1/users/{user_id}")
+        etag = first.headers["etag"]
+
+        response = client.get(f"/api/v1/users/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        # A new child changes the user's ETag even though the user itself was not saved
+        client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": "New"})
+        response = client.get(f"/api/v1/users/{user_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+        client.post(f"/api/v1/users/{user_id}/streak/visit")
+        etag = response.headers["etag"]
+        assert client.get(f"/api/v1/users/{user_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_conditional_get_pages(self):
+        """Test that list pages honor If-None-Match and change when an item does"""
+        user_id = client.post("/api/v1/users/", json={"username": "etagpages"}).json()["id"]
+        client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Tagged", "category": "Work"})
+        url = f"/api/v1/users/{user_id}/fishes"
+        etag = client.get(url).headers["etag"]
+
+        assert client.get(url, headers={"If-None-Match": f'W/{etag}, "other"'}).status_code == 304
+        assert client.get(url + "?fields=id", headers={"If-None-Match": etag}).status_code == 200
+
+        client.post(f"/api/v1/users/{user_id}/feed_all")
+        response = client.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()[0]["version"] == 2
+
+    def test_task_update_cannot_rewind_version(self):
+        """Test that a client-supplied version is ignored on update"""
+        user_id = client.post("/api/v1/users/", json={"username": "rewinder"}).json()["id"]
+        task = client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": "Task"}).json()
+        task["version"] = 0
+        updated = client.put(f"/api/v1/tasks/users/{user_id}/tasks/{task['id']}", json=task).json()
+        assert updated["version"] == 2
+
+    def test_encoded_cache_reuses_stored_versions(self):
+        """Test that a stored version reuses its bytes, even from a fresh copy, and a save does not"""
+        cache = EncodedCache()
+        fish = Fish(id=1, name="Cached", category="Work", user_id=1, version=1)
+        user = User(id=1, username="owner", fishes={1: fish}, version=1)
+
+        first = cache.encode(user)
+        assert cache.encode(user.model_copy(deep=True)) is first
+        assert cache.hits == 1
+
+        # Saving a child bumps its version, which the user's key includes
+        fish.feed_meter, fish.version = 9, 2
+        assert b'"feed_meter":9' in cache.encode(user)
+        assert cache.misses == 2
+
+        # Models never stored have no version to key on
+        unsaved = Fish(id=2, name="New", category="Work", user_id=1)
+        assert cache.encode(unsaved) == unsaved.model_dump_json().encode()
+        assert len(cache) == 2
+
+    def test_model_response_projection(self):
+        """Test that include trims each model without touching the cache"""
+        fish = Fish(id=1, name="Slim", category="Work", user_id=1)
+        response = ModelJSONResponse([fish], include={"id", "name"})
+        assert response.body == b'[{"id":1,"name":"Slim"}]'
+
+    def test_model_response_without_cache(self):
+        """Test that the uncached path, used by blocking backends, renders the same bytes"""
+        fishes_list = [Fish(id=i, name="Plain", category="Work", user_id=1) for i in range(3)]
+        cached = ModelJSONResponse(fishes_list).body
+        encoded_cache.enabled = False
+        try:
+            assert ModelJSONResponse(fishes_list).body == cached
+            assert ModelJSONResponse(fishes_list[0]).body == fishes_list[0].model_dump_json().encode()
+        finally:
+            encoded_cache.enabled = True
+
+    def test_task_completed_published_after_save(self):
+        """Test that task.completed is only published once the task is saved"""
+        from app.db.async_repository import async_repository
+        user_id = client.post("/api/v1/users/", json={"username": "completer"}).json()["id"]
+        task = client.post(f"/api/v1/tasks/users/{user_id}/tasks", json={"title": "Finish"}).json()
+        published = []
+        publish = event_bus.publish
+
+        def failing_save(task):
+            raise RuntimeError("disk full")
+
+        event_bus.publish = lambda *event: published.append(event)
+        async_repository.repository.save_task = failing_save
+        try:
+            try:
+                client.put(f"/api/v1/tasks/users/{user_id}/tasks/{task['id']}", json={**task, "status": "completed"})
+            except RuntimeError:
+                pass
+            assert published == []
+            del async_repository.repository.save_task
+            response = client.put(f"/api/v1/tasks/users/{user_id}/tasks/{task['id']}", json={**task, "status": "completed"})
+            assert response.status_code == 200
+            assert [event[1] for event in published] == ["task.completed"]
+        finally:
+            event_bus.publish = publish
+            async_repository.repository.__dict__.pop("save_task", None)
+
+    def test_fish_events_published_after_save(self):
+        """Test that fish.fed and fish.level_up are only published once the fish is saved"""
+        from app.db.async_repository import async_repository
+        user_id = client.post("/api/v1/users/", json={"username": "fishsaver"}).json()["id"]
+        fish_id = client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Bubbles", "category": "Work"}).json()["id"]
+        level_up = f"/api/v1/users/{user_id}/fish/{fish_id}/complete_task?num_tasks=50"
+        published = []
+        publish = event_bus.publish
+
+        def failing_save(*args):
+            raise RuntimeError("disk full")
+
+        event_bus.publish = lambda *event: published.append(event)
+        async_repository.repository.save_fish = failing_save
+        async_repository.repository.save_fishes = failing_save
+        try:
+            for url in (level_up, f"/api/v1/users/{user_id}/feed_all"):
+                try:
+                    client.post(url)
+                except RuntimeError:
+                    pass
+            assert published == []
+            del async_repository.repository.save_fish
+            del async_repository.repository.save_fishes
+            assert client.post(level_up).json()["level"] > 1
+            assert client.post(f"/api/v1/users/{user_id}/feed_all").status_code == 200
+            assert [event[1] for event in published] == ["fish.level_up", "fish.fed"]
+        finally:
+            event_bus.publish = publish
+            async_repository.repository.__dict__.pop("save_fish", None)
+            async_repository.repository.__dict__.pop("save_fishes", None)
+
+    def test_events_unknown_user(self):
+        """Test that an event stream for a missing user is a 404"""
+        response = client.get("/api/v1/users/99999/events")
+        assert response.status_code == 404
+
+    def test_feed_all_publishes_events(self):
+        """Test that feeding fishes pushes fish.fed events to the user's stream"""
+        user_id = client.post("/api/v1/users/", json={"username": "eventuser"}).json()["id"]
+        fish_id = client.post(f"/api/v1/users/{user_id}/fish", json={"name": "Bubbles", "category": "Work"}).json()["id"]
+
+        async def scenario():
+            subscription = event_bus.subscribe(user_id)
+            stream = event_stream(subscription, keepalive=0.01)
+            assert await anext(stream) == b"retry: 3000\n\n"
+            # The request runs on the test client's own loop, so the event crosses threads
+            await asyncio.to_thread(client.post, f"/api/v1/users/{user_id}/feed_all")
+            message = await anext(stream)
+            lines = dict(line.split(": ", 1) for line in message.decode().strip().split("\n"))
+            assert lines["event"] == "fish.fed"
+            assert json.loads(lines["data"])["fish_id"] == fish_id
+            assert await anext(stream) == b": keepalive\n\n"
+            await stream.aclose()
+            assert event_bus.subscriber_count() == 0
+
+        asyncio.run(scenario())
+
 
 if __name__ == "__main__":
     # Run tests
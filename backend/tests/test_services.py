@@ -9,6 +9,11 @@ from datetime import datetime, timedelta
 from app.models import Fish
 from app.services.fish_service import FishService
 from app.services.id_service import IDService
+from app.services.xp_curve import XPCurve, LinearCurve, TriangularCurve
+from app.services.decay_service import DailyDecayJob, decay_fishes, default_state_file, DEFAULT_STATE_FILE
+from app.db.repository import MemoryRepository
+from app.db.storage import users, fishes
+from app.models import User
 
 
 class TestFishService:
@@ -295,10 +300,264 @@ class TestIDService:
         assert fish_id == 1
         assert achievement_id == 1
 
+    def test_ids_unique_across_threads(self):
+        """Test that concurrent generation never hands out an ID twice"""
+        import threading
+        service = IDService(block_size=10)
+        results = []
+
+        def worker():
+            results.extend(service.generate_task_id() for _ in range(500))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 4000
+        assert len(set(results)) == 4000
+
+    def test_state_file_shared_and_persistent(self, tmp_path):
+        """Test that services sharing a state file draw disjoint blocks and survive restarts"""
+        state_file = str(tmp_path / "ids.json")
+        worker1 = IDService(state_file, block_size=5)
+        worker2 = IDService(state_file, block_size=5)
+
+        ids1 = [worker1.generate_user_id() for _ in range(7)]
+        ids2 = [worker2.generate_user_id() for _ in range(7)]
+        assert not set(ids1) & set(ids2)
+
+        restarted = IDService(state_file, block_size=5)
+        assert restarted.generate_user_id() > max(ids1 + ids2)
+
+    def test_reserve_and_ensure_above(self):
+        """Test batch reservation and seeding from existing IDs"""
+        service = IDService(block_size=10)
+        first = service.generate_task_id()
+        batch = service.reserve("task", 3)
+        assert len(batch) == 3
+        assert first not in batch
+
+        service.ensure_above("task", 500)
+        assert service.generate_task_id() == 501
+        service.ensure_above("task", 20)
+        assert service.generate_task_id() == 502
+
+
+def loop_level_up(level, xp, cost):
+    """The original one-level-per-iteration level up"""
+    while xp >= cost(level):
+        xp -= cost(level)
+        level += 1
+    return level, xp
+
+
+class TestXPCurve:
+    """Test closed-form level up against the original loop"""
+
+    def test_triangular_matches_loop(self):
+        """Test that the default curve gives the same level and XP as the loop"""
+        curve = TriangularCurve(10)
+        for level in range(1, 40):
+            for xp in list(range(0, 600, 7)) + [-5, 10**6 + 3]:
+                assert curve.level_up(level, xp) == loop_level_up(level, xp, lambda n: n * 10)
+
+    def test_fish_service_matches_loop(self):
+        """Test FishService.check_level_up with a huge XP gain"""
+        fish = Fish(id=1, name="Big", category="Test", user_id=1, level=3, xp=0)
+        FishService.add_xp(fish, 123_456_789)
+        assert (fish.level, fish.xp) == loop_level_up(3, 123_456_789, lambda n: n * 10)
+
+    def test_other_curves(self):
+        """Test the linear curve and the generic search used by custom curves"""
+        class SquareCurve(XPCurve):
+            def cost(self, level):
+                return level * level
+
+        for curve, cost in [(LinearCurve(7), lambda n: 7), (SquareCurve(), lambda n: n * n)]:
+            for level in range(1, 15):
+                for xp in range(0, 2000, 37):
+                    assert curve.level_up(level, xp) == loop_level_up(level, xp, cost)
+
+
+class TestDecayService:
+    """Test the batch daily fish decay"""
+
+    def setup_method(self):
+        """Clear storage before each test"""
+        users.clear()
+        fishes.clear()
+
+    def make_fishes(self):
+        now = datetime.now()
+        states = [
+            (5, now, True), (5, now - timedelta(days=1), True), (1, now - timedelta(days=3), True),
+            (2, now - timedelta(days=1), True), (0, None, True), (4, None, True), (0, None, False),
+            (3, now - timedelta(days=2), False),
+        ]
+        return [
+            Fish(id=i, name=f"Fish {i}", category="Test", user_id=i % 3 + 1,
+                 feed_meter=feed_meter, last_fed=last_fed, alive=alive)
+            for i, (feed_meter, last_fed, alive) in enumerate(states, start=1)
+        ]
+
+    def test_matches_per_fish_check(self):
+        """Test that the batch pass gives the same result as daily_feed_check, with meters stopping at 0"""
+        expected = self.make_fishes()
+        for fish in expected:
+            FishService.daily_feed_check(fish)
+
+        batch = self.make_fishes()
+        changed, died = decay_fishes(batch)
+        assert [(fish.feed_meter, fish.alive) for fish in batch] == [
+            (max(0, fish.feed_meter), fish.alive) for fish in expected
+        ]
+        assert [fish.id for fish in changed] == [2, 3, 4, 5]
+        assert [fish.id for fish in died] == [3, 4, 5]
+
+    def test_feed_meter_stops_at_zero(self):
+        """Test that a hungry fish with a meter of 1 dies at 0 rather than going negative"""
+        batch = self.make_fishes()
+        assert batch[2].feed_meter == 1
+        _, died = decay_fishes(batch)
+        assert (died[0].id, died[0].feed_meter) == (3, 0)
+
+    def test_job_runs_once_per_day(self):
+        """Test that the job reports deaths per user and skips a day already processed"""
+        repo = MemoryRepository()
+        for user_id in (1, 2, 3):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+        for fish in self.make_fishes():
+            repo.add_fish(fish)
+
+        job = DailyDecayJob(repo, chunk_size=3)
+        today = datetime.now().date()
+        result = job.run(today)
+        assert result["fishes_checked"] == 8
+        assert result["deaths_by_user"] == {1: 1, 2: 1, 3: 1}
+        assert repo.get_fish(2).feed_meter == 3
+        assert repo.get_user(3).fishes[5].alive is False
+
+        assert job.run(today) is None
+        assert repo.get_fish(2).feed_meter == 3
+        assert job.run(today + timedelta(days=1)) is not None
+
+    def test_concurrent_feed_is_kept(self):
+        """Test that a fish fed while the pass runs keeps its feeding"""
+        class FeedDuringScan(MemoryRepository):
+            def scan_fishes(self, after_id=None, limit=None):
+                chunk = super().scan_fishes(after_id, limit)
+                if chunk and chunk[0].id == 1:
+                    fed = self.get_fish(2)
+                    FishService.feed(fed)
+                    self.save_fish(fed)
+                return chunk
+
+        repo = FeedDuringScan()
+        for user_id in (1, 2, 3):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+        for fish in self.make_fishes():
+            repo.add_fish(fish)
+
+        DailyDecayJob(repo).run(datetime.now().date())
+        assert repo.get_fish(2).feed_meter == 6
+        assert repo.get_fish(4).feed_meter == 0
+
+    def test_memory_pass_yields_to_the_loop(self):
+        """Test that the in-memory pass lets other tasks run between chunks, and is not run twice at once"""
+        import asyncio
+        repo = MemoryRepository()
+        for user_id in (1, 2, 3):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+        for fish in self.make_fishes():
+            repo.add_fish(fish)
+        job = DailyDecayJob(repo, chunk_size=3)
+        today = datetime.now().date()
+
+        async def scenario():
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(len(ticks))
+                    await asyncio.sleep(0)
+
+            other = asyncio.create_task(ticker())
+            await asyncio.sleep(0)
+            running = asyncio.create_task(job.run_async(today))
+            await asyncio.sleep(0)
+            assert job.run(today) is None  # the first pass is still going
+            result = await running
+            other.cancel()
+            return result, ticks
+
+        result, ticks = asyncio.run(scenario())
+        assert result["fishes_checked"] == 8
+        assert len(ticks) >= 3
+        assert job.run(today) is None and job.last_run == today
+
+    def test_state_file_follows_persistent_data(self, tmp_path, monkeypatch):
+        """Test that the durable memory backend keeps its decay state beside its data"""
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "decay_state_file", None)
+        monkeypatch.setattr(settings, "database_type", "memory")
+        monkeypatch.setattr(settings, "memory_data_dir", None)
+        assert default_state_file() is None
+        monkeypatch.setattr(settings, "memory_data_dir", str(tmp_path))
+        assert default_state_file() == str(tmp_path / "decay.json")
+        monkeypatch.setattr(settings, "database_type", "sqlite")
+        assert default_state_file() == DEFAULT_STATE_FILE
+
+    def test_unfinished_pass_resumes(self, tmp_path):
+        """Test that a pass cut short leaves the day unclaimed and resumes after the last chunk done"""
+        class FailOnce(MemoryRepository):
+            calls = 0
+
+            def scan_fishes(self, after_id=None, limit=None):
+                FailOnce.calls += 1
+                if FailOnce.calls == 2:
+                    raise OSError("disk went away")
+                return super().scan_fishes(after_id, limit)
+
+        repo = FailOnce()
+        for user_id in (1, 2, 3):
+            repo.add_user(User(id=user_id, username=f"user{user_id}"))
+        for fish in self.make_fishes():
+            repo.add_fish(fish)
+
+        state_file = str(tmp_path / "decay.json")
+        today = datetime.now().date()
+        job = DailyDecayJob(repo, state_file, chunk_size=3)
+        try:
+            job.run(today)
+        except OSError:
+            pass
+        assert job.last_run is None
+        assert repo.get_fish(2).feed_meter == 3
+        assert repo.get_fish(4).feed_meter == 2
+
+        result = DailyDecayJob(repo, state_file, chunk_size=3).run(today)
+        assert result["fishes_checked"] == 5
+        assert repo.get_fish(2).feed_meter == 3
+        assert repo.get_fish(4).feed_meter == 0
+        assert DailyDecayJob(repo, state_file).run(today) is None
+
+    def test_state_file_shared_between_jobs(self, tmp_path):
+        """Test that jobs sharing a state file process each day once between them"""
+        state_file = str(tmp_path / "decay.json")
+        today = datetime.now().date()
+        worker1 = DailyDecayJob(MemoryRepository(), state_file)
+        worker2 = DailyDecayJob(MemoryRepository(), state_file)
+
+        assert worker1.run(today) is not None
+        assert worker2.run(today) is None
+        assert DailyDecayJob(MemoryRepository(), state_file).run(today) is None
+
 
 if __name__ == "__main__":
     # Run tests
-    test_classes = [TestFishService, TestIDService]
+    test_classes = [TestFishService, TestIDService, TestXPCurve, TestDecayService]
     
     for test_class in test_classes:
         print(f"\nTesting {test_class.__name__}...")
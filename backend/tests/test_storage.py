@@ -5,6 +5,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from datetime import datetime, timezone
 from app.db.storage import users, achievements, tasks, fishes
 from app.models import User, Task, Achievement, Fish, TaskStatus, AchievementType
 from app.services.id_service import id_service
@@ -255,6 +256,161 @@ class TestStorage:
         assert fish.id not in achievements
         assert user.id not in tasks
 
+    def test_username_index(self):
+        """Test that the username index follows inserts, replaces and deletes"""
+        user = User(id=1, username="indexed")
+        users[user.id] = user
+        assert users.get_by("username", "indexed") is user
+        assert users.get_by("username", "missing") is None
+
+        # Replacing the row under the same ID re-indexes it
+        renamed = User(id=1, username="renamed")
+        users[renamed.id] = renamed
+        assert users.get_by("username", "indexed") is None
+        assert users.get_by("username", "renamed") is renamed
+
+        users.pop(1)
+        assert users.get_by("username", "renamed") is None
+
+        users[2] = User(id=2, username="cleared")
+        users.clear()
+        assert users.get_by("username", "cleared") is None
+
+    def test_achievement_user_index(self):
+        """Test that the per-user achievement index follows inserts, updates and deletes"""
+        def make(achievement_id, user_id):
+            return Achievement(
+                id=achievement_id,
+                title=f"Achievement {achievement_id}",
+                description="Test",
+                achievement_type=AchievementType.CUSTOM,
+                user_id=user_id
+            )
+
+        achievements[1] = make(1, user_id=1)
+        achievements[2] = make(2, user_id=2)
+        achievements[3] = make(3, user_id=1)
+        assert [a.id for a in achievements.get_group("user_id", 1)] == [1, 3]
+
+        # Updating in place keeps the order; moving to another user re-indexes
+        achievements[1] = make(1, user_id=1)
+        assert [a.id for a in achievements.get_group("user_id", 1)] == [1, 3]
+        achievements[3] = make(3, user_id=2)
+        assert [a.id for a in achievements.get_group("user_id", 1)] == [1]
+        assert [a.id for a in achievements.get_group("user_id", 2)] == [2, 3]
+
+        del achievements[1]
+        assert achievements.get_group("user_id", 1) == []
+
+    def test_table_paging(self):
+        """Test that pages come back in ID order and skip deleted rows"""
+        for user_id in [3, 1, 2, 5, 4]:
+            users[user_id] = User(id=user_id, username=f"user{user_id}")
+        del users[2]
+
+        assert [user.id for user in users.page(limit=2)] == [1, 3]
+        assert [user.id for user in users.page(after_id=3, limit=2)] == [4, 5]
+        assert users.page(after_id=5) == []
+
+    def test_group_revisions(self):
+        """Test that writing or deleting a row changes the revision of its groups only"""
+        assert tasks.group_revision("user_id", 1) == 0
+        tasks[1] = Task(id=1, title="One", user_id=1)
+        tasks[2] = Task(id=2, title="Two", user_id=2)
+        first = tasks.group_revision("user_id", 1)
+        other = tasks.group_revision("user_id", 2)
+        assert first > 0
+
+        tasks[1] = tasks[1].model_copy(update={"title": "Renamed"})
+        assert tasks.group_revision("user_id", 1) > first
+        assert tasks.group_revision("user_id", 2) == other
+
+        # Moving a row changes both groups; deleting changes the group it left
+        first = tasks.group_revision("user_id", 1)
+        tasks[1] = tasks[1].model_copy(update={"user_id": 2})
+        assert tasks.group_revision("user_id", 1) > first
+        assert tasks.group_revision("user_id", 2) > other
+        other = tasks.group_revision("user_id", 2)
+        del tasks[2]
+        assert tasks.group_revision("user_id", 2) > other
+
+    def test_count_and_sum_indexes(self):
+        """Test the per-user counts of task statuses and sums over fish"""
+        tasks[1] = Task(id=1, title="One", user_id=1)
+        tasks[2] = Task(id=2, title="Two", user_id=1, status=TaskStatus.COMPLETED)
+        tasks[3] = Task(id=3, title="Three", user_id=2)
+        assert tasks.counts("status", 1) == {TaskStatus.PENDING: 1, TaskStatus.COMPLETED: 1}
+
+        # Changed in place, then stored again: counted under its new status only
+        tasks[1].status = TaskStatus.COMPLETED
+        tasks[1] = tasks[1]
+        assert tasks.counts("status", 1) == {TaskStatus.COMPLETED: 2}
+        del tasks[2]
+        tasks[3] = tasks[3].model_copy(update={"user_id": 1})
+        assert tasks.counts("status", 1) == {TaskStatus.COMPLETED: 1, TaskStatus.PENDING: 1}
+        assert tasks.counts("status", 2) == {}
+
+        fishes[1] = Fish(id=1, name="Alive", category="Work", user_id=1, level=2, xp=5)
+        fishes[2] = Fish(id=2, name="Dead", category="Work", user_id=1, alive=False, xp=2 ** 70)
+        assert fishes.count_for_user(1) == 2
+        assert fishes.sum_for_user("living", 1) == 1
+        assert fishes.sum_for_user("total_xp", 1) == 10 + 5 + 2 ** 70
+
+        fishes[2] = fishes[2].model_copy(update={"user_id": 2})
+        del fishes[1]
+        assert (fishes.count_for_user(1), fishes.sum_for_user("total_xp", 1)) == (0, 0)
+        assert fishes.sum_for_user("total_xp", 2) == 2 ** 70
+
+    def test_fish_store_round_trip(self):
+        """Test that fish come back out of the columns equal to what went in"""
+        fish = Fish(id=7, name="Nemo", category="Work", user_id=2, level=3, xp=250,
+                    feed_meter=4, alive=False, version=5, last_fed=datetime(2024, 5, 1, 12, 30, 15, 123456))
+        fishes[fish.id] = fish
+
+        stored = fishes[7]
+        assert stored == fish and stored is not fish
+        assert stored.model_dump() == fish.model_dump()
+        assert stored.model_fields_set == set(Fish.model_fields)
+
+        # Reads are copies: changing one does not reach the store until it is stored again
+        stored.level = 9
+        assert fishes[7].level == 3
+        fishes[7] = stored
+        assert fishes[7].level == 9
+
+    def test_fish_store_values_that_do_not_fit_columns(self):
+        """Test that aware datetimes and huge numbers are kept as they are"""
+        aware = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        fish = Fish(id=1, name="Big", category="Work", user_id=1, xp=2 ** 70, last_fed=aware,
+                    created_at=datetime(1900, 1, 1))
+        fishes[fish.id] = fish
+        assert fishes[1] == fish
+        assert fishes[1].last_fed.tzinfo is timezone.utc
+
+        fishes[1] = fish.model_copy(update={"xp": 10, "last_fed": None})
+        assert fishes[1].xp == 10 and fishes[1].last_fed is None
+
+    def test_fish_store_order_and_owners(self):
+        """Test paging in ID order and the per-user index across inserts, moves and deletes"""
+        for fish_id, user_id in [(5, 1), (2, 2), (9, 1), (1, 1), (7, 2)]:
+            fishes[fish_id] = Fish(id=fish_id, name=f"fish{fish_id}", category="Work", user_id=user_id)
+
+        assert list(fishes) == [1, 2, 5, 7, 9]
+        assert [fish.id for fish in fishes.page(after_id=2, limit=2)] == [5, 7]
+        assert list(fishes.for_user(1)) == [1, 5, 9]
+
+        fishes[5] = fishes[5].model_copy(update={"user_id": 2})
+        del fishes[2]
+        assert list(fishes.for_user(1)) == [1, 9]
+        assert list(fishes.for_user(2)) == [5, 7]
+        assert 2 not in fishes and len(fishes) == 4
+        assert fishes.get(2) is None
+
+        snapshot = fishes.copy()
+        del fishes[7]
+        assert list(snapshot) == [1, 5, 7, 9] and snapshot[7].name == "fish7"
+        assert fishes.for_user(3) == {} and not fishes.has_user(3)
+
 
 if __name__ == "__main__":
     # Run tests